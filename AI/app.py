@@ -1,48 +1,197 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, request, jsonify, render_template
 import os
-from src.CMS.face_recognition.capture import FaceImageCapture
-from src.CMS.face_recognition.train import FaceModelTrainer
-from src.CMS.face_recognition.recognize import FaceRecognizer
-from src.models.user_face import UserFace
-import base64
-import cv2
-import numpy as np
-from datetime import datetime
-import cloudinary
-import cloudinary.uploader
+from src.CMS.face_recognition import registry as face_models
+from src.CMS.face_recognition.utils.upload import read_image_payload, decode_base64_image, UploadStats
+from src.CMS.face_recognition.jobs import TrainingJobManager
+from src.CMS.face_recognition.streaming import RecognitionStream
+from src.CMS.utils.services import LazyServices
+from src.CMS.exception import UploadQueueFullException, ValidationException
 from dotenv import load_dotenv
 from bson import ObjectId
-import requests
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    # Streaming recognition is optional; clients fall back to /api/recognize
+    Sock = None
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
-
-# Initialize MongoDB connection
-user_face_db = UserFace(os.getenv('MONGODB_URI'))
-
-# Initialize face recognition classes
-face_capture = FaceImageCapture()
-face_trainer = FaceModelTrainer()
-face_recognizer = FaceRecognizer(tolerance=0.6)
+sock = Sock(app) if Sock is not None else None
+
+# cv2, dlib, face_recognition, scipy, cloudinary and pymongo are only imported
+# when the service that needs them is first built, so the app can serve
+# health checks immediately and warm the heavy parts up in the background
+services = LazyServices()
+
+# Matching index the trainer builds and the recognizer loads: 'flat', 'ivf'
+# (large galleries) or 'hnsw' (small galleries only, see HNSWIndex)
+FACE_INDEX_TYPE = os.getenv('FACE_INDEX_TYPE', 'flat')
+
+def create_user_face_db():
+    # Initialize MongoDB connection
+    from src.models.user_face import UserFace
+    db = UserFace(
+        os.getenv('MONGODB_URI'),
+        summary_ttl=float(os.getenv('FACE_SUMMARY_TTL', 300)),
+        user_cache_ttl=float(os.getenv('KNOWN_USER_TTL', 300))
+    )
+    db.ensure_indexes()
+    if os.getenv('MONGODB_CHANGE_STREAM') == '1':
+        # Keep the cached face counts correct across processes (replica sets only)
+        db.watch_face_changes()
+    db.get_face_summary()
+    return db
+
+def create_cloudinary_uploader():
+    from src.CMS.face_recognition.uploads import CloudinaryUploader, LocalUploader
+
+    if os.getenv('FACE_UPLOADER') == 'local':
+        # Keep captures on local disk instead of Cloudinary, e.g. for development
+        return LocalUploader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'uploads'))
+
+    import cloudinary
+    import cloudinary.uploader
+
+    # Configure Cloudinary
+    cloudinary.config(
+        cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+        api_key=os.getenv('CLOUDINARY_API_KEY'),
+        api_secret=os.getenv('CLOUDINARY_API_SECRET')
+    )
+    return CloudinaryUploader(cloudinary.uploader)
+
+def create_upload_manager():
+    from src.CMS.face_recognition.uploads import UploadManager
+    return UploadManager(services.get('cloudinary_uploader'), max_workers=int(os.getenv('UPLOAD_WORKERS', 4)))
+
+def create_face_capture():
+    from src.CMS.face_recognition.capture import FaceImageCapture
+    return FaceImageCapture()
+
+def create_face_trainer():
+    from src.CMS.face_recognition.train import FaceModelTrainer
+    trainer = FaceModelTrainer(worker_niceness=10, index_type=FACE_INDEX_TYPE)
+    trainer.ensure_loaded()
+    return trainer
+
+def create_face_recognizer():
+    from src.CMS.face_recognition.recognize import FaceRecognizer
+    recognizer = FaceRecognizer(tolerance=0.6, index_type=FACE_INDEX_TYPE)
+    recognizer.maybe_reload()
+    return recognizer
+
+def create_image_downloader():
+    from src.CMS.face_recognition.utils.downloader import ImageDownloader
+    return ImageDownloader(max_workers=8, timeout=10)
+
+services.register('user_face_db', create_user_face_db)
+services.register('cloudinary_uploader', create_cloudinary_uploader)
+services.register('upload_manager', create_upload_manager)
+services.register('face_capture', create_face_capture)
+services.register('face_trainer', create_face_trainer)
+services.register('face_recognizer', create_face_recognizer)
+services.register('image_downloader', create_image_downloader)
+
+user_face_db = services.lazy('user_face_db')
+cloudinary_uploader = services.lazy('cloudinary_uploader')
+upload_manager = services.lazy('upload_manager')
+face_capture = services.lazy('face_capture')
+face_trainer = services.lazy('face_trainer')
+face_recognizer = services.lazy('face_recognizer')
+image_downloader = services.lazy('image_downloader')
+upload_stats = UploadStats()
+
+# Saved model (FaceRecognizer.model_path), checked without building the recognizer
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'face_data', 'models', 'face_encodings.bin')
+
+# Namespace for training sources that come from Cloudinary via MongoDB
+IMAGE_SOURCE_PREFIX = 'cloudinary:'
+
+# Sources of models trained before images were keyed by public_id, when
+# /api/train downloaded every image into this directory first
+LEGACY_SOURCE_PREFIX = 'temp_training'
+
+# Encoding processes for background training; one core stays free for recognition
+TRAINING_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Users fetched per MongoDB round trip while training scans face images
+TRAINING_SCAN_BATCH = int(os.getenv('TRAINING_SCAN_BATCH', '200'))
+
+# Upper bound on images in one /api/recognize/batch or /api/capture/batch request
+MAX_BATCH_IMAGES = 64
+
+# Captures are checked by decoding at this size at most; the original bytes are uploaded
+CAPTURE_VALIDATION_PIXEL_BUDGET = 320 * 240
+
+# Group photos keep more resolution than webcam frames so small faces are still found
+BATCH_PIXEL_BUDGET = 1920 * 1080
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def is_decodable_image(image_data):
+    """Whether image_data decodes as an image; a reduced decode is enough to tell."""
+    from src.CMS.face_recognition.utils.decoding import decode_image
+    return decode_image(image_data, CAPTURE_VALIDATION_PIXEL_BUDGET) is not None
+
+def record_uploaded_face_images(user_id):
+    """Upload completion callback: store the images on the user, or undo the uploads."""
+    def on_complete(task, results):
+        if len(results) == 1:
+            # One conditional update; None means the user no longer exists
+            missing = user_face_db.add_face_image(
+                user_id,
+                results[0]['secure_url'],
+                results[0]['public_id']
+            ) is None
+        else:
+            missing = bool(user_face_db.add_face_images([
+                (user_id, upload_result['secure_url'], upload_result['public_id'])
+                for upload_result in results
+            ])['missingUsers'])
+        if missing:
+            # The user was deleted while the images were uploading
+            for upload_result in results:
+                cloudinary_uploader.destroy(upload_result['public_id'])
+            raise ValueError('User not found')
+    return on_complete
+
+def queue_face_images(user_id, encoded_images):
+    """
+    Validate captured images and queue the decodable ones for background upload.
+
+    Returns:
+        tuple: (UploadTask or None if nothing was decodable, indices of undecodable images)
+    """
+    images, undecoded = [], []
+    for index, image_data in enumerate(encoded_images):
+        if is_decodable_image(image_data):
+            images.append(image_data)
+        else:
+            undecoded.append(index)
+    if not images:
+        return None, undecoded
+
+    task = upload_manager.submit(
+        images,
+        folder=f"face_recognition/{str(user_id)}",
+        on_complete=record_uploaded_face_images(user_id)
+    )
+    return task, undecoded
+
 @app.route('/api/capture', methods=['POST'])
 def capture_face():
     try:
-        data = request.json
-        if not data or 'image' not in data or 'userId' not in data:
+        # Raw image/jpeg, multipart or base64 JSON
+        data = read_image_payload(request, upload_stats)
+        if data is None or 'userId' not in data:
             return jsonify({'error': 'Missing image data or userId'}), 400
 
         try:
@@ -50,48 +199,94 @@ def capture_face():
         except:
             return jsonify({'error': 'Invalid user ID format'}), 400
 
-        # Verify user exists
+        # Answered from the known-user cache when possible, so an upload is
+        # not wasted on a bad id without a database round trip per capture
         if not user_face_db.verify_user_exists(user_id):
             return jsonify({'error': 'User not found'}), 404
 
-        # Decode base64 image
-        image_data = base64.b64decode(data['image'].split(',')[1])
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # The Cloudinary upload and the MongoDB write happen in the background
+        task, _ = queue_face_images(user_id, [data.data])
+        if task is None:
+            return jsonify({'error': 'Could not decode image'}), 400
+
+        return jsonify({
+            'success': True,
+            'message': 'Face image accepted and is being stored',
+            'uploadId': task.id,
+            'upload': task.to_dict()
+        }), 202
+
+    except ValidationException as e:
+        return jsonify({'error': e.message}), 400
+    except UploadQueueFullException as e:
+        return jsonify({'error': e.message}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Create a temporary file to upload to Cloudinary
-        temp_path = f'temp_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg'
-        cv2.imwrite(temp_path, image)
+@app.route('/api/capture/batch', methods=['POST'])
+def capture_faces_batch():
+    try:
+        # Multipart 'images' file parts with a userId field, or JSON
+        # {"userId": ..., "images": [base64, ...]}
+        if request.mimetype == 'multipart/form-data':
+            user_id = request.form.get('userId') or request.args.get('userId')
+            encoded_images = [upload.read() for upload in request.files.getlist('images')]
+        else:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                data = {}
+            user_id = data.get('userId')
+            items = data.get('images') or []
+            if not isinstance(items, list):
+                return jsonify({'error': 'images must be a list of base64 strings'}), 400
+            encoded_images = [decode_base64_image(item) for item in items]
+            invalid = [i for i, image in enumerate(encoded_images) if image is None]
+            if invalid:
+                return jsonify({
+                    'error': 'Images must be base64 strings or data URLs',
+                    'invalidImages': invalid
+                }), 400
+
+        if not user_id or not encoded_images:
+            return jsonify({'error': 'Missing images or userId'}), 400
+        if len(encoded_images) > MAX_BATCH_IMAGES:
+            return jsonify({'error': f'At most {MAX_BATCH_IMAGES} images per batch'}), 400
 
         try:
-            # Upload to Cloudinary with folder structure
-            upload_result = cloudinary.uploader.upload(
-                temp_path,
-                folder=f"face_recognition/{str(user_id)}",
-                public_id=f"face_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            )
-
-            # Update user's face data in existing User collection
-            user_face_db.add_face_image(
-                user_id,
-                upload_result['secure_url'],
-                upload_result['public_id']
-            )
+            user_id = ObjectId(user_id)
+        except:
+            return jsonify({'error': 'Invalid user ID format'}), 400
 
-            return jsonify({
-                'success': True,
-                'message': 'Face image captured and stored successfully',
-                'imageUrl': upload_result['secure_url']
-            })
+        if not user_face_db.verify_user_exists(user_id):
+            return jsonify({'error': 'User not found'}), 404
 
-        finally:
-            # Ensure temporary file is removed even if upload fails
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        # Uploaded in parallel; every image is then written with a single bulk_write
+        task, undecoded = queue_face_images(user_id, encoded_images)
+        if task is None:
+            return jsonify({'error': 'Could not decode any image', 'undecodedImages': undecoded}), 400
 
+        return jsonify({
+            'success': True,
+            'message': f'{task.total} face images accepted and are being stored',
+            'uploadId': task.id,
+            'upload': task.to_dict(),
+            'undecodedImages': undecoded
+        }), 202
+
+    except UploadQueueFullException as e:
+        return jsonify({'error': e.message}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/capture/uploads/<upload_id>', methods=['GET'])
+def get_capture_upload(upload_id):
+    # Upload tasks live in the worker that accepted the capture, so with
+    # several workers this can 404; the capture page then just reloads the images
+    task = upload_manager.get(upload_id)
+    if task is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'success': True, 'upload': task.to_dict()})
+
 @app.route('/api/users/<userId>/images', methods=['GET'])
 def get_user_images(userId):
     try:
@@ -114,102 +309,325 @@ def get_user_images(userId):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def run_training_job(job):
+    """Download new images, update the model and reload it; runs in a training worker thread."""
+    job.set_stage('scanning')
+
+    # Another worker may have saved the model since this one last trained
+    face_trainer.reload_if_changed()
+
+    # The legacy rows would otherwise duplicate every image re-keyed below
+    migrated = face_trainer.migrate_legacy_sources(LEGACY_SOURCE_PREFIX)
+
+    # Images are keyed by their Cloudinary public_id, so retraining only
+    # downloads and encodes images the model has not seen yet. Users are
+    # streamed from MongoDB and fed to the downloader and encoding pool
+    # through bounded windows, so work on the first users overlaps the rest
+    # of the scan; the full set of sources is only needed afterwards, to
+    # prune images deleted since the last run.
+    wanted = set()
+    counts = {'users': 0, 'images': 0, 'new': 0}
+
+    def new_sources():
+        for user in user_face_db.iter_face_images(batch_size=TRAINING_SCAN_BATCH):
+            job.check_cancelled()
+            images = user['faceData']['faceImages']
+            counts['users'] += 1
+            counts['images'] += len(images)
+            for image in images:
+                key = image.get('cloudinary_public_id') or image['url']
+                source = f'{IMAGE_SOURCE_PREFIX}{key}'
+                wanted.add(source)
+                if not face_trainer.has_source(source):
+                    counts['new'] += 1
+                    yield (str(user['_id']), source), image['url']
+        # The scan is done, so the estimate below can be replaced by the real count
+        job.total = counts['new']
+
+    # Downloads run concurrently over a pooled session and feed encoding
+    # directly from memory, so no temp_training/ round-trip is needed
+    def images():
+        for (user_id, source), content in image_downloader.download_many(new_sources()):
+            job.check_cancelled()
+            yield user_id, source, content
+
+    # The number of new images is only known once the scan finishes; until
+    # then estimate it from the cached counts. Deleted images make this an
+    # underestimate, so it is not passed to the trainer, which sizes its pool by it
+    summary = user_face_db.get_face_summary()
+    job.set_stage('encoding', total=max(0, summary['totalImages'] - face_trainer.source_count(IMAGE_SOURCE_PREFIX)))
+    trained = face_trainer.train_from_images(
+        images(),
+        workers=TRAINING_WORKERS,
+        progress_callback=job.update_progress
+    )
+
+    # The generator has been drained, so wanted now holds every source
+    removed = face_trainer.prune_sources(wanted, prefix=IMAGE_SOURCE_PREFIX) + migrated
+    if removed:
+        face_trainer.save_model()
+
+    # Load the model after training
+    job.set_stage('loading')
+    if trained or removed or not face_recognizer.is_model_loaded():
+        face_recognizer.load_model()
+
+    # The scan saw every user, so refresh the cached counts served by /api/model/status
+    user_face_db.set_face_summary(counts['users'], counts['images'])
+
+    return {
+        'newImages': counts['new'],
+        'removedImages': removed,
+        'modelVersion': face_recognizer.snapshot.version
+    }
+
+# Every worker process has its own job queue; the lock file makes their runs
+# take turns, so only one process encodes and saves the model at a time
+TRAINING_LOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'data', 'face_data', 'models', 'training.lock')
+training_jobs = TrainingJobManager(run_training_job, lock_path=TRAINING_LOCK_PATH)
+
 @app.route('/api/train', methods=['POST'])
 def train_model():
     try:
-        # Get all users and their face images from MongoDB
-        users = user_face_db.get_all_users()
-        
-        # Create temporary directory for training
-        temp_dir = 'temp_training'
-        os.makedirs(temp_dir, exist_ok=True)
-
-        try:
-            # Download images for training
-            for user in users:
-                user_dir = os.path.join(temp_dir, str(user['_id']))
-                os.makedirs(user_dir, exist_ok=True)
-                
-                for image in user['faceData']['faceImages']:
-                    # Download image from Cloudinary URL
-                    response = requests.get(image['url'])
-                    if response.status_code == 200:
-                        image_path = os.path.join(
-                            user_dir, 
-                            f"face_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                        )
-                        with open(image_path, 'wb') as f:
-                            f.write(response.content)
-
-            # Train model
-            face_trainer.train_model(temp_dir)
-            face_trainer.save_model()
-            
-            # Load the model after training
-            face_recognizer.load_model()
-
-            return jsonify({
-                'success': True,
-                'message': 'Model trained and loaded successfully'
-            })
-
-        finally:
-            # Clean up temporary directory
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
+        # Training runs in the background; concurrent requests share a queued job
+        job, created = training_jobs.submit()
+        return jsonify({
+            'success': True,
+            'message': 'Training job queued' if created else 'Training job already queued',
+            'jobId': job.id,
+            'job': job.to_dict()
+        }), 202
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/train/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Training job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/train/<job_id>', methods=['DELETE'])
+def cancel_training_job(job_id):
+    job = training_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Training job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
 @app.route('/api/model/status', methods=['GET'])
 def get_model_status():
     try:
-        # Get count of users from MongoDB
-        users = user_face_db.get_all_users()
-        total_users = len(users)
-        total_images = sum(len(user['faceData']['faceImages']) for user in users)
+        # Never block on warm-up: until the recognizer exists the model is reported as not loaded
+        recognizer = services.peek('face_recognizer')
+        if recognizer is not None:
+            recognizer.maybe_reload()
+        job = training_jobs.active() or training_jobs.latest()
+
+        # Counts come from the cached face summary, not a scan of every user
+        summary = user_face_db.get_face_summary()
 
         return jsonify({
             'success': True,
-            'modelTrained': face_recognizer.is_model_loaded(),
-            'totalUsers': total_users,
-            'totalImages': total_images,
-            'lastTrained': os.path.getmtime(face_recognizer.model_path) if os.path.exists(face_recognizer.model_path) else None
+            'ready': services.ready,
+            'modelTrained': recognizer is not None and recognizer.is_model_loaded(),
+            'modelVersion': recognizer.snapshot.version if recognizer is not None else None,
+            'trainingJob': job.to_dict() if job else None,
+            'totalUsers': summary['totalUsers'],
+            'totalImages': summary['totalImages'],
+            'lastTrained': os.path.getmtime(MODEL_FILE) if os.path.exists(MODEL_FILE) else None
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/upload/stats', methods=['GET'])
+def get_upload_stats():
+    # Bytes and decode time per upload transport, and what binary uploads saved over base64
+    return jsonify({'success': True, **upload_stats.summary()})
+
+def get_liveness_session_id(data):
+    """
+    Key for a client's blink state: an explicit session id if the client sent
+    one, otherwise its address plus the user being verified.
+    """
+    session_id = request.headers.get('X-Session-Id') or data.get('sessionId')
+    if session_id:
+        return str(session_id)
+    return f"{request.remote_addr}:{data.get('userId', '')}"
+
 @app.route('/api/recognize', methods=['POST'])
 def recognize_face():
     try:
-        data = request.json
-        if not data or 'image' not in data:
+        # Raw image/jpeg, multipart or base64 JSON
+        data = read_image_payload(request, upload_stats)
+        if data is None:
             return jsonify({
                 'success': False,
                 'message': 'Missing image data'
             }), 400
 
-        # Check if model is loaded
+        # Pick up a model saved by another worker process, then check it is loaded
+        face_recognizer.maybe_reload()
         if not face_recognizer.is_model_loaded():
             return jsonify({
                 'success': False,
                 'message': 'Face recognition model not loaded. Please train the model first.'
             }), 400
 
-        # Decode base64 image
-        image_data = base64.b64decode(data['image'].split(',')[1])
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Detection runs within the pixel budget; faces are encoded from full-resolution crops
+        image = face_recognizer.decode(data.data)
+        if image is None:
+            return jsonify({
+                'success': False,
+                'message': 'Could not decode image'
+            }), 400
 
-        # Perform recognition
-        result = face_recognizer.recognize_single_face(image)
+        # Perform recognition within this client's liveness session
+        session_id = get_liveness_session_id(data)
+        result = face_recognizer.recognize_single_face(image, session_id=session_id)
+        result['sessionId'] = session_id
         return jsonify(result)
 
+    except ValidationException as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'message': str(e)
         }), 500
 
+@app.route('/api/recognize/batch', methods=['POST'])
+def recognize_batch():
+    try:
+        # Multipart 'images' file parts, a single raw image body, or base64 JSON
+        if request.mimetype == 'multipart/form-data':
+            encoded_images = [upload.read() for upload in request.files.getlist('images')]
+        elif request.mimetype.startswith('image/'):
+            encoded_images = [request.get_data(cache=False)]
+        else:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                data = {}
+            # A single group photo or a burst of frames
+            items = data.get('images') or ([data['image']] if data.get('image') else [])
+            if not isinstance(items, list):
+                return jsonify({
+                    'success': False,
+                    'message': 'images must be a list of base64 strings'
+                }), 400
+            encoded_images = [decode_base64_image(item) for item in items]
+            invalid = [i for i, image in enumerate(encoded_images) if image is None]
+            if invalid:
+                return jsonify({
+                    'success': False,
+                    'message': 'Images must be base64 strings or data URLs',
+                    'invalidImages': invalid
+                }), 400
+
+        if not encoded_images:
+            return jsonify({
+                'success': False,
+                'message': 'Missing image data'
+            }), 400
+        if len(encoded_images) > MAX_BATCH_IMAGES:
+            return jsonify({
+                'success': False,
+                'message': f'At most {MAX_BATCH_IMAGES} images per batch'
+            }), 400
+
+        face_recognizer.maybe_reload()
+        if not face_recognizer.is_model_loaded():
+            return jsonify({
+                'success': False,
+                'message': 'Face recognition model not loaded. Please train the model first.'
+            }), 400
+
+        images = []
+        for image_data in encoded_images:
+            images.append(face_recognizer.decode(image_data, BATCH_PIXEL_BUDGET))
+
+        # Every face across the batch is matched in one pass
+        result = face_recognizer.recognize_batch(images)
+        result['imageCount'] = len(images)
+        result['undecodedImages'] = [i for i, image in enumerate(images) if image is None]
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+# Seconds between streamed frames the client may ask for, and the default
+STREAM_FRAME_INTERVAL = 0.2
+STREAM_FRAME_INTERVAL_RANGE = (0.02, 5.0)
+
+def parse_frame_interval(value):
+    """Client-supplied frame interval in seconds, clamped; the default if missing or malformed."""
+    try:
+        interval = float(value)
+    except (TypeError, ValueError):
+        return STREAM_FRAME_INTERVAL
+    if interval != interval:  # NaN
+        return STREAM_FRAME_INTERVAL
+    low, high = STREAM_FRAME_INTERVAL_RANGE
+    return min(max(interval, low), high)
+
+if sock is not None:
+    @sock.route('/ws/recognize')
+    def recognize_stream(ws):
+        # Binary messages are encoded frames; results are pushed back as JSON text
+        args = request.args
+        session_id = args.get('sessionId') or f"{request.remote_addr}:{args.get('userId', '')}"
+        frame_interval = parse_frame_interval(args.get('frameInterval'))
+        stream = RecognitionStream(face_recognizer, ws.send, session_id, frame_interval=frame_interval).start()
+        stream.send({'type': 'ready', 'sessionId': session_id})
+        try:
+            while True:
+                message = ws.receive()
+                if message is None:
+                    break
+                stream.submit(message)
+        finally:
+            stream.close()
+
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    # Liveness: the process is up and serving; never touches models or the database
+    return jsonify({'status': 'alive'})
+
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    # Readiness: heavy models are warmed up and requests will not block on loading
+    report = startup_report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+def startup_report():
+    return {
+        **services.report(),
+        'modelLoadTimes': {name: round(seconds, 3) for name, seconds in face_models.load_times().items()},
+    }
+
+# 'background' (default) serves immediately and warms up in a thread;
+# 'eager' warms up before serving, e.g. under gunicorn --preload so workers
+# fork with the models already loaded; 'off' builds everything on first use.
+# A background warm-up cut short by a fork resumes in gunicorn workers via
+# the post_fork hook in gunicorn.conf.py
+WARM_UP_MODE = os.getenv('FACE_WARMUP', 'background')
+# Training workers started by spawn/forkserver re-import this module as
+# __mp_main__ when it is run directly; they must not warm the services up
+if WARM_UP_MODE != 'off' and __name__ != '__mp_main__':
+    services.warm_up(
+        ['face_recognizer', 'face_trainer', 'image_downloader', 'user_face_db'],
+        before=face_models.preload,
+        background=WARM_UP_MODE != 'eager'
+    )
+
+services.record('app_import', time.perf_counter() - _import_started)
+
 if __name__ == '__main__':
     app.run(debug=True, port=3000)
\ No newline at end of file
@@ -0,0 +1,7 @@
+# Loaded by gunicorn from the working directory, e.g. `gunicorn app:app`
+
+
+def post_fork(server, worker):
+    # Only server workers resume the warm-up; training pool workers do not
+    from app import services
+    services.after_worker_fork()
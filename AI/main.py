@@ -22,7 +22,7 @@ def capture_faces():
 def train_model():
     trainer = FaceModelTrainer()
     print("Training model with captured faces...")
-    trainer.train_model('data/face_data/raw')
+    trainer.train_model('data/face_data/raw', workers=None)
     trainer.save_model()
     print("Model training completed and saved!")
 
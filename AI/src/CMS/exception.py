@@ -35,3 +35,13 @@ class ConfigurationException(CMSException):
     """Raised when there's a configuration error"""
     def __init__(self, message="Configuration error", error_code="CONFIG_001"):
         super().__init__(message=message, error_code=error_code)
+
+class JobCancelledException(CMSException):
+    """Raised inside a background job when it has been cancelled"""
+    def __init__(self, message="Job was cancelled", error_code="JOB_001"):
+        super().__init__(message=message, error_code=error_code)
+
+class UploadQueueFullException(CMSException):
+    """Raised when too many uploads are already waiting in the background"""
+    def __init__(self, message="Upload queue is full", error_code="UPLOAD_001"):
+        super().__init__(message=message, error_code=error_code)
@@ -2,10 +2,12 @@ import cv2
 import numpy as np
 import os
 from pathlib import Path
-import face_recognition
 import time
 from src.CMS.logging import logger
 from src.CMS.exception import FileOperationException
+from src.CMS.face_recognition import registry
+from src.CMS.face_recognition.utils.tracking import FaceTracker
+from src.CMS.face_recognition.pipeline import FramePipeline
 
 class FaceImageCapture:
     """Class for capturing face images for training."""
@@ -24,7 +26,7 @@ class FaceImageCapture:
         for directory in [self.data_dir, self.raw_dir, self.processed_dir]:
             directory.mkdir(parents=True, exist_ok=True)
     
-    def capture_faces(self, person_name, num_images=20, delay=2):
+    def capture_faces(self, person_name, num_images=20, delay=2, detect_every=5, source=0):
         """
         Capture multiple face images of a person.
         
@@ -32,29 +34,37 @@ class FaceImageCapture:
             person_name (str): Name of the person
             num_images (int): Number of images to capture
             delay (int): Delay between captures in seconds
+            detect_every (int): Frames between full face detections; the
+                feedback boxes are tracked in between
+            source: Camera index, video file path or frame source object
         """
         try:
             # Create directory for this person if it doesn't exist
             person_dir = self.raw_dir / person_name
             person_dir.mkdir(parents=True, exist_ok=True)
             
-            # Initialize camera
-            cap = cv2.VideoCapture(0)
+            tracker = FaceTracker(registry.face_detector(), detect_every=detect_every)
             
             # Count images captured
-            count = 0
+            state = {'count': 0, 'last_capture': 0, 'auto_mode': False}
             logger.info(f"Capturing {num_images} images for {person_name}")
             print(f"Capturing {num_images} images for {person_name}. Press 'c' to capture, 'q' to quit.")
             
-            # Last capture time
-            last_capture = 0
-            auto_mode = False
+            def save(frame):
+                img_path = person_dir / f"{person_name}_{state['count']:03d}.jpg"
+                cv2.imwrite(str(img_path), frame)
+                logger.info(f"Image {state['count']+1} saved: {img_path}")
+                state['count'] += 1
+                state['last_capture'] = time.time()
             
-            while count < num_images:
-                ret, frame = cap.read()
-                if not ret:
-                    raise FileOperationException("Failed to grab frame from camera")
-                    
+            def process(frame):
+                # Face detection for feedback; boxes are tracked between detections
+                _, tracks = tracker.update(frame)
+                return [track.location for track in tracks]
+            
+            def render(frame, face_locations):
+                count, auto_mode = state['count'], state['auto_mode']
+                
                 # Display current frame
                 display_frame = frame.copy()
                 cv2.putText(display_frame, f"Images: {count}/{num_images}", (10, 30), 
@@ -68,10 +78,6 @@ class FaceImageCapture:
                 cv2.putText(display_frame, f"Auto mode: {'ON' if auto_mode else 'OFF'}", (10, 120), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0) if auto_mode else (0, 255, 0), 2)
                 
-                # Face detection for feedback
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_locations = face_recognition.face_locations(rgb_frame)
-                
                 # Draw rectangle around detected faces
                 for top, right, bottom, left in face_locations:
                     cv2.rectangle(display_frame, (left, top), (right, bottom), (0, 255, 0), 2)
@@ -79,39 +85,36 @@ class FaceImageCapture:
                 cv2.imshow('Face Capture', display_frame)
                 
                 # Handle auto mode
-                current_time = time.time()
-                if auto_mode and current_time - last_capture > delay and len(face_locations) > 0:
+                if auto_mode and time.time() - state['last_capture'] > delay and len(face_locations) > 0:
                     # Auto-capture if a face is detected and delay has passed
-                    img_path = person_dir / f"{person_name}_{count:03d}.jpg"
-                    cv2.imwrite(str(img_path), frame)
-                    logger.info(f"Image {count+1} saved: {img_path}")
-                    count += 1
-                    last_capture = current_time
+                    save(frame)
                 
                 # Handle key presses
                 key = cv2.waitKey(1)
                 if key == ord('q'):
-                    break
+                    return False
                 elif key == ord('c'):
                     if len(face_locations) > 0:
                         # Manual capture if a face is detected
-                        img_path = person_dir / f"{person_name}_{count:03d}.jpg"
-                        cv2.imwrite(str(img_path), frame)
-                        logger.info(f"Image {count+1} saved: {img_path}")
-                        count += 1
-                        last_capture = time.time()
+                        save(frame)
                     else:
                         logger.warning("No face detected! Please position your face in the frame.")
                 elif key == ord('a'):
                     # Toggle auto mode
-                    auto_mode = not auto_mode
-                    logger.info(f"Auto-capture mode {'enabled' if auto_mode else 'disabled'}")
-                    last_capture = time.time()  # Reset timer when toggling
+                    state['auto_mode'] = not auto_mode
+                    logger.info(f"Auto-capture mode {'enabled' if state['auto_mode'] else 'disabled'}")
+                    state['last_capture'] = time.time()  # Reset timer when toggling
+                return state['count'] < num_images
+            
+            # Camera reads, detection and display run as separate pipeline stages
+            pipeline = FramePipeline(source, process, render)
+            pipeline.run()
+            if pipeline.grabbed == 0:
+                raise FileOperationException("Failed to grab frame from camera")
             
             # Release resources
-            cap.release()
             cv2.destroyAllWindows()
-            logger.info(f"Completed capturing {count} images for {person_name}")
+            logger.info(f"Completed capturing {state['count']} images for {person_name}")
             
         except Exception as e:
             logger.error(f"Error during face capture: {str(e)}")
@@ -0,0 +1,278 @@
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from src.CMS.logging import logger
+from src.CMS.exception import JobCancelledException
+
+
+class TrainingJob:
+    """State of one background training run."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.state = self.QUEUED
+        self.stage = None
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._stage_started_at = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in self.FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        """Raise JobCancelledException if cancellation was requested; call between work items."""
+        if self._cancel_event.is_set():
+            raise JobCancelledException(f"Training job {self.id} was cancelled")
+
+    def set_stage(self, stage, total=None):
+        """Start a new named stage (e.g. 'downloading', 'encoding') and reset its progress."""
+        self.stage = stage
+        self.done = 0
+        self.total = total
+        self._stage_started_at = time.time()
+
+    def update_progress(self, done, total=None):
+        """Progress callback for the trainer; also the cancellation point during encoding."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        self.check_cancelled()
+
+    @property
+    def eta(self):
+        """Seconds left in the current stage, extrapolated from its rate so far."""
+        if not self.total or not self.done or self._stage_started_at is None:
+            return None
+        elapsed = time.time() - self._stage_started_at
+        return elapsed / self.done * (self.total - self.done)
+
+    def to_dict(self):
+        eta = self.eta
+        return {
+            'jobId': self.id,
+            'state': self.state,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'progress': (self.done / self.total) if self.total else None,
+            'etaSeconds': round(eta, 1) if eta is not None else None,
+            'cancelRequested': self.cancel_requested,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class ProcessLock:
+    """Exclusive advisory lock on a file, shared by every process on the host."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+
+    def acquire(self):
+        """
+        Try to take the lock without blocking.
+
+        Returns:
+            bool: True if this process now holds the lock
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        f.close()
+
+
+class TrainingJobManager:
+    """
+    Local job queue that runs training in background worker threads.
+
+    Requests that arrive while a job is still queued are coalesced into that
+    job; a request that arrives while a job is running queues one follow-up
+    job, so new captures are always picked up by the next run.
+
+    Jobs and their status live in this process. With a ``lock_path``, runs
+    are also serialized across processes (e.g. gunicorn workers): a job
+    waits in the 'waiting' stage while another process is training, and can
+    be cancelled meanwhile.
+    """
+
+    def __init__(self, run_job, max_workers=1, history=20, lock_path=None, lock_poll=1.0):
+        """
+        Args:
+            run_job (callable): Called as run_job(job) in a worker thread; its
+                return value becomes job.result
+            max_workers (int): Worker threads; keep at 1 unless run_job is thread-safe
+            history (int): Finished jobs kept for status queries
+            lock_path (str or Path): File locked around every run, shared by
+                all processes training the same model
+            lock_poll (float): Seconds between attempts to take that lock
+        """
+        self.run_job = run_job
+        self.history = history
+        self.process_lock = ProcessLock(lock_path) if lock_path is not None else None
+        self.lock_poll = lock_poll
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f'training-worker-{i}', daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self):
+        """
+        Queue a training job, reusing an already queued one.
+
+        Returns:
+            tuple: (job, created) where created is False if an existing job was reused
+        """
+        with self._lock:
+            for job_id in reversed(self._order):
+                job = self._jobs[job_id]
+                if job.state == TrainingJob.QUEUED and not job.cancel_requested:
+                    return job, False
+
+            job = TrainingJob()
+            self._jobs[job.id] = job
+            self._order.append(job.id)
+            self._trim_history()
+        self._queue.put(job)
+        logger.info(f"Queued training job {job.id}")
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self):
+        """The most recently submitted job, or None."""
+        with self._lock:
+            return self._jobs[self._order[-1]] if self._order else None
+
+    def active(self):
+        """The running job, else the oldest queued one, else None."""
+        with self._lock:
+            jobs = [self._jobs[job_id] for job_id in self._order]
+        for state in (TrainingJob.RUNNING, TrainingJob.QUEUED):
+            for job in jobs:
+                if job.state == state:
+                    return job
+        return None
+
+    def cancel(self, job_id):
+        """
+        Request cancellation. Queued jobs are skipped; running jobs stop at
+        their next cancellation point.
+
+        Returns:
+            TrainingJob: The job, or None if unknown
+        """
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel()
+            logger.info(f"Cancellation requested for training job {job_id}")
+        return job
+
+    def _trim_history(self):
+        finished = [job_id for job_id in self._order if self._jobs[job_id].finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            self._order.remove(job_id)
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        if job.cancel_requested:
+            job.state = TrainingJob.CANCELLED
+            job.finished_at = time.time()
+            return
+
+        job.state = TrainingJob.RUNNING
+        job.started_at = time.time()
+        logger.info(f"Training job {job.id} started")
+        locked = False
+        try:
+            if self.process_lock is not None:
+                while not self.process_lock.acquire():
+                    if job.stage != 'waiting':
+                        job.set_stage('waiting')
+                        logger.info(f"Training job {job.id} waiting for another process to finish training")
+                    job.check_cancelled()
+                    time.sleep(self.lock_poll)
+                locked = True
+            job.result = self.run_job(job)
+            job.state = TrainingJob.SUCCEEDED
+            logger.info(f"Training job {job.id} finished in {time.time() - job.started_at:.1f}s")
+        except JobCancelledException:
+            job.state = TrainingJob.CANCELLED
+            logger.info(f"Training job {job.id} cancelled")
+        except Exception as e:
+            job.state = TrainingJob.FAILED
+            job.error = str(e)
+            logger.error(f"Training job {job.id} failed: {e}")
+        finally:
+            if locked:
+                self.process_lock.release()
+            job.finished_at = time.time()
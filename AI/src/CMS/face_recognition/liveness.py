@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class BlinkState:
+    """Blink state machine for one client session."""
+
+    def __init__(self, blink_counter=0, blink_started=False, last_ear=1.0, updated_at=None):
+        self.blink_counter = blink_counter
+        self.blink_started = blink_started
+        self.last_ear = last_ear
+        self.updated_at = updated_at if updated_at is not None else time.time()
+
+    def reset(self):
+        self.blink_counter = 0
+        self.blink_started = False
+        self.last_ear = 1.0
+
+    def to_dict(self):
+        return {
+            'blink_counter': self.blink_counter,
+            'blink_started': self.blink_started,
+            'last_ear': self.last_ear,
+            'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class LivenessStore(ABC):
+    """
+    Session-keyed storage for BlinkState.
+
+    Subclasses only implement get/put/delete, so the in-process store can be
+    swapped for a shared backend when recognition runs in several processes.
+    """
+
+    @abstractmethod
+    def get(self, session_id):
+        """Return the session's state, or a fresh one if unknown or expired."""
+
+    @abstractmethod
+    def put(self, session_id, state):
+        """Save the session's state."""
+
+    @abstractmethod
+    def delete(self, session_id):
+        """Forget the session."""
+
+
+class InMemoryLivenessStore(LivenessStore):
+    """Per-process store with TTL and size-bounded LRU eviction."""
+
+    def __init__(self, ttl=30.0, max_sessions=10000):
+        """
+        Args:
+            ttl (float): Seconds of inactivity after which a session is forgotten
+            max_sessions (int): Oldest sessions are evicted beyond this count
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._evict(time.time())
+            return len(self._states)
+
+    def _evict(self, now):
+        # Entries are kept in last-update order, so expired ones are at the front
+        while self._states:
+            session_id, state = next(iter(self._states.items()))
+            if now - state.updated_at <= self.ttl and len(self._states) <= self.max_sessions:
+                break
+            del self._states[session_id]
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            state = self._states.get(session_id)
+        if state is None:
+            return BlinkState(updated_at=now)
+        # Hand out a copy so concurrent requests never mutate shared state mid-update
+        return BlinkState.from_dict(state.to_dict())
+
+    def put(self, session_id, state):
+        now = time.time()
+        state.updated_at = now
+        with self._lock:
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._states.pop(session_id, None)
+
+
+class KeyValueLivenessStore(LivenessStore):
+    """
+    Store backed by any key-value client with redis-py style
+    ``get(key)``, ``set(key, value, ex=seconds)`` and ``delete(key)``,
+    so every worker process sees the same blink state.
+    """
+
+    def __init__(self, client, ttl=30, prefix='liveness:'):
+        """
+        Args:
+            client: Key-value client, e.g. redis.Redis
+            ttl (int): Expiry in seconds, refreshed on every update
+            prefix (str): Key namespace
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, session_id):
+        raw = self.client.get(self.prefix + session_id)
+        if raw is None:
+            return BlinkState()
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8')
+        return BlinkState.from_dict(json.loads(raw))
+
+    def put(self, session_id, state):
+        state.updated_at = time.time()
+        self.client.set(self.prefix + session_id, json.dumps(state.to_dict()), ex=int(self.ttl))
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
@@ -0,0 +1,214 @@
+import numpy as np
+
+
+class EncodingTable:
+    """
+    Mutable, keyed gallery used by the trainer.
+
+    Every encoding gets a stable row id and is addressed by its source (file
+    path or image key). Deleting or replacing a source only tombstones its
+    slot, which is O(1); tombstoned slots are dropped by ``compact``, which
+    runs automatically once they make up ``max_tombstone_ratio`` of the table.
+    """
+
+    def __init__(self, dim=128, max_tombstone_ratio=0.25):
+        """
+        Args:
+            dim (int): Encoding dimensionality
+            max_tombstone_ratio (float): Fraction of dead slots that triggers compaction
+        """
+        self.dim = dim
+        self.max_tombstone_ratio = max_tombstone_ratio
+        self._encodings = np.empty((0, dim), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._row_ids = np.empty(0, dtype=np.int64)
+        self._names = []
+        self._sources = []
+        self._size = 0
+        self._tombstones = 0
+        self._next_row_id = 0
+        self._slot_by_source = {}
+        self._slot_by_row_id = {}
+        self._slots_by_name = {}
+
+    def __len__(self):
+        return self._size - self._tombstones
+
+    def __contains__(self, source):
+        return source in self._slot_by_source
+
+    @classmethod
+    def from_rows(cls, encodings, names, sources, row_ids=None, **kwargs):
+        """
+        Build a table from saved rows.
+
+        Args:
+            encodings (numpy.ndarray): (N, dim) encodings
+            names (list): Identity per row
+            sources (list): Source per row; None for rows without a known source
+            row_ids (list): Saved stable row ids; new ids are assigned if omitted
+        """
+        table = cls(**kwargs)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, table.dim)
+        if row_ids is None or any(row_id is None for row_id in row_ids):
+            row_ids = range(len(encodings))
+        for encoding, name, source, row_id in zip(encodings, names, sources, row_ids):
+            table._append(encoding, name, source, int(row_id))
+        table._next_row_id = max(table._next_row_id, int(table._row_ids[:table._size].max(initial=-1)) + 1)
+        return table
+
+    def _grow(self, needed):
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        # Amortized O(1) appends: double the backing arrays when full
+        new_capacity = max(needed, 2 * capacity, 64)
+        encodings = np.empty((new_capacity, self.dim), dtype=np.float32)
+        encodings[:self._size] = self._encodings[:self._size]
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        row_ids = np.full(new_capacity, -1, dtype=np.int64)
+        row_ids[:self._size] = self._row_ids[:self._size]
+        self._encodings, self._alive, self._row_ids = encodings, alive, row_ids
+
+    def _append(self, encoding, name, source, row_id):
+        self._grow(self._size + 1)
+        slot = self._size
+        self._encodings[slot] = encoding
+        self._alive[slot] = True
+        self._row_ids[slot] = row_id
+        self._names.append(name)
+        self._sources.append(source)
+        self._size += 1
+        self._next_row_id = max(self._next_row_id, row_id + 1)
+        self._slot_by_row_id[row_id] = slot
+        if source is not None:
+            # Legacy rows without a source may not be unique, so only real sources are keyed
+            if source in self._slot_by_source:
+                self._kill(self._slot_by_source[source])
+            self._slot_by_source[source] = slot
+        self._slots_by_name.setdefault(name, set()).add(slot)
+        return row_id
+
+    def add(self, encoding, name, source):
+        """
+        Add an encoding, replacing any live encoding from the same source.
+
+        Returns:
+            int: The new row id
+        """
+        row_id = self._append(encoding, name, source, self._next_row_id)
+        self.maybe_compact()
+        return row_id
+
+    def _kill(self, slot):
+        if not self._alive[slot]:
+            return
+        self._alive[slot] = False
+        self._tombstones += 1
+        del self._slot_by_row_id[int(self._row_ids[slot])]
+        source = self._sources[slot]
+        if source is not None and self._slot_by_source.get(source) == slot:
+            del self._slot_by_source[source]
+        slots = self._slots_by_name.get(self._names[slot])
+        if slots is not None:
+            slots.discard(slot)
+            if not slots:
+                del self._slots_by_name[self._names[slot]]
+
+    def source_of(self, row_id):
+        """Source of a live row id, or None if the row is unknown or deleted."""
+        slot = self._slot_by_row_id.get(row_id)
+        return None if slot is None else self._sources[slot]
+
+    def row_id_of(self, source):
+        """Row id of the live encoding for a source, or None."""
+        slot = self._slot_by_source.get(source)
+        return None if slot is None else int(self._row_ids[slot])
+
+    def remove_source(self, source):
+        """
+        Tombstone the encoding for a source.
+
+        Returns:
+            bool: True if the source had a live encoding
+        """
+        slot = self._slot_by_source.get(source)
+        if slot is None:
+            return False
+        self._kill(slot)
+        self.maybe_compact()
+        return True
+
+    def remove_unsourced(self):
+        """
+        Tombstone every encoding without a source, e.g. rows converted from a
+        model format that did not record them.
+
+        Returns:
+            int: Number of encodings removed
+        """
+        slots = [
+            slot for slot in np.flatnonzero(self._alive[:self._size])
+            if self._sources[slot] is None
+        ]
+        for slot in slots:
+            self._kill(int(slot))
+        self.maybe_compact()
+        return len(slots)
+
+    def remove_name(self, name):
+        """
+        Tombstone every encoding of an identity.
+
+        Returns:
+            list: Sources of the removed encodings
+        """
+        slots = list(self._slots_by_name.get(name, ()))
+        sources = [self._sources[slot] for slot in slots]
+        for slot in slots:
+            self._kill(slot)
+        self.maybe_compact()
+        return [source for source in sources if source is not None]
+
+    @property
+    def tombstone_ratio(self):
+        return self._tombstones / self._size if self._size else 0.0
+
+    def maybe_compact(self):
+        if self.tombstone_ratio > self.max_tombstone_ratio:
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned slots and rebuild the lookup maps; row ids are preserved."""
+        if not self._tombstones:
+            return
+        live = np.flatnonzero(self._alive[:self._size])
+        encodings = self._encodings[live]
+        row_ids = self._row_ids[live]
+        names = [self._names[slot] for slot in live]
+        sources = [self._sources[slot] for slot in live]
+
+        self._encodings = np.empty((0, self.dim), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._row_ids = np.empty(0, dtype=np.int64)
+        self._names, self._sources = [], []
+        self._size = self._tombstones = 0
+        self._slot_by_source, self._slot_by_row_id, self._slots_by_name = {}, {}, {}
+        for encoding, name, source, row_id in zip(encodings, names, sources, row_ids):
+            self._append(encoding, name, source, int(row_id))
+
+    def live_rows(self):
+        """
+        Live rows in slot order.
+
+        Returns:
+            tuple: (encodings (M, dim) float32, names, sources, row ids)
+        """
+        live = np.flatnonzero(self._alive[:self._size])
+        return (
+            self._encodings[live],
+            [self._names[slot] for slot in live],
+            [self._sources[slot] for slot in live],
+            self._row_ids[live].tolist(),
+        )
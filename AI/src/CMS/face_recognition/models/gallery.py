@@ -0,0 +1,169 @@
+import numpy as np
+
+
+class FaceGallery:
+    """Contiguous matrix of known face encodings for fast nearest-neighbour matching."""
+
+    def __init__(self, encodings, names, sq_norms=None, rows_by_name=None, fingerprint=None):
+        """
+        Build the gallery once from a list of encodings.
+
+        Args:
+            encodings (list or numpy.ndarray): Face encodings, one 128-d vector per row
+            names (list): Identity label for each encoding
+            sq_norms (numpy.ndarray): Precomputed squared row norms, if available
+            rows_by_name (dict): Precomputed identity -> row indices, if available
+            fingerprint (str): Fingerprint of the encodings, if known (see gallery_fingerprint)
+        """
+        if len(encodings) != len(names):
+            raise ValueError(
+                f"Got {len(encodings)} encodings but {len(names)} names"
+            )
+
+        if len(encodings):
+            self.encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+        else:
+            self.encodings = np.empty((0, 128), dtype=np.float32)
+        self.names = list(names)
+        # Squared norms are reused by every query: |x - q|^2 = |x|^2 - 2 x.q + |q|^2
+        if sq_norms is None:
+            sq_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+        self.sq_norms = sq_norms
+
+        if rows_by_name is None:
+            rows_by_name = {}
+            for row, name in enumerate(self.names):
+                rows_by_name.setdefault(name, []).append(row)
+            rows_by_name = {name: np.array(rows, dtype=np.int64) for name, rows in rows_by_name.items()}
+        self.rows_by_name = rows_by_name
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        Build a gallery over an opened EncodingStore without copying its matrix.
+
+        Args:
+            store (EncodingStore): Store whose memory-mapped arrays back the gallery
+        """
+        identity_ids = np.asarray(store.identity_ids)
+        identities = store.identities
+        order = np.argsort(identity_ids, kind='stable')
+        bounds = np.searchsorted(identity_ids[order], np.arange(len(identities) + 1))
+        rows_by_name = {
+            identities[i]: order[bounds[i]:bounds[i + 1]].astype(np.int64)
+            for i in range(len(identities))
+            if bounds[i + 1] > bounds[i]
+        }
+        return cls(store.encodings, store.names, sq_norms=store.sq_norms, rows_by_name=rows_by_name,
+                   fingerprint=store.fingerprint)
+
+    def __len__(self):
+        return self.encodings.shape[0]
+
+    def distances(self, face_encodings):
+        """
+        Euclidean distances from one or more probes to every gallery row.
+
+        Args:
+            face_encodings (numpy.ndarray): A single encoding (128,) or a batch (M, 128)
+
+        Returns:
+            numpy.ndarray: Distances of shape (N,) for a single probe or (M, N) for a batch
+        """
+        probes = np.asarray(face_encodings, dtype=np.float32)
+        single = probes.ndim == 1
+        probes = np.atleast_2d(probes)
+
+        # One GEMM for the whole batch instead of a Python-level pass per row
+        sq = self.sq_norms[None, :] - 2.0 * (probes @ self.encodings.T)
+        sq += np.einsum('ij,ij->i', probes, probes)[:, None]
+        np.maximum(sq, 0.0, out=sq)
+        dists = np.sqrt(sq)
+
+        return dists[0] if single else dists
+
+    def nearest(self, face_encoding):
+        """
+        Find the closest gallery entry to a probe.
+
+        Args:
+            face_encoding (numpy.ndarray): Face encoding to match
+
+        Returns:
+            tuple: (index, name, distance), or (None, None, inf) if the gallery is empty
+        """
+        if not len(self):
+            return None, None, float('inf')
+
+        dists = self.distances(face_encoding)
+        idx = int(np.argmin(dists))
+        return idx, self.names[idx], float(dists[idx])
+
+    def nearest_many(self, face_encodings, chunk_size=256):
+        """
+        Find the closest gallery entry for each of many probes with matrix-matrix products.
+
+        Args:
+            face_encodings (numpy.ndarray): (M, 128) probe encodings
+            chunk_size (int): Probes per product, bounding the (chunk, N) distance block
+
+        Returns:
+            tuple: (indices (M,), distances (M,)); indices are -1 if the gallery is empty
+        """
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, self.encodings.shape[1])
+        indices = np.full(len(probes), -1, dtype=np.int64)
+        distances = np.full(len(probes), np.inf, dtype=np.float32)
+        if not len(self) or not len(probes):
+            return indices, distances
+
+        for start in range(0, len(probes), chunk_size):
+            block = self.distances(probes[start:start + chunk_size])
+            best = np.argmin(block, axis=1)
+            indices[start:start + len(best)] = best
+            distances[start:start + len(best)] = block[np.arange(len(best)), best]
+        return indices, distances
+
+    def top_k(self, face_encoding, k=5):
+        """
+        Find the k closest gallery entries to a probe, nearest first.
+
+        Args:
+            face_encoding (numpy.ndarray): Face encoding to match
+            k (int): Number of neighbours to return
+
+        Returns:
+            list: (index, name, distance) tuples sorted by distance
+        """
+        n = len(self)
+        if not n:
+            return []
+
+        k = min(k, n)
+        dists = self.distances(face_encoding)
+        if k < n:
+            candidates = np.argpartition(dists, k - 1)[:k]
+        else:
+            candidates = np.arange(n)
+        order = candidates[np.argsort(dists[candidates])]
+        return [(int(i), self.names[i], float(dists[i])) for i in order]
+
+    def nearest_in(self, face_encoding, rows):
+        """
+        Find the closest entry to a probe among a subset of gallery rows.
+
+        Args:
+            face_encoding (numpy.ndarray): Face encoding to match
+            rows (numpy.ndarray): Gallery row indices to consider
+
+        Returns:
+            tuple: (index, name, distance), or (None, None, inf) if rows is empty
+        """
+        if not len(rows):
+            return None, None, float('inf')
+
+        probe = np.asarray(face_encoding, dtype=np.float32)
+        sq = self.sq_norms[rows] - 2.0 * (self.encodings[rows] @ probe) + float(probe @ probe)
+        best = int(np.argmin(sq))
+        idx = int(rows[best])
+        return idx, self.names[idx], float(np.sqrt(max(sq[best], 0.0)))
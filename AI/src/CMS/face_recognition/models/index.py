@@ -0,0 +1,464 @@
+import heapq
+import math
+import os
+import zlib
+
+import numpy as np
+
+
+def gallery_fingerprint(encodings):
+    """Cheap checksum used to tell whether a saved index still matches the gallery."""
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    return f"{encodings.shape[0]}:{zlib.crc32(encodings.tobytes()) & 0xffffffff:08x}"
+
+
+def _sq_distances(encodings, sq_norms, query):
+    """Squared euclidean distances from one query to a block of rows."""
+    sq = sq_norms - 2.0 * (encodings @ query) + float(query @ query)
+    return np.maximum(sq, 0.0)
+
+
+class FlatIndex:
+    """Exact brute-force index; the reference the approximate indexes are measured against."""
+
+    kind = 'flat'
+    # Largest gallery the index may be built over; None for no limit
+    max_rows = None
+
+    def __init__(self):
+        self.encodings = np.empty((0, 128), dtype=np.float32)
+        self.sq_norms = np.empty(0, dtype=np.float32)
+        self.fingerprint = None
+
+    def __len__(self):
+        return self.encodings.shape[0]
+
+    def build(self, encodings, fingerprint=None, sq_norms=None):
+        """
+        Index a gallery matrix.
+
+        Args:
+            encodings (numpy.ndarray): (N, 128) float32 gallery matrix
+            fingerprint (str): The gallery's fingerprint if already known, e.g.
+                from its EncodingStore; computed from the matrix otherwise
+            sq_norms (numpy.ndarray): The gallery's squared row norms, if known
+        """
+        self._attach(encodings, sq_norms)
+        self.fingerprint = fingerprint or gallery_fingerprint(self.encodings)
+        return self
+
+    def _attach(self, encodings, sq_norms=None):
+        self.encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+        if sq_norms is None:
+            sq_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+        self.sq_norms = sq_norms
+
+    def search(self, query, k=1):
+        """
+        Find the k nearest gallery rows to a query.
+
+        Args:
+            query (numpy.ndarray): Face encoding (128,)
+            k (int): Number of neighbours to return
+
+        Returns:
+            tuple: (row ids, euclidean distances), both sorted nearest first
+        """
+        n = len(self)
+        if not n:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        sq = _sq_distances(self.encodings, self.sq_norms, query)
+        return self._top_k(np.arange(n), sq, k)
+
+    @staticmethod
+    def _top_k(ids, sq, k):
+        k = min(k, len(ids))
+        if k < len(ids):
+            part = np.argpartition(sq, k - 1)[:k]
+        else:
+            part = np.arange(len(ids))
+        part = part[np.argsort(sq[part])]
+        return ids[part].astype(np.int64), np.sqrt(sq[part])
+
+    def _state(self):
+        return {}
+
+    def _load_state(self, state):
+        pass
+
+    def save(self, path):
+        """Save the index structure (not the gallery itself) to an .npz file."""
+        state = self._state()
+        state['kind'] = np.array(self.kind)
+        state['fingerprint'] = np.array(self.fingerprint or '')
+        # Several worker processes may rebuild the same index; publish atomically
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **state)
+        os.replace(tmp_path, path)
+
+
+class IVFIndex(FlatIndex):
+    """
+    Inverted-file index: rows are partitioned by a k-means coarse quantizer and a
+    query only scans the ``nprobe`` partitions whose centroids are closest.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, nlist=None, nprobe=8, n_iter=20, seed=0):
+        """
+        Args:
+            nlist (int): Number of partitions; defaults to ~sqrt(N)
+            nprobe (int): Partitions scanned per query (the recall vs latency knob)
+            n_iter (int): k-means iterations used to train the quantizer
+            seed (int): Random seed for reproducible partitions
+        """
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = np.empty((0, 128), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.list_ids = np.empty(0, dtype=np.int64)
+
+    def build(self, encodings, fingerprint=None, sq_norms=None):
+        super().build(encodings, fingerprint, sq_norms)
+        n = len(self)
+        if not n:
+            return self
+
+        nlist = self.nlist or max(1, int(round(math.sqrt(n))))
+        nlist = min(nlist, n)
+        self.centroids = self._kmeans(self.encodings, nlist)
+        assignment = self._assign(self.encodings, self.centroids)
+
+        # CSR layout: rows of partition c live in list_ids[list_offsets[c]:list_offsets[c + 1]]
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=nlist)
+        self.list_ids = order.astype(np.int64)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return self
+
+    def _kmeans(self, data, nlist):
+        rng = np.random.default_rng(self.seed)
+        # Training on a sample keeps build time bounded for very large galleries
+        sample_size = min(len(data), max(nlist * 64, 10000))
+        sample = data[rng.choice(len(data), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            assignment = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            counts[empty] = 1
+            new_centroids = sums / counts[:, None]
+            # Re-seed empty partitions from random sample points
+            if empty.any():
+                new_centroids[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            if np.allclose(new_centroids, centroids, atol=1e-6):
+                centroids = new_centroids
+                break
+            centroids = new_centroids
+
+        return centroids.astype(np.float32)
+
+    @staticmethod
+    def _assign(data, centroids, chunk=8192):
+        c_norms = np.einsum('ij,ij->i', centroids, centroids)
+        assignment = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), chunk):
+            block = data[start:start + chunk]
+            sq = c_norms[None, :] - 2.0 * (block @ centroids.T)
+            assignment[start:start + chunk] = np.argmin(sq, axis=1)
+        return assignment
+
+    def search(self, query, k=1, nprobe=None):
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+
+        c_sq = _sq_distances(self.centroids, np.einsum('ij,ij->i', self.centroids, self.centroids), query)
+        probes = np.argpartition(c_sq, nprobe - 1)[:nprobe] if nprobe < len(c_sq) else np.arange(len(c_sq))
+
+        ids = np.concatenate([
+            self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probes
+        ])
+        if not len(ids):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        sq = _sq_distances(self.encodings[ids], self.sq_norms[ids], query)
+        return self._top_k(ids, sq, k)
+
+    def _state(self):
+        return {
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_ids': self.list_ids,
+            'nprobe': np.array(self.nprobe),
+        }
+
+    def _load_state(self, state):
+        self.centroids = state['centroids']
+        self.list_offsets = state['list_offsets']
+        self.list_ids = state['list_ids']
+        self.nlist = len(self.centroids)
+        self.nprobe = int(state['nprobe'])
+
+
+class HNSWIndex(FlatIndex):
+    """
+    Hierarchical navigable small-world graph index written in NumPy/pure Python.
+
+    Each row is inserted on a random number of layers; a query greedily descends
+    the sparse upper layers and then runs a best-first search on the dense base
+    layer, keeping ``ef_search`` candidates.
+
+    Being pure Python, the build costs several milliseconds per row under
+    the GIL, and at the sizes it can reasonably build a query is slower than
+    FlatIndex's single matrix product. It is a small-gallery option for
+    experimenting with graph search and refuses galleries over ``max_rows``;
+    use IVFIndex for large galleries.
+    """
+
+    kind = 'hnsw'
+    max_rows = 2000
+
+    def __init__(self, M=16, ef_construction=100, ef_search=50, seed=0):
+        """
+        Args:
+            M (int): Neighbours kept per node on upper layers (2*M on the base layer)
+            ef_construction (int): Candidate list size while building
+            ef_search (int): Candidate list size per query (the recall vs latency knob)
+            seed (int): Random seed for reproducible layer assignment
+        """
+        super().__init__()
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.seed = seed
+        self.levels = np.empty(0, dtype=np.int32)
+        self.layers = []  # layer -> {node: [neighbour ids]}
+        self.entry_point = -1
+
+    def build(self, encodings, fingerprint=None, sq_norms=None):
+        if len(encodings) > self.max_rows:
+            raise ValueError(f"HNSWIndex builds at most {self.max_rows} rows, got {len(encodings)}; use 'ivf'")
+        super().build(encodings, fingerprint, sq_norms)
+        n = len(self)
+        rng = np.random.default_rng(self.seed)
+        ml = 1.0 / math.log(max(self.M, 2))
+        self.levels = np.floor(-np.log(rng.random(n) + 1e-12) * ml).astype(np.int32)
+        self.layers = [dict() for _ in range(int(self.levels.max()) + 1 if n else 0)]
+        self.entry_point = -1
+
+        for node in range(n):
+            self._insert(node)
+        return self
+
+    def _dist(self, query, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        return _sq_distances(self.encodings[ids], self.sq_norms[ids], query)
+
+    def _search_layer(self, query, entry_points, ef, layer):
+        graph = self.layers[layer]
+        visited = set(entry_points)
+        dists = self._dist(query, entry_points)
+        candidates = [(float(d), e) for d, e in zip(dists, entry_points)]
+        heapq.heapify(candidates)
+        results = [(-d, e) for d, e in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            d, node = heapq.heappop(candidates)
+            if d > -results[0][0] and len(results) >= ef:
+                break
+            neighbours = [nb for nb in graph.get(node, ()) if nb not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            nb_dists = self._dist(query, neighbours)
+            for nd, nb in zip(nb_dists.tolist(), neighbours):
+                if len(results) < ef or nd < -results[0][0]:
+                    heapq.heappush(candidates, (nd, nb))
+                    heapq.heappush(results, (-nd, nb))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-d, e) for d, e in results)
+
+    def _select_neighbours(self, ranked, max_links):
+        """
+        Diversity heuristic from the HNSW paper: keep a candidate only if it is
+        closer to the base node than to every neighbour already kept, so links
+        also reach out of tight clusters instead of only to the nearest rows.
+        Pruned candidates top the list up if the heuristic keeps too few.
+        """
+        ranked = ranked[:self.ef_construction]
+        ids = np.array([cand for _, cand in ranked], dtype=np.int64)
+        base_d = np.array([d for d, _ in ranked], dtype=np.float32)
+        vecs = self.encodings[ids]
+        norms = self.sq_norms[ids]
+        # Pairwise distances between candidates in one product instead of per pair;
+        # row i as a bitmask of the candidates that are closer to i than the base node is
+        pair = norms[:, None] + norms[None, :] - 2.0 * (vecs @ vecs.T)
+        closer = np.packbits(pair < base_d[:, None], axis=1, bitorder='little')
+
+        selected, pruned = [], []
+        selected_mask = 0
+        for i in range(len(ids)):
+            if len(selected) >= max_links:
+                break
+            if selected_mask and int.from_bytes(closer[i].tobytes(), 'little') & selected_mask:
+                pruned.append(i)
+                continue
+            selected.append(i)
+            selected_mask |= 1 << i
+        selected.extend(pruned[:max_links - len(selected)])
+        return [int(ids[i]) for i in selected]
+
+    def _insert(self, node):
+        level = int(self.levels[node])
+        for layer in range(level + 1):
+            self.layers[layer][node] = []
+
+        if self.entry_point < 0:
+            self.entry_point = node
+            return
+
+        query = self.encodings[node]
+        entry = [self.entry_point]
+        top = int(self.levels[self.entry_point])
+
+        for layer in range(top, level, -1):
+            entry = [self._search_layer(query, entry, 1, layer)[0][1]]
+
+        for layer in range(min(level, top), -1, -1):
+            found = self._search_layer(query, entry, self.ef_construction, layer)
+            max_links = self.M * 2 if layer == 0 else self.M
+            neighbours = self._select_neighbours(found, max_links)
+            self.layers[layer][node] = neighbours
+
+            for nb in neighbours:
+                links = self.layers[layer][nb]
+                links.append(node)
+                if len(links) > max_links:
+                    nb_dists = self._dist(self.encodings[nb], links)
+                    ranked = sorted(zip(nb_dists.tolist(), links))
+                    self.layers[layer][nb] = self._select_neighbours(ranked, max_links)
+            entry = [e for _, e in found]
+
+        if level > top:
+            self.entry_point = node
+
+    def search(self, query, k=1, ef_search=None):
+        if self.entry_point < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        ef = max(ef_search or self.ef_search, k)
+        entry = [self.entry_point]
+        for layer in range(int(self.levels[self.entry_point]), 0, -1):
+            entry = [self._search_layer(query, entry, 1, layer)[0][1]]
+
+        found = self._search_layer(query, entry, ef, 0)[:k]
+        ids = np.array([e for _, e in found], dtype=np.int64)
+        dists = np.sqrt(np.array([d for d, _ in found], dtype=np.float32))
+        return ids, dists
+
+    def _state(self):
+        state = {
+            'levels': self.levels,
+            'entry_point': np.array(self.entry_point),
+            'params': np.array([self.M, self.ef_construction, self.ef_search]),
+        }
+        # Each layer is stored as node ids plus a -1 padded neighbour matrix
+        for layer, graph in enumerate(self.layers):
+            nodes = np.fromiter(graph.keys(), dtype=np.int64, count=len(graph))
+            width = max((len(v) for v in graph.values()), default=0)
+            links = np.full((len(nodes), width), -1, dtype=np.int64)
+            for row, node in enumerate(nodes):
+                nbrs = graph[node]
+                links[row, :len(nbrs)] = nbrs
+            state[f'layer{layer}_nodes'] = nodes
+            state[f'layer{layer}_links'] = links
+        return state
+
+    def _load_state(self, state):
+        self.levels = state['levels']
+        self.entry_point = int(state['entry_point'])
+        self.M, self.ef_construction, self.ef_search = (int(v) for v in state['params'])
+        self.layers = []
+        layer = 0
+        while f'layer{layer}_nodes' in state:
+            nodes = state[f'layer{layer}_nodes']
+            links = state[f'layer{layer}_links']
+            self.layers.append({
+                int(node): [int(nb) for nb in row if nb >= 0]
+                for node, row in zip(nodes, links)
+            })
+            layer += 1
+
+
+INDEX_TYPES = {
+    FlatIndex.kind: FlatIndex,
+    IVFIndex.kind: IVFIndex,
+    HNSWIndex.kind: HNSWIndex,
+}
+
+
+def create_index(kind='flat', **params):
+    """
+    Create an empty index of the requested type.
+
+    Args:
+        kind (str): One of 'flat', 'ivf' or 'hnsw'
+        **params: Constructor arguments for the chosen index
+
+    Returns:
+        FlatIndex: The index instance
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](**params)
+
+
+def load_index(path, encodings, fingerprint=None, sq_norms=None):
+    """
+    Load a saved index and attach it to the gallery it was built from.
+
+    Args:
+        path (str or Path): Path to the .npz index file
+        encodings (numpy.ndarray): The current gallery matrix
+        fingerprint (str): The gallery's stored fingerprint; without it the
+            matrix is read to compute one
+        sq_norms (numpy.ndarray): The gallery's stored squared row norms
+
+    Returns:
+        FlatIndex: The loaded index, or None if it is missing or stale
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            state = {key: data[key] for key in data.files}
+    except (OSError, ValueError):
+        return None
+
+    kind = str(state.pop('kind'))
+    saved_fingerprint = str(state.pop('fingerprint'))
+    if kind not in INDEX_TYPES or saved_fingerprint != (fingerprint or gallery_fingerprint(encodings)):
+        return None
+
+    index = INDEX_TYPES[kind]()
+    index._attach(encodings, sq_norms)
+    index.fingerprint = saved_fingerprint
+    index._load_state(state)
+    return index
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+COMPACTION_METHODS = ('centroid', 'medoid')
+
+
+def _pairwise_distances(a, b):
+    sq = np.einsum('ij,ij->i', a, a)[:, None] + np.einsum('ij,ij->i', b, b)[None, :] - 2.0 * (a @ b.T)
+    return np.sqrt(np.maximum(sq, 0.0))
+
+
+def _k_medoids(points, k, n_iter=10):
+    """Small k-medoids (alternating assignment/update) for one identity's encodings."""
+    dists = _pairwise_distances(points, points)
+    k = min(k, len(points))
+
+    # Deterministic farthest-first seeding starting from the most central point
+    medoids = [int(np.argmin(dists.sum(axis=1)))]
+    while len(medoids) < k:
+        medoids.append(int(np.argmax(dists[:, medoids].min(axis=1))))
+
+    for _ in range(n_iter):
+        assignment = np.argmin(dists[:, medoids], axis=1)
+        new_medoids = []
+        for cluster in range(k):
+            members = np.flatnonzero(assignment == cluster)
+            if not len(members):
+                new_medoids.append(medoids[cluster])
+                continue
+            costs = dists[np.ix_(members, members)].sum(axis=1)
+            new_medoids.append(int(members[np.argmin(costs)]))
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+
+    return points[medoids]
+
+
+def compact_identities(encodings, names, method='centroid', k=3):
+    """
+    Reduce each identity's encodings to a few prototypes.
+
+    Args:
+        encodings (list or numpy.ndarray): Raw face encodings
+        names (list): Identity label for each encoding
+        method (str): 'centroid' for one mean vector per identity or 'medoid'
+            for up to k representative encodings per identity
+        k (int): Prototypes per identity when method is 'medoid'
+
+    Returns:
+        dict: 'encodings' (P, 128) prototype matrix, 'names' label per prototype
+            and 'radii' mapping each identity to the largest distance from any of
+            its raw encodings to its nearest prototype
+    """
+    if method not in COMPACTION_METHODS:
+        raise ValueError(f"Unknown compaction method '{method}', expected one of {COMPACTION_METHODS}")
+
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+    names = np.asarray(names, dtype=object)
+
+    proto_encodings, proto_names, radii = [], [], {}
+    for name in dict.fromkeys(names.tolist()):
+        points = encodings[names == name]
+        if method == 'centroid':
+            protos = points.mean(axis=0, keepdims=True)
+        else:
+            protos = _k_medoids(points, k)
+
+        radii[name] = float(_pairwise_distances(points, protos).min(axis=1).max())
+        proto_encodings.append(protos)
+        proto_names.extend([name] * len(protos))
+
+    if proto_encodings:
+        proto_matrix = np.ascontiguousarray(np.vstack(proto_encodings), dtype=np.float32)
+    else:
+        proto_matrix = np.empty((0, 128), dtype=np.float32)
+
+    return {
+        'encodings': proto_matrix,
+        'names': proto_names,
+        'radii': radii,
+        'method': method,
+    }
@@ -0,0 +1,29 @@
+import time
+
+
+class ModelSnapshot:
+    """
+    One fully built model version: gallery, matching index and prototypes.
+
+    The recognizer swaps whole snapshots with a single attribute assignment,
+    so a request that grabbed a snapshot keeps matching against a consistent
+    gallery/index/name set even while a newer model is being loaded.
+    """
+
+    def __init__(self, gallery, index, prototypes=None, prototype_radii=None, generation=None, version=0):
+        """
+        Args:
+            gallery (FaceGallery): Raw encodings and names
+            index: Matching index built over the gallery
+            prototypes (FaceGallery): Optional identity prototypes
+            prototype_radii (dict): Per-identity radius for prototype pruning
+            generation (tuple): Signature of the model file this was loaded from
+            version (int): Monotonic counter of snapshots loaded by this process
+        """
+        self.gallery = gallery
+        self.index = index
+        self.prototypes = prototypes
+        self.prototype_radii = prototype_radii or {}
+        self.generation = generation
+        self.version = version
+        self.loaded_at = time.time()
@@ -0,0 +1,241 @@
+import json
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src.CMS.face_recognition.models.index import gallery_fingerprint
+
+
+MAGIC = b'CMSFACE\x00'
+FORMAT_VERSION = 1
+# magic, format version, reserved, section directory offset, section directory length
+HEADER = struct.Struct('<8sII QQ')
+ALIGNMENT = 64
+
+
+class EncodingStore:
+    """
+    Versioned binary file holding a face gallery.
+
+    Layout::
+
+        header     magic, format version, offset/length of the section directory
+        sections   64-byte aligned blobs: the float32 (N, 128) encodings matrix,
+                   its squared norms, int32 identity ids per row, and JSON tables
+                   (identity names, per-row source metadata, prototype info,
+                   and the gallery fingerprint)
+        directory  JSON mapping section name -> offset, length, dtype, shape
+
+    Array sections are opened with ``np.memmap`` so every worker process maps
+    the same page-cache copy and opening does not depend on gallery size.
+    The fingerprint is computed once when writing, so readers can check a
+    saved index against the gallery without touching the matrix.
+    """
+
+    def __init__(self, path, sections, arrays, tables):
+        self.path = Path(path)
+        self._sections = sections
+        self._arrays = arrays
+        self._tables = tables
+
+    @staticmethod
+    def write(path, encodings, names, rows=None, prototypes=None, fingerprint=None):
+        """
+        Write a gallery to disk atomically.
+
+        Args:
+            path (str or Path): Destination file
+            encodings (list or numpy.ndarray): Face encodings, one per row
+            names (list): Identity label for each row
+            rows (list): Optional JSON-serializable metadata per row (e.g. source file)
+            prototypes (dict): Optional output of ``compact_identities``
+            fingerprint (str): The encodings' gallery_fingerprint, if already computed
+
+        Returns:
+            str: The gallery fingerprint stored with it
+        """
+        path = Path(path)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        identities = list(dict.fromkeys(names))
+        identity_lookup = {name: i for i, name in enumerate(identities)}
+        identity_ids = np.array([identity_lookup[name] for name in names], dtype=np.int32)
+
+        arrays = {
+            'encodings': encodings,
+            'sq_norms': np.einsum('ij,ij->i', encodings, encodings).astype(np.float32),
+            'identity_ids': identity_ids,
+        }
+        fingerprint = fingerprint or gallery_fingerprint(encodings)
+        tables = {
+            'identities': identities,
+            'rows': rows if rows is not None else [None] * len(encodings),
+            'info': {'fingerprint': fingerprint},
+        }
+
+        if prototypes is not None:
+            for name in prototypes['names']:
+                if name not in identity_lookup:
+                    identity_lookup[name] = len(identities)
+                    identities.append(name)
+            arrays['prototype_encodings'] = np.asarray(prototypes['encodings'], dtype=np.float32).reshape(-1, 128)
+            arrays['prototype_identity_ids'] = np.array(
+                [identity_lookup[name] for name in prototypes['names']], dtype=np.int32
+            )
+            tables['prototypes'] = {'method': prototypes.get('method'), 'radii': prototypes['radii']}
+
+        sections = {}
+        # A unique temporary file per writer, so concurrent writers never share one
+        f = tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + '.', suffix='.tmp', delete=False)
+        tmp_path = f.name
+        try:
+            with f:
+                f.write(b'\x00' * HEADER.size)
+
+                for name, array in arrays.items():
+                    offset = EncodingStore._pad(f)
+                    data = np.ascontiguousarray(array)
+                    f.write(data.tobytes())
+                    sections[name] = {
+                        'offset': offset,
+                        'length': data.nbytes,
+                        'dtype': data.dtype.str,
+                        'shape': list(data.shape),
+                    }
+
+                for name, table in tables.items():
+                    offset = EncodingStore._pad(f)
+                    data = json.dumps(table).encode('utf-8')
+                    f.write(data)
+                    sections[name] = {'offset': offset, 'length': len(data), 'format': 'json'}
+
+                directory = json.dumps(sections).encode('utf-8')
+                directory_offset = EncodingStore._pad(f)
+                f.write(directory)
+
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, directory_offset, len(directory)))
+                f.flush()
+                os.fsync(f.fileno())
+
+            # NamedTemporaryFile creates the file owner-only; keep the store readable like before
+            os.chmod(tmp_path, 0o644)
+            # Readers that already mapped the old file keep their inode; new opens see the new one
+            os.replace(tmp_path, path)
+        except BaseException:
+            f.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return fingerprint
+
+    @staticmethod
+    def _pad(f):
+        offset = f.tell()
+        remainder = offset % ALIGNMENT
+        if remainder:
+            f.write(b'\x00' * (ALIGNMENT - remainder))
+            offset += ALIGNMENT - remainder
+        return offset
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """
+        Open a store, mapping its arrays instead of reading them.
+
+        Args:
+            path (str or Path): Store file
+            mmap (bool): Map arrays read-only; if False they are read into memory
+
+        Returns:
+            EncodingStore: The opened store
+        """
+        path = Path(path)
+        with open(path, 'rb') as f:
+            magic, version, _, directory_offset, directory_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a face encoding store")
+            if version > FORMAT_VERSION:
+                raise ValueError(f"{path} uses store format v{version}, this build reads up to v{FORMAT_VERSION}")
+            f.seek(directory_offset)
+            sections = json.loads(f.read(directory_length).decode('utf-8'))
+
+        arrays = {}
+        for name, section in sections.items():
+            if section.get('format') == 'json':
+                continue
+            dtype = np.dtype(section['dtype'])
+            shape = tuple(section['shape'])
+            if not section['length']:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=section['offset'], shape=shape)
+            else:
+                with open(path, 'rb') as f:
+                    f.seek(section['offset'])
+                    arrays[name] = np.frombuffer(f.read(section['length']), dtype=dtype).reshape(shape)
+
+        return cls(path, sections, arrays, {})
+
+    def _table(self, name):
+        """Parse a JSON section on first use; row metadata is only needed by the trainer."""
+        if name not in self._tables:
+            section = self._sections.get(name)
+            if section is None:
+                self._tables[name] = None
+            else:
+                with open(self.path, 'rb') as f:
+                    f.seek(section['offset'])
+                    self._tables[name] = json.loads(f.read(section['length']).decode('utf-8'))
+        return self._tables[name]
+
+    def __len__(self):
+        return self._arrays['encodings'].shape[0]
+
+    @property
+    def encodings(self):
+        return self._arrays['encodings']
+
+    @property
+    def sq_norms(self):
+        return self._arrays['sq_norms']
+
+    @property
+    def identity_ids(self):
+        return self._arrays['identity_ids']
+
+    @property
+    def identities(self):
+        return self._table('identities')
+
+    @property
+    def names(self):
+        """Identity label per row."""
+        return np.asarray(self.identities, dtype=object)[self.identity_ids].tolist()
+
+    @property
+    def fingerprint(self):
+        """Gallery fingerprint recorded at write time, or None for stores written before it was."""
+        info = self._table('info')
+        return info.get('fingerprint') if info else None
+
+    @property
+    def rows(self):
+        """Per-row metadata as written by the trainer."""
+        return self._table('rows')
+
+    @property
+    def prototypes(self):
+        """Prototype gallery in the ``compact_identities`` layout, or None if not compacted."""
+        info = self._table('prototypes')
+        if info is None:
+            return None
+        identities = np.asarray(self.identities, dtype=object)
+        return {
+            'encodings': self._arrays['prototype_encodings'],
+            'names': identities[self._arrays['prototype_identity_ids']].tolist(),
+            'radii': info['radii'],
+            'method': info['method'],
+        }
@@ -0,0 +1,271 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from src.CMS.logging import logger
+from src.CMS.face_recognition.streaming import LatestFrameSlot
+
+
+class StageTimings:
+    """Thread-safe per-stage timing, to see where the frame budget goes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def summary(self):
+        """Per stage: count, average and max milliseconds, total seconds."""
+        with self._lock:
+            return {
+                stage: {
+                    'count': count,
+                    'avg_ms': round(total / count * 1000, 2) if count else 0.0,
+                    'max_ms': round(peak * 1000, 2),
+                    'total_s': round(total, 3),
+                }
+                for stage, (count, total, peak) in self._stages.items()
+            }
+
+
+class PacedCapture:
+    """Wraps a video-file capture so frames are delivered at the file's own frame rate, like a camera."""
+
+    def __init__(self, capture, fps=None):
+        self.capture = capture
+        fps = fps or capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.interval = 1.0 / fps
+        self._next = None
+
+    def read(self):
+        now = time.perf_counter()
+        if self._next is not None and now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next or now) + self.interval
+        return self.capture.read()
+
+    def release(self):
+        self.capture.release()
+
+
+class SyntheticSource:
+    """Generated frames with a moving bright square, for exercising the pipeline without a camera."""
+
+    def __init__(self, width=640, height=480, fps=30.0, frames=300):
+        """
+        Args:
+            width (int): Frame width
+            height (int): Frame height
+            fps (float): Delivery rate; None delivers frames as fast as they are read
+            frames (int): Frames before the source ends; None never ends
+        """
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps if fps else 0.0
+        self.frames = frames
+        self._count = 0
+        self._next = None
+
+    def read(self):
+        if self.frames is not None and self._count >= self.frames:
+            return False, None
+        if self.interval:
+            now = time.perf_counter()
+            if self._next is not None and now < self._next:
+                time.sleep(self._next - now)
+            self._next = max(now, self._next or now) + self.interval
+
+        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        size = min(self.width, self.height) // 4
+        x = (self._count * 5) % max(1, self.width - size)
+        y = (self.height - size) // 2
+        frame[y:y + size, x:x + size] = 255
+        self._count += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def open_source(source, realtime=True):
+    """
+    Open a frame source.
+
+    Args:
+        source: Camera index, video file path, or an object with read()/release()
+        realtime (bool): Pace video files at their frame rate
+
+    Returns:
+        Object with read() -> (ok, frame) and release()
+    """
+    if isinstance(source, int):
+        return cv2.VideoCapture(source)
+    if isinstance(source, str):
+        capture = cv2.VideoCapture(source)
+        return PacedCapture(capture) if realtime else capture
+    return source
+
+
+class FramePipeline:
+    """
+    Three-stage frame pipeline: grab, infer, render.
+
+    A grabber thread reads the source continuously and keeps only the latest
+    frame, so camera I/O never waits for inference. Inference workers take
+    the newest frame, run ``process(frame)`` and hand the result to a bounded
+    queue (the oldest result is dropped when it is full). The render stage
+    runs on the calling thread, as OpenCV's highgui requires, and calls
+    ``render(frame, result)``; returning False stops the pipeline.
+
+    ``process`` must be thread-safe when ``workers`` is greater than one.
+    """
+
+    def __init__(self, source, process, render, workers=1, queue_size=2, realtime=True):
+        """
+        Args:
+            source: Camera index, video file path, or frame source object (see open_source)
+            process (callable): process(frame) -> result, run in the inference workers
+            render (callable): render(frame, result) -> bool, run on the calling thread
+            workers (int): Inference worker threads
+            queue_size (int): Results waiting to be rendered
+            realtime (bool): Pace video files at their frame rate
+        """
+        self.source = open_source(source, realtime)
+        self.process = process
+        self.render = render
+        self.workers = max(1, workers)
+        self.timings = StageTimings()
+        self.grabbed = 0
+        self.rendered = 0
+        self.dropped_results = 0
+        self._frames = LatestFrameSlot()
+        self._results = queue.Queue(maxsize=queue_size)
+        self._results_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def dropped_frames(self):
+        """Frames replaced by a newer one before any worker took them."""
+        return self._frames.dropped
+
+    def stop(self):
+        self._stop.set()
+        self._frames.close()
+
+    def _grab(self):
+        try:
+            while not self._stop.is_set():
+                with self.timings.time('grab'):
+                    ok, frame = self.source.read()
+                if not ok:
+                    break
+                self._frames.put(self.grabbed, (frame, time.perf_counter()))
+                self.grabbed += 1
+        except Exception as e:
+            logger.error(f"Frame grabber failed: {e}")
+        finally:
+            self._frames.close()
+
+    def _infer(self):
+        while not self._stop.is_set():
+            item = self._frames.get(timeout=0.1)
+            if item is None:
+                if self._frames.closed:
+                    return
+                continue
+            seq, (frame, grabbed_at) = item
+            try:
+                with self.timings.time('inference'):
+                    result = self.process(frame)
+            except Exception as e:
+                logger.error(f"Inference failed on frame {seq}: {e}")
+                continue
+            self._offer((seq, frame, grabbed_at, result))
+
+    def _offer(self, item):
+        with self._results_lock:
+            while True:
+                try:
+                    self._results.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self._results.get_nowait()
+                        self.dropped_results += 1
+                    except queue.Empty:
+                        pass
+
+    def run(self):
+        """
+        Run until the source ends or render returns False.
+
+        Returns:
+            dict: Stage timings (see StageTimings.summary) plus frame counters
+        """
+        threads = [threading.Thread(target=self._grab, name='frame-grabber', daemon=True)]
+        threads += [
+            threading.Thread(target=self._infer, name=f'inference-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        workers = threads[1:]
+
+        last_seq = -1
+        try:
+            while not self._stop.is_set():
+                try:
+                    seq, frame, grabbed_at, result = self._results.get(timeout=0.1)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+                    continue
+
+                # With several workers results can finish out of order; never go back in time
+                if seq < last_seq:
+                    self.dropped_results += 1
+                    continue
+                last_seq = seq
+
+                with self.timings.time('render'):
+                    keep_going = self.render(frame, result)
+                self.timings.record('latency', time.perf_counter() - grabbed_at)
+                self.rendered += 1
+                if keep_going is False:
+                    break
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join(timeout=2)
+            self.source.release()
+
+        return self.report()
+
+    def report(self):
+        report = {
+            'stages': self.timings.summary(),
+            'frames_grabbed': self.grabbed,
+            'frames_dropped': self.dropped_frames,
+            'results_dropped': self.dropped_results,
+            'frames_rendered': self.rendered,
+        }
+        logger.info(f"Frame pipeline: {report}")
+        return report
@@ -1,114 +1,349 @@
 import cv2
-import face_recognition
 import pickle
 from pathlib import Path
 import numpy as np
 from src.CMS.logging import logger
-from src.CMS.face_recognition.utils.preprocessor import FacePreprocessor
+from src.CMS.face_recognition import registry
+from src.CMS.face_recognition.utils.frame_analysis import FrameAnalyzer
+from src.CMS.face_recognition.utils.decoding import decode_image
+from src.CMS.face_recognition.utils.tracking import FaceTracker
+from src.CMS.face_recognition.pipeline import FramePipeline
+from src.CMS.face_recognition.models.gallery import FaceGallery
+from src.CMS.face_recognition.models.index import create_index, load_index
+from src.CMS.face_recognition.models.store import EncodingStore
+from src.CMS.face_recognition.models.snapshot import ModelSnapshot
+from src.CMS.face_recognition.liveness import BlinkState, InMemoryLivenessStore
 import os
-import dlib
+import threading
+import time
 from scipy.spatial import distance as dist
 
 class FaceRecognizer:
     """Class for real-time face recognition using trained model."""
     
-    def __init__(self, tolerance=0.6):
+    def __init__(self, tolerance=0.6, index_type='flat', index_params=None,
+                 two_stage=False, candidate_identities=5, reload_interval=2.0,
+                 liveness_store=None, pixel_budget=640 * 480):
         """
         Initialize the face recognizer.
         
         Args:
             tolerance (float): Face recognition tolerance (lower is more strict)
+            index_type (str): Matching index: 'flat' (exact), 'ivf' or 'hnsw' (approximate)
+            index_params (dict): Index options, e.g. {'nprobe': 8} for 'ivf' or
+                {'ef_search': 50} for 'hnsw'; larger values trade latency for recall
+            two_stage (bool): Match against the saved identity prototypes first and
+                re-rank the raw encodings of the closest identities only
+            candidate_identities (int): Identities re-ranked in the second stage
+            reload_interval (float): Minimum seconds between checks of the model
+                file for a newer version (see maybe_reload)
+            liveness_store (LivenessStore): Per-session blink state for
+                recognize_single_face; defaults to an in-process TTL store
+            pixel_budget (int): Pixels detection runs on for encoded API images
+                (see decode); faces are still encoded at full resolution
         """
         self.project_root = Path(__file__).parent.parent.parent.parent
-        self.model_path = self.project_root / 'data' / 'face_data' / 'models' / 'face_recognition_model.pkl'
+        self.model_path = self.project_root / 'data' / 'face_data' / 'models' / 'face_encodings.bin'
+        self.legacy_model_path = self.model_path.parent / 'face_recognition_model.pkl'
+        self.index_path = self.model_path.parent / 'face_index.npz'
         self.tolerance = tolerance
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.preprocessor = FacePreprocessor()
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.snapshot = ModelSnapshot(FaceGallery([], []), create_index(self.index_type, **self.index_params))
+        self.two_stage = two_stage
+        self.candidate_identities = candidate_identities
+        self.reload_interval = reload_interval
+        self._last_reload_check = 0.0
+        self._reload_lock = threading.Lock()
         self.liveness_confirmed = False
         self.recognition_confirmed = False
         self.model_loaded = False
-        self.detector = dlib.get_frontal_face_detector()
-        self.predictor = dlib.shape_predictor("data/shape_predictor/shape_predictor_68_face_landmarks.dat")
+        self.detector = registry.face_detector()
+        self.predictor = registry.shape_predictor()
+        self.analyzer = FrameAnalyzer(self.detector, self.predictor)
         self.EYE_AR_THRESH = 0.3
         self.MIN_BLINKS = 1
-        self.blink_counter = 0
-        self.blink_started = False
-        self.last_ear = 1.0
+        # Blink state for the desktop loop and callers that pass no session
+        self.blink_state = BlinkState()
+        self.liveness_store = liveness_store or InMemoryLivenessStore()
+        self.pixel_budget = pixel_budget
         
+    @property
+    def blink_counter(self):
+        return self.blink_state.blink_counter
+
+    @property
+    def blink_started(self):
+        return self.blink_state.blink_started
+
+    @property
+    def last_ear(self):
+        return self.blink_state.last_ear
+
+    @property
+    def gallery(self):
+        return self.snapshot.gallery
+
+    @property
+    def index(self):
+        return self.snapshot.index
+
+    @property
+    def prototypes(self):
+        return self.snapshot.prototypes
+
+    @property
+    def known_face_encodings(self):
+        return self.snapshot.gallery.encodings
+
+    @property
+    def known_face_names(self):
+        return self.snapshot.gallery.names
+
+    def model_signature(self):
+        """Identity of the model file on disk; it changes whenever the trainer replaces it."""
+        path = self.model_path if self.model_path.exists() else self.legacy_model_path
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (str(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
     def load_model(self):
-        """Load the trained model from disk."""
-        if not self.model_path.exists():
+        """
+        Load the trained model from disk and swap it in atomically.
+        
+        The new snapshot is fully built before it replaces the current one, so
+        concurrent recognitions never see a half-loaded model.
+        """
+        if not self.model_path.exists() and not self.legacy_model_path.exists():
             logger.error(f"Model file not found: {self.model_path}")
             return False
             
         try:
-            with open(self.model_path, 'rb') as f:
-                data = pickle.load(f)
-                self.known_face_encodings = data['encodings']
-                self.known_face_names = data['names']
+            generation = self.model_signature()
+            if self.model_path.exists():
+                # Zero-copy: the gallery matrix stays a read-only mapping of the store file
+                store = EncodingStore.open(self.model_path)
+                gallery = FaceGallery.from_store(store)
+                prototypes = store.prototypes
+            else:
+                with open(self.legacy_model_path, 'rb') as f:
+                    data = pickle.load(f)
+                gallery = FaceGallery(data['encodings'], data['names'])
+                prototypes = data.get('prototypes')
+
+            snapshot = ModelSnapshot(
+                gallery,
+                self.load_index(gallery),
+                prototypes=FaceGallery(prototypes['encodings'], prototypes['names']) if prototypes else None,
+                prototype_radii=prototypes['radii'] if prototypes else None,
+                generation=generation,
+                version=self.snapshot.version + 1
+            )
+            self.snapshot = snapshot
             self.model_loaded = True
-            logger.info(f"Model loaded with {len(self.known_face_encodings)} encodings")
+            logger.info(f"Model v{snapshot.version} loaded with {len(gallery)} encodings")
             return True
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             return False
+
+    def maybe_reload(self):
+        """
+        Reload the model if another process has saved a newer version.
+
+        Checks the model file at most every reload_interval seconds, so it is
+        cheap to call on every request. The reload runs in a background
+        thread and requests keep matching against the current snapshot until
+        the new one is swapped in; only the very first load, when there is
+        nothing to serve yet, happens in the calling thread.
+
+        Returns:
+            bool: True if a reload was started (or, for the first load, completed)
+        """
+        now = time.monotonic()
+        if now - self._last_reload_check < self.reload_interval:
+            return False
+        self._last_reload_check = now
+
+        signature = self.model_signature()
+        if signature is None or signature == self.snapshot.generation:
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+
+        if not self.model_loaded:
+            try:
+                return self.load_model()
+            finally:
+                self._reload_lock.release()
+
+        def reload():
+            try:
+                logger.info("Model file changed on disk, reloading in the background")
+                self.load_model()
+            finally:
+                self._reload_lock.release()
+
+        threading.Thread(target=reload, name='model-reload', daemon=True).start()
+        return True
     
+    def load_index(self, gallery):
+        """
+        Load the matching index the trainer saved with the model.
+
+        Approximate indexes are built at training time (see
+        FaceModelTrainer.save_model), never here: building an HNSW graph
+        for a large gallery would stall the reload. If the saved index is
+        missing, stale or of another type, matching falls back to the exact
+        flat index until the next training run.
+        """
+        index = None
+        if self.index_path.exists():
+            # The store's recorded fingerprint and norms spare reading the matrix
+            index = load_index(self.index_path, gallery.encodings, gallery.fingerprint, gallery.sq_norms)
+
+        if index is not None and index.kind == self.index_type:
+            # Query-time knobs may change without rebuilding the index
+            for key in ('nprobe', 'ef_search'):
+                if key in self.index_params:
+                    setattr(index, key, self.index_params[key])
+            logger.info(f"Loaded {index.kind} index from {self.index_path}")
+            return index
+
+        if self.index_type != 'flat':
+            logger.warning(f"No current {self.index_type} index at {self.index_path}; "
+                           f"using exact matching until the trainer saves one")
+        return create_index('flat').build(gallery.encodings, gallery.fingerprint, gallery.sq_norms)
+
+    def match_face(self, face_encoding, snapshot=None):
+        """
+        Find the nearest known identity for a face encoding using the active index.
+
+        Args:
+            face_encoding (numpy.ndarray): Face encoding to match
+            snapshot (ModelSnapshot): Model version to match against; defaults
+                to the current one
+
+        Returns:
+            tuple: (name, distance), or (None, inf) if nothing is indexed
+        """
+        snapshot = snapshot or self.snapshot
+        if self.two_stage and snapshot.prototypes is not None:
+            return self.match_face_two_stage(face_encoding, snapshot)
+
+        ids, distances = snapshot.index.search(face_encoding, k=1)
+        if not len(ids):
+            return None, float('inf')
+        return snapshot.gallery.names[ids[0]], float(distances[0])
+
+    def match_face_two_stage(self, face_encoding, snapshot):
+        """
+        Match against identity prototypes, then re-rank raw encodings of the
+        closest candidate identities.
+
+        An identity is skipped when its nearest prototype is further than
+        tolerance + radius away: by the triangle inequality none of its raw
+        encodings can then be within tolerance.
+        """
+        per_identity = max(1, len(snapshot.prototypes) // max(1, len(snapshot.prototypes.rows_by_name)))
+        candidates = snapshot.prototypes.top_k(face_encoding, k=self.candidate_identities * per_identity)
+
+        identities = []
+        for _, name, distance in candidates:
+            if name in identities:
+                continue
+            if distance - snapshot.prototype_radii.get(name, 0.0) > self.tolerance:
+                continue
+            identities.append(name)
+            if len(identities) == self.candidate_identities:
+                break
+
+        if not identities:
+            return None, float('inf')
+
+        rows = np.concatenate([snapshot.gallery.rows_by_name[name] for name in identities])
+        _, name, distance = snapshot.gallery.nearest_in(face_encoding, rows)
+        return name, distance
+
     def is_model_loaded(self):
         return self.model_loaded
     
-    def recognize_faces(self):
-        """Run real-time face recognition using webcam."""
-        if not self.known_face_encodings:
+    def recognize_faces(self, detect_every=5, source=0, workers=1):
+        """
+        Run real-time face recognition using webcam.
+
+        Frames are grabbed, analysed and displayed in separate stages (see
+        FramePipeline), so camera I/O, inference and drawing do not stall
+        each other.
+
+        Args:
+            detect_every (int): Frames between full face detections; boxes are
+                tracked in between and a face is only encoded when its track is new
+            source: Camera index, video file path or frame source object
+            workers (int): Inference threads; tracking is sequential, but
+                encoding and matching new faces overlap with it
+
+        Returns:
+            dict: Per-stage timings and frame counters
+        """
+        if not len(self.gallery):
             logger.error("No face encodings loaded. Please load model first.")
             return
         
-        cap = cv2.VideoCapture(0)
-        process_this_frame = True
+        tracker = FaceTracker(self.detector, self.predictor, detect_every=detect_every)
+        tracker_lock = threading.Lock()
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                logger.error("Failed to grab frame from camera")
-                break
-            
-            if process_this_frame:
-                # Process frame with liveness detection
-                face_locations, face_encodings, liveness_detected, blink_count = self.preprocessor.process_frame(frame)
-                
-                face_names = []
-                for face_encoding in face_encodings:
-                    name = self.identify_face(face_encoding)
-                    face_names.append(name)
-                    if name != "Unknown":
-                        logger.info(f"Person recognized: {name}")
-                        if liveness_detected:
-                            logger.info(f"Liveness confirmed for {name} (Blinks: {blink_count})")
-                            self.liveness_confirmed = True
-                            self.recognition_confirmed = True
-            
-            process_this_frame = not process_this_frame
-            
+        def process(frame):
+            # Only the tracker and blink state are shared between frames; the
+            # ResNet encoding and gallery match run outside the lock, so with
+            # several workers one frame is encoded while the next is tracked
+            with tracker_lock:
+                # Landmarks are fitted on every tracked box, so blinks are still seen between detections
+                analysis, tracks = tracker.update(frame)
+                liveness_detected = self.detect_blink(frame, analysis)
+                blink_count = self.blink_counter
+                tracked = [(track, track.face) for track in tracks if track.face is not None]
+                # Identify new tracks; unknown faces get another try on detection frames
+                pending = [
+                    (track, face) for track, face in tracked
+                    if track.name is None or (tracker.detected and track.name == "Unknown")
+                ]
+
+            names = {track.id: self.identify_face(face.encoding) for track, face in pending}
+
+            with tracker_lock:
+                for track, _ in pending:
+                    track.name = names[track.id]
+                    if track.name != "Unknown":
+                        logger.info(f"Person recognized: {track.name}")
+                for track, _ in tracked:
+                    if track.name not in (None, "Unknown") and liveness_detected and not self.recognition_confirmed:
+                        logger.info(f"Liveness confirmed for {track.name} (Blinks: {blink_count})")
+                        self.liveness_confirmed = True
+                        self.recognition_confirmed = True
+
+            face_locations = [face.location for face in analysis.faces]
+            # A track another worker is still identifying is drawn as Unknown for this frame
+            face_names = [names.get(track.id, track.name) or "Unknown" for track, _ in tracked]
+            return face_locations, face_names, liveness_detected, blink_count
+        
+        def render(frame, result):
             # Draw results with liveness information
-            self.draw_results(frame, face_locations, face_names, liveness_detected, blink_count)
-            
-            if self.handle_keys():
-                break
+            self.draw_results(frame, *result)
+            return not self.handle_keys()
         
-        cap.release()
+        report = FramePipeline(source, process, render, workers=workers).run()
+        logger.info(f"Ran face detection on {tracker.detections} of {tracker.frames} frames")
         cv2.destroyAllWindows()
+        return report
     
     def identify_face(self, face_encoding):
-        """Identify a face encoding against known faces."""
-        matches = face_recognition.compare_faces(
-            self.known_face_encodings, face_encoding, tolerance=self.tolerance
-        )
-        name = "Unknown"
-        
-        if True in matches:
-            first_match_index = matches.index(True)
-            name = self.known_face_names[first_match_index]
-        
+        """Identify a face encoding against known faces, returning the nearest match."""
+        name, distance = self.match_face(face_encoding)
+        if name is None or distance > self.tolerance:
+            return "Unknown"
         return name
     
     def draw_results(self, frame, face_locations, face_names, liveness_detected, blink_count):
@@ -155,100 +390,192 @@ class FaceRecognizer:
         ear = (A + B) / (2.0 * C)
         return ear
 
-    def detect_blink(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.detector(gray)
+    def detect_blink(self, frame, analysis=None, state=None):
+        """
+        Advance the blink state machine with one frame.
         
-        for face in faces:
-            landmarks = self.predictor(gray, face)
-            
-            left_eye = [(landmarks.part(n).x, landmarks.part(n).y) for n in range(36, 42)]
-            right_eye = [(landmarks.part(n).x, landmarks.part(n).y) for n in range(42, 48)]
-            
-            left_ear = self.eye_aspect_ratio(left_eye)
-            right_ear = self.eye_aspect_ratio(right_eye)
-            ear = (left_ear + right_ear) / 2.0
+        Args:
+            frame (numpy.ndarray): BGR frame
+            analysis (FrameAnalysis): Existing analysis of frame, to reuse its landmarks
+            state (BlinkState): Session state to update; defaults to this recognizer's own
+        """
+        if analysis is None:
+            analysis = self.analyzer.analyze(frame)
+        if state is None:
+            state = self.blink_state
+        
+        for face in analysis.faces:
+            ear = face.ear
             
             # Detect blink using state machine
-            if not self.blink_started and ear < self.EYE_AR_THRESH:
-                self.blink_started = True
-            elif self.blink_started and ear > self.EYE_AR_THRESH:
-                self.blink_started = False
-                self.blink_counter += 1
+            if not state.blink_started and ear < self.EYE_AR_THRESH:
+                state.blink_started = True
+            elif state.blink_started and ear > self.EYE_AR_THRESH:
+                state.blink_started = False
+                state.blink_counter += 1
             
-            self.last_ear = ear
+            state.last_ear = ear
         
-        return self.blink_counter >= self.MIN_BLINKS
+        return state.blink_counter >= self.MIN_BLINKS
 
-    def recognize_single_face(self, image):
+    def decode(self, data, pixel_budget=None):
+        """
+        Decode an encoded image for recognition within the pixel budget.
+
+        Args:
+            data (bytes): Encoded image (JPEG/PNG)
+            pixel_budget (int): Overrides the recognizer's budget; 0 decodes at full size
+
+        Returns:
+            DecodedImage: Image to pass to recognize_single_face or
+                recognize_batch, or None if it could not be decoded
+        """
+        return decode_image(data, self.pixel_budget if pixel_budget is None else pixel_budget)
+
+    def recognize_single_face(self, image, session_id=None):
+        """
+        Recognize the face in one frame of a client's liveness session.
+        
+        Args:
+            image (numpy.ndarray or DecodedImage): BGR frame, or one from decode
+            session_id (str): Client session whose blink state this frame advances;
+                without one the recognizer's own state is used
+        """
         if not self.model_loaded:
             return {
                 'success': False,
                 'message': 'Model not loaded'
             }
 
-        # Check for blinks
-        blink_detected = self.detect_blink(image)
+        # Pin one model version for the whole request
+        snapshot = self.snapshot
+
+        # Detect faces and fit landmarks once; liveness and encoding share them
+        analysis = self.analyzer.analyze(image)
+
+        # Check for blinks in this client's own session
+        if session_id is not None:
+            state = self.liveness_store.get(session_id)
+            blink_detected = self.detect_blink(image, analysis, state)
+            self.liveness_store.put(session_id, state)
+        else:
+            state = self.blink_state
+            blink_detected = self.detect_blink(image, analysis, state)
         if not blink_detected:
             return {
                 'success': False,
                 'message': 'Liveness check failed - please blink naturally'
             }
 
-        # Convert image to RGB (face_recognition uses RGB)
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        # Find faces in the image
-        face_locations = face_recognition.face_locations(rgb_image)
-        
-        if not face_locations:
+        if not analysis.faces:
             return {
                 'success': False,
                 'message': 'No face detected in image'
             }
 
-        # Get face encodings
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-
-        if not face_encodings:
+        # Encode only the face we match, reusing its landmarks
+        try:
+            face_encoding = analysis.faces[0].encoding
+        except Exception as e:
+            logger.error(f"Error encoding face: {e}")
             return {
                 'success': False,
                 'message': 'Could not encode face features'
             }
 
-        # Compare with known faces
-        matches = face_recognition.compare_faces(
-            self.known_face_encodings, 
-            face_encodings[0], 
-            tolerance=self.tolerance
-        )
-        
-        if True in matches:
-            # Find distances to all known faces
-            face_distances = face_recognition.face_distance(
-                self.known_face_encodings, 
-                face_encodings[0]
-            )
-            best_match_index = np.argmin(face_distances)
-            
-            if matches[best_match_index]:
-                confidence = 1 - face_distances[best_match_index]
-                if confidence > 0.55:  # Confidence threshold
-                    return {
-                        'success': True,
-                        'userId': self.known_face_names[best_match_index],
-                        'confidence': float(confidence),
-                        'liveness_confirmed': True,
-                        'blinks': self.blink_counter  # Return current blink count
-                    }
+        # Nearest known face from the active index
+        name, distance = self.match_face(face_encoding, snapshot)
+
+        if name is not None and distance <= self.tolerance:
+            confidence = 1 - distance
+            if confidence > 0.55:  # Confidence threshold
+                return {
+                    'success': True,
+                    'userId': name,
+                    'confidence': float(confidence),
+                    'liveness_confirmed': True,
+                    'blinks': state.blink_counter  # Return current blink count
+                }
 
         return {
             'success': False,
             'message': 'Face not recognized or confidence too low'
         }
 
-    def reset_blink_counter(self):
-        """Reset the blink counter and state"""
-        self.blink_counter = 0
-        self.blink_started = False
-        self.last_ear = 1.0
\ No newline at end of file
+    def recognize_batch(self, images):
+        """
+        Recognize every face in a batch of images, e.g. a classroom group photo
+        or a burst of frames.
+
+        All faces are detected and encoded first, then matched against the
+        gallery together. Still images cannot show a blink, so no liveness
+        check is made here.
+
+        Args:
+            images (list): BGR images or DecodedImages from decode
+
+        Returns:
+            dict: Per-face results with image index, box, identity and confidence
+        """
+        if not self.model_loaded:
+            return {
+                'success': False,
+                'message': 'Model not loaded'
+            }
+
+        snapshot = self.snapshot
+        faces = []
+        for image_index, image in enumerate(images):
+            if image is None:
+                continue
+            for face in self.analyzer.analyze(image).faces:
+                try:
+                    faces.append((image_index, face.location, face.encoding))
+                except Exception as e:
+                    logger.error(f"Error encoding face in image {image_index}: {e}")
+
+        if not faces:
+            return {
+                'success': True,
+                'faces': [],
+                'recognizedUserIds': []
+            }
+
+        encodings = np.stack([encoding for _, _, encoding in faces])
+        if (self.two_stage and snapshot.prototypes is not None) or snapshot.index.kind != 'flat':
+            matches = [self.match_face(encoding, snapshot) for encoding in encodings]
+        else:
+            # Exact index: one matrix-matrix product for every face in the batch
+            indices, distances = snapshot.gallery.nearest_many(encodings)
+            matches = [
+                (snapshot.gallery.names[i] if i >= 0 else None, float(d))
+                for i, d in zip(indices, distances)
+            ]
+
+        results = []
+        recognized = []
+        for (image_index, (top, right, bottom, left), _), (name, distance) in zip(faces, matches):
+            confidence = 1 - distance if name is not None else 0.0
+            matched = name is not None and distance <= self.tolerance and confidence > 0.55
+            results.append({
+                'imageIndex': image_index,
+                'box': {'top': int(top), 'right': int(right), 'bottom': int(bottom), 'left': int(left)},
+                'recognized': matched,
+                'userId': name if matched else None,
+                'confidence': float(confidence) if matched else None
+            })
+            if matched and name not in recognized:
+                recognized.append(name)
+
+        return {
+            'success': True,
+            'faces': results,
+            'recognizedUserIds': recognized
+        }
+
+    def reset_blink_counter(self, session_id=None):
+        """Reset the blink counter and state, for one session if given"""
+        if session_id is not None:
+            self.liveness_store.delete(session_id)
+        else:
+            self.blink_state.reset()
\ No newline at end of file
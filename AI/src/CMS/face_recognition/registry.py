@@ -0,0 +1,160 @@
+"""
+Process-wide registry of the dlib / face_recognition models.
+
+Every component gets its detector, landmark predictor and face encoder from
+here, so each model is loaded lazily and at most once per process, from one
+resolved path. Calling ``preload()`` in a parent process before it forks
+(gunicorn ``--preload``) lets the children share the loaded models
+copy-on-write instead of loading their own.
+"""
+import importlib
+import os
+import threading
+import time
+from pathlib import Path
+
+from src.CMS.logging import logger
+
+
+PREDICTOR_FILENAME = 'shape_predictor_68_face_landmarks.dat'
+PREDICTOR_ENV_VAR = 'SHAPE_PREDICTOR_PATH'
+
+_project_root = Path(__file__).parent.parent.parent.parent
+
+_lock = threading.RLock()
+_models = {}
+_load_times = {}
+
+
+def predictor_candidates():
+    """Locations searched for the 68-point landmark model, in priority order."""
+    candidates = []
+    if os.getenv(PREDICTOR_ENV_VAR):
+        candidates.append(Path(os.getenv(PREDICTOR_ENV_VAR)))
+    candidates += [
+        # Where download_shape_predictor.py puts it
+        _project_root / 'data' / PREDICTOR_FILENAME,
+        _project_root / 'data' / 'shape_predictor' / PREDICTOR_FILENAME,
+        _project_root / 'src' / 'data' / PREDICTOR_FILENAME,
+        Path('data') / 'shape_predictor' / PREDICTOR_FILENAME,
+    ]
+    return candidates
+
+
+def _bundled_predictor_path():
+    try:
+        import face_recognition_models
+    except ImportError:
+        return None
+    return Path(face_recognition_models.pose_predictor_model_location()).resolve()
+
+
+def predictor_path():
+    """
+    The landmark model file every component uses.
+
+    Falls back to the copy bundled with face_recognition_models, which is the
+    same 68-point model, so a missing download no longer stops the service.
+
+    Returns:
+        Path: Resolved path, or None if no copy could be found
+    """
+    with _lock:
+        if 'predictor_path' not in _models:
+            path = next((candidate for candidate in predictor_candidates() if candidate.exists()), None)
+            if path is None:
+                path = _bundled_predictor_path()
+            _models['predictor_path'] = path.resolve() if path is not None else None
+            logger.info(f"Using shape predictor {_models['predictor_path']}")
+        return _models['predictor_path']
+
+
+def _get(name, loader):
+    with _lock:
+        if name not in _models:
+            started = time.perf_counter()
+            _models[name] = loader()
+            _load_times[name] = time.perf_counter() - started
+            logger.info(f"Loaded {name} in {_load_times[name]:.2f}s")
+        return _models[name]
+
+
+def face_recognition_api():
+    """
+    The ``face_recognition.api`` module, imported on first use; importing it
+    loads its own detector, predictors and ResNet once.
+    """
+    return _get('face_recognition', lambda: importlib.import_module('face_recognition.api'))
+
+
+def face_detector():
+    """dlib HOG frontal face detector."""
+    return _get('face_detector', lambda: face_recognition_api().face_detector)
+
+
+def face_encoder():
+    """dlib ResNet face recognition model used for 128-d encodings."""
+    return _get('face_encoder', lambda: face_recognition_api().face_encoder)
+
+
+def encoding_predictor():
+    """
+    dlib 5-point landmark predictor that aligns faces for encoding.
+
+    face_recognition.face_encodings uses it by default (model='small'), so
+    training encodes with it; live faces must be aligned the same way for
+    their distances to the gallery to be comparable.
+    """
+    return _get('encoding_predictor', lambda: face_recognition_api().pose_predictor_5_point)
+
+
+def shape_predictor():
+    """dlib 68-point landmark predictor from predictor_path()."""
+    def load():
+        import dlib
+
+        path = predictor_path()
+        if path is None:
+            raise FileNotFoundError(f"{PREDICTOR_FILENAME} not found; run download_shape_predictor.py")
+        if path == _bundled_predictor_path():
+            # face_recognition has already loaded this exact file
+            return face_recognition_api().pose_predictor_68_point
+        return dlib.shape_predictor(str(path))
+
+    return _get('shape_predictor', load)
+
+
+MODELS = {
+    'face_detector': face_detector,
+    'shape_predictor': shape_predictor,
+    'encoding_predictor': encoding_predictor,
+    'face_encoder': face_encoder,
+}
+
+
+def preload(names=None):
+    """
+    Load models now, e.g. in a parent process before it forks workers.
+
+    Args:
+        names (list): Models to load (keys of MODELS); all by default
+
+    Returns:
+        dict: Seconds spent loading each model in this process
+    """
+    started = time.perf_counter()
+    for name in names or MODELS:
+        MODELS[name]()
+    logger.info(f"Preloaded face models in {time.perf_counter() - started:.2f}s")
+    return load_times()
+
+
+def load_times():
+    """Seconds each model took to load in this process; models not loaded yet are absent."""
+    with _lock:
+        return dict(_load_times)
+
+
+def is_loaded(name):
+    with _lock:
+        return name in _models
@@ -0,0 +1,218 @@
+import json
+import math
+import threading
+import time
+
+from src.CMS.logging import logger
+
+
+class LatestFrameSlot:
+    """
+    Single-slot frame buffer where the newest frame wins.
+
+    The producer never blocks: a frame that has not been picked up yet is
+    replaced (and counted as dropped), so the consumer always works on the
+    most recent frame and latency stays bounded when inference is slower
+    than the camera.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, seq, frame):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._seq = seq
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Wait for the next frame.
+
+        Returns:
+            tuple: (seq, frame), or None once the slot is closed
+        """
+        with self._cond:
+            while self._frame is None and not self._closed:
+                if not self._cond.wait(timeout):
+                    return None
+            if self._frame is None:
+                return None
+            item = (self._seq, self._frame)
+            self._frame = self._seq = None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class FrameStrideController:
+    """
+    Adaptive every-Nth-frame sampling.
+
+    The stride is the smoothed processing time divided by the smoothed
+    interval between incoming frames, so the server only takes on as many
+    frames as it can finish. Clients that slow down to the suggested
+    interval end up at a stride of 1.
+    """
+
+    def __init__(self, frame_interval=0.2, max_stride=10, smoothing=0.3):
+        """
+        Args:
+            frame_interval (float): Expected seconds between client frames,
+                used until arrivals have been measured
+            max_stride (int): Upper bound on the stride
+            smoothing (float): Weight of the newest sample in the moving averages
+        """
+        self.max_stride = max_stride
+        self.smoothing = smoothing
+        self.avg_interval = frame_interval
+        self.avg_processing = None
+        self._last_arrival = None
+
+    def _smooth(self, average, sample):
+        return sample if average is None else average + self.smoothing * (sample - average)
+
+    def arrived(self, now=None):
+        """Record the arrival of a frame."""
+        now = time.time() if now is None else now
+        if self._last_arrival is not None:
+            self.avg_interval = self._smooth(self.avg_interval, now - self._last_arrival)
+        self._last_arrival = now
+
+    def record(self, seconds):
+        """Record the processing time of one frame."""
+        self.avg_processing = self._smooth(self.avg_processing, seconds)
+
+    @property
+    def stride(self):
+        if not self.avg_processing or self.avg_interval <= 0:
+            return 1
+        return max(1, min(self.max_stride, math.ceil(self.avg_processing / self.avg_interval)))
+
+    @property
+    def suggested_interval(self):
+        """Seconds between frames the client should aim for."""
+        return self.avg_processing
+
+    def accept(self, seq):
+        """Whether frame number seq should be processed at the current stride."""
+        return seq % self.stride == 0
+
+
+class RecognitionStream:
+    """
+    One streaming recognition session.
+
+    Frames arrive as binary JPEG/PNG messages through ``submit``; a worker
+    thread takes the latest accepted frame, runs ``recognize_single_face``
+    under the stream's liveness session and pushes the result back with
+    ``send``. Text messages are JSON control messages (``{"type": "reset"}``).
+    """
+
+    def __init__(self, recognizer, send, session_id, frame_interval=0.2, max_stride=10):
+        """
+        Args:
+            recognizer (FaceRecognizer): Shared recognizer
+            send (callable): Sends one text message to the client
+            session_id (str): Liveness session key
+            frame_interval (float): Expected seconds between client frames
+            max_stride (int): Upper bound on the adaptive frame stride
+        """
+        self.recognizer = recognizer
+        self.session_id = session_id
+        self.slot = LatestFrameSlot()
+        self.stride = FrameStrideController(frame_interval, max_stride)
+        self._send = send
+        self._send_lock = threading.Lock()
+        self.received = 0
+        self.skipped = 0
+        self.processed = 0
+        self._worker = threading.Thread(target=self._run, name=f'recognition-stream-{session_id}', daemon=True)
+
+    def start(self):
+        self._worker.start()
+        return self
+
+    def close(self):
+        self.slot.close()
+        self._worker.join(timeout=5)
+
+    def send(self, message):
+        with self._send_lock:
+            self._send(json.dumps(message))
+
+    def submit(self, message):
+        """Handle one message received from the client."""
+        if isinstance(message, str):
+            self._control(message)
+            return
+
+        seq = self.received
+        self.received += 1
+        self.stride.arrived()
+        if not self.stride.accept(seq):
+            self.skipped += 1
+            return
+        self.slot.put(seq, (message, time.time()))
+
+    def _control(self, message):
+        try:
+            command = json.loads(message)
+        except ValueError:
+            command = None
+        if not isinstance(command, dict):
+            self.send({'type': 'error', 'message': 'Invalid control message'})
+            return
+        if command.get('type') == 'reset':
+            self.recognizer.reset_blink_counter(self.session_id)
+            self.send({'type': 'reset', 'sessionId': self.session_id})
+
+    def _run(self):
+        while True:
+            item = self.slot.get()
+            if item is None:
+                return
+            seq, (payload, received_at) = item
+            started = time.time()
+            try:
+                image = self.recognizer.decode(payload)
+                if image is None:
+                    result = {'success': False, 'message': 'Could not decode frame'}
+                else:
+                    self.recognizer.maybe_reload()
+                    result = self.recognizer.recognize_single_face(image, session_id=self.session_id)
+            except Exception as e:
+                logger.error(f"Error in recognition stream {self.session_id}: {e}")
+                result = {'success': False, 'message': str(e)}
+
+            finished = time.time()
+            self.stride.record(finished - started)
+            self.processed += 1
+            result.update({
+                'type': 'result',
+                'frame': seq,
+                'latencyMs': round((finished - received_at) * 1000, 1),
+                'frameStride': self.stride.stride,
+                'suggestedIntervalMs': round(self.stride.suggested_interval * 1000),
+                'framesDropped': self.slot.dropped,
+                'framesSkipped': self.skipped,
+            })
+            try:
+                self.send(result)
+            except Exception as e:
+                logger.info(f"Recognition stream {self.session_id} closed: {e}")
+                self.slot.close()
+                return
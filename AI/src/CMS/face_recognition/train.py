@@ -1,53 +1,211 @@
-import face_recognition
 import pickle
 import os
 from pathlib import Path
 from src.CMS.logging import logger
 from src.CMS.face_recognition.utils.preprocessor import FacePreprocessor
+from src.CMS.face_recognition.models.prototypes import compact_identities
+from src.CMS.face_recognition.models.store import EncodingStore
+from src.CMS.face_recognition.models.encoding_table import EncodingTable
+from src.CMS.face_recognition.models.index import create_index, gallery_fingerprint
 import json
+import tempfile
 import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+_worker_preprocessor = None
+
+
+def _init_encoding_worker(niceness=0):
+    """Create one FacePreprocessor per pool process."""
+    global _worker_preprocessor
+    if niceness and hasattr(os, 'nice'):
+        # Background training yields the CPU to live recognition traffic
+        os.nice(niceness)
+    _worker_preprocessor = FacePreprocessor()
+
+
+def _encode_image(image_path):
+    return _worker_preprocessor.process_image(image_path)
+
+
+def _pool_context():
+    """
+    Start encoding workers from a clean process rather than forking the
+    caller, which may be a multithreaded web server holding locks.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+
+def _map_bounded(executor, fn, items, window):
+    """
+    Like executor.map, but reads items lazily: at most window are in flight,
+    and results are yielded in input order.
+    """
+    futures = deque()
+    for item in items:
+        futures.append(executor.submit(fn, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
 
 class FaceModelTrainer:
     """Class for training face recognition model with incremental updates."""
     
-    def __init__(self):
-        """Initialize the face model trainer."""
+    def __init__(self, compaction=None, prototypes_per_identity=3, worker_niceness=0,
+                 index_type='flat', index_params=None):
+        """
+        Initialize the face model trainer.
+        
+        Args:
+            compaction (str): Optional prototype compaction saved with the model:
+                'centroid' (one mean per identity) or 'medoid' (k medoids per identity)
+            prototypes_per_identity (int): k for 'medoid' compaction
+            worker_niceness (int): Added to the nice value of encoding worker
+                processes so a background retrain does not starve recognition
+            index_type (str): Matching index built and saved with the model;
+                must match the recognizer's index_type for it to be used
+            index_params (dict): Build options for that index, e.g. {'M': 16} for 'hnsw'
+        """
         # Get the project root directory
         self.project_root = Path(__file__).parent.parent.parent.parent
         self.models_dir = self.project_root / 'data' / 'face_data' / 'models'
         self.models_dir.mkdir(parents=True, exist_ok=True)
         
-        self.model_path = self.models_dir / 'face_recognition_model.pkl'
+        self.model_path = self.models_dir / 'face_encodings.bin'
+        self.legacy_model_path = self.models_dir / 'face_recognition_model.pkl'
         self.metadata_path = self.models_dir / 'model_metadata.json'
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.preprocessor = FacePreprocessor()
+        self.index_path = self.models_dir / 'face_index.npz'
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.compaction = compaction
+        self.prototypes_per_identity = prototypes_per_identity
+        self.worker_niceness = worker_niceness
         
-        # Load existing model and metadata if available
-        self.load_model()
+        # The saved model, metadata and dlib models are loaded on first use,
+        # so constructing a trainer is cheap
+        self._table = None
+        self._metadata = None
+        self._preprocessor = None
+        self._metadata_dirty = False
+        self._signature = None
+        self._load_lock = threading.Lock()
+    
+    def ensure_loaded(self):
+        """Load the existing model and metadata if that has not happened yet."""
+        if self._table is None:
+            with self._load_lock:
+                if self._table is None:
+                    self.load_model()
+    
+    def model_signature(self):
+        """Identity of the saved store; it changes whenever any process saves the model."""
+        try:
+            stat = os.stat(self.model_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def reload_if_changed(self):
+        """
+        Reload the model and metadata if another process saved the model since
+        this trainer loaded or saved it, so a run never overwrites newer encodings.
+        
+        Returns:
+            bool: True if the state was reloaded
+        """
+        if self._table is None or self.model_signature() == self._signature:
+            return False
+        with self._load_lock:
+            logger.info("Model was saved by another process, reloading trainer state")
+            self.load_model()
+        return True
+    
+    @property
+    def table(self):
+        self.ensure_loaded()
+        return self._table
+    
+    @table.setter
+    def table(self, table):
+        self._table = table
+    
+    @property
+    def metadata(self):
+        self.ensure_loaded()
+        return self._metadata
+    
+    @metadata.setter
+    def metadata(self, metadata):
+        self._metadata = metadata
+    
+    @property
+    def preprocessor(self):
+        if self._preprocessor is None:
+            self._preprocessor = FacePreprocessor()
+        return self._preprocessor
+    
+    @property
+    def known_face_encodings(self):
+        """Live encodings as an (N, 128) array."""
+        return self.table.live_rows()[0]
+    
+    @property
+    def known_face_names(self):
+        """Identity of each live encoding."""
+        return self.table.live_rows()[1]
         
     def load_model(self):
         """Load existing model and metadata."""
+        signature = self.model_signature()
+        table = EncodingTable()
         if self.model_path.exists():
             try:
-                with open(self.model_path, 'rb') as f:
+                # The trainer edits the gallery in place, so read it into memory
+                store = EncodingStore.open(self.model_path, mmap=False)
+                rows = [row or {} for row in store.rows]
+                table = EncodingTable.from_rows(
+                    store.encodings,
+                    store.names,
+                    [row.get('source') for row in rows],
+                    [row.get('row_id') for row in rows]
+                )
+                logger.info(f"Loaded existing model with {len(table)} encodings")
+            except Exception as e:
+                logger.error(f"Error loading model: {e}")
+        elif self.legacy_model_path.exists():
+            try:
+                with open(self.legacy_model_path, 'rb') as f:
                     model_data = pickle.load(f)
-                self.known_face_encodings = model_data["encodings"]
-                self.known_face_names = model_data["names"]
-                logger.info(f"Loaded existing model with {len(self.known_face_encodings)} encodings")
+                table = EncodingTable.from_rows(
+                    model_data["encodings"],
+                    model_data["names"],
+                    [None] * len(model_data["encodings"])
+                )
+                logger.info(f"Loaded legacy pickle model with {len(table)} encodings")
             except Exception as e:
                 logger.error(f"Error loading model: {e}")
                 
         # Load or initialize metadata
+        metadata = {}
         if self.metadata_path.exists():
             try:
                 with open(self.metadata_path, 'r') as f:
-                    self.metadata = json.load(f)
+                    metadata = json.load(f)
             except Exception as e:
                 logger.error(f"Error loading metadata: {e}")
-                self.metadata = {}
-        else:
-            self.metadata = {}
+        
+        # Metadata first: table is what ensure_loaded checks
+        self._metadata = metadata
+        self._metadata_dirty = False
+        self._signature = signature
+        self._table = table
     
     def get_file_metadata(self, file_path):
         """Get file metadata including modification time."""
@@ -56,26 +214,34 @@ class FaceModelTrainer:
             'size': os.path.getsize(file_path)
         }
     
-    def train_model(self, data_dir):
+    def train_model(self, data_dir, workers=1, chunksize=4, progress_callback=None):
         """
         Train the face recognition model, updating only changed or new data.
         
         Args:
             data_dir (str or Path): Directory containing person-wise face images
+            workers (int): Encoding processes; 1 encodes in this process and
+                None uses every CPU core
+            chunksize (int): Images queued per encoding worker
+            progress_callback (callable): Called as progress_callback(done, total)
+                after each encoded image
         """
         data_dir = Path(data_dir)
+        self.reload_if_changed()
         logger.info(f"Checking for updates in {data_dir}")
         
-        updates_made = False
+        pending = []
+        scanned = set()
         
-        # Process each person's directory
-        for person_name in os.listdir(data_dir):
+        # Collect new or modified images in a stable order so merges are deterministic
+        for person_name in sorted(os.listdir(data_dir)):
             person_dir = data_dir / person_name
             if not person_dir.is_dir():
                 continue
             
             # Check each image in the person's directory
-            for image_file in person_dir.glob("*.jpg"):
+            for image_file in sorted(person_dir.glob("*.jpg")):
+                scanned.add(str(image_file))
                 current_metadata = self.get_file_metadata(image_file)
                 stored_metadata = self.metadata.get(str(image_file), {})
                 
@@ -83,63 +249,314 @@ class FaceModelTrainer:
                 if (str(image_file) not in self.metadata or 
                     current_metadata['mod_time'] != stored_metadata.get('mod_time') or
                     current_metadata['size'] != stored_metadata.get('size')):
-                    
-                    logger.info(f"Processing updated/new image: {image_file.name} for {person_name}")
-                    
-                    try:
-                        # Process and encode face
-                        face_encoding = self.preprocessor.process_image(image_file)
-                        
-                        if face_encoding is not None:
-                            # Remove existing encodings for this person if file was modified
-                            if str(image_file) in self.metadata:
-                                self.remove_existing_encoding(str(image_file))
-                            
-                            # Add new encoding
-                            self.known_face_encodings.append(face_encoding)
-                            self.known_face_names.append(person_name)
-                            
-                            # Update metadata
-                            self.metadata[str(image_file)] = current_metadata
-                            updates_made = True
-                            
-                            logger.info(f"Successfully processed {image_file.name}")
-                    except Exception as e:
-                        logger.error(f"Error processing {image_file}: {e}")
-        
-        if updates_made:
+                    pending.append((person_name, image_file, current_metadata))
+        
+        logger.info(f"Encoding {len(pending)} updated/new images")
+        encodings = self.encode_images([image_file for _, image_file, _ in pending],
+                                       workers, chunksize, progress_callback, total=len(pending))
+        
+        updates_made = self.merge_encodings(pending, encodings)
+        # Images deleted from the directory since the last run
+        removed = self.prune_sources(scanned, prefix=os.path.join(str(data_dir), ''))
+        
+        if updates_made or removed:
             self.save_model()
             logger.info("Model updated with new/modified data")
         else:
+            self.save_metadata()
             logger.info("No updates needed - all files are current")
     
+    def train_from_images(self, images, workers=1, chunksize=4, progress_callback=None, total=None):
+        """
+        Train from in-memory images, e.g. straight from a download stream.
+        
+        Encoding starts as soon as the first images arrive, and nothing is
+        written to disk. An image whose source was seen before replaces the
+        encoding previously stored for that source. Callers that only want to
+        encode new images should filter their input with has_source first.
+        
+        Args:
+            images (iterable): (person_name, source, image_bytes) tuples, where source
+                is a stable identifier for the image such as its URL
+            workers (int): Encoding processes; 1 encodes in this process and
+                None uses every CPU core
+            chunksize (int): Images queued per encoding worker
+            progress_callback (callable): Called as progress_callback(done, total)
+            total (int): Expected number of images, if known, for progress reporting
+        
+        Returns:
+            bool: True if the gallery changed and was saved
+        """
+        pending = []
+        
+        def image_stream():
+            for person_name, source, image_bytes in images:
+                pending.append((person_name, source, {'size': len(image_bytes)}))
+                yield image_bytes
+        
+        encodings = self.encode_images(image_stream(), workers, chunksize, progress_callback, total=total)
+        
+        if self.merge_encodings(pending, encodings):
+            self.save_model()
+            logger.info("Model updated with new/modified data")
+            return True
+        
+        # Faceless images are still recorded, so the next run does not fetch them again
+        self.save_metadata()
+        logger.info("No updates made - no faces encoded")
+        return False
+    
+    def has_source(self, source):
+        """Whether an image source is already encoded (or known to contain no face)."""
+        return str(source) in self.metadata
+
+    def source_count(self, prefix=''):
+        """Number of known image sources (encoded or faceless) starting with prefix."""
+        return sum(1 for source in self.metadata if source.startswith(prefix))
+    
+    def prune_sources(self, keep, prefix=''):
+        """
+        Drop encodings whose source starts with prefix but is no longer in keep,
+        e.g. images deleted from the database since the last training run.
+        
+        Args:
+            keep (set or dict): Sources that are still current
+            prefix (str): Only sources in this namespace are considered
+        
+        Returns:
+            int: Number of sources removed
+        """
+        stale = {
+            source for source in self.metadata
+            if source.startswith(prefix) and source not in keep
+        }
+        if not stale:
+            return 0
+        
+        for source in stale:
+            self.table.remove_source(source)
+            del self.metadata[source]
+        self._metadata_dirty = True
+        
+        logger.info(f"Removed {len(stale)} deleted image sources from the model")
+        return len(stale)
+    
+    def migrate_legacy_sources(self, prefix):
+        """
+        One-time cleanup of rows left by training from a temporary download
+        directory, which keyed images by their paths under it (prefix).
+
+        The same images are now keyed by a stable id, so without this each one
+        would stay in the gallery twice. Rows converted from the old pickle
+        model carry no source at all but came from the same flow, so they go
+        too; metadata whose encoding was among them is forgotten so the image
+        is encoded again on its next run. Later calls are no-ops.
+
+        Args:
+            prefix (str): Source prefix of the legacy rows, e.g. 'temp_training'
+
+        Returns:
+            int: Number of encodings removed
+        """
+        if not any(source.startswith(prefix) for source in self.metadata):
+            return 0
+        
+        removed = self.prune_sources(set(), prefix=prefix) + self.table.remove_unsourced()
+        orphaned = [
+            source for source, meta in self.metadata.items()
+            if not meta.get('no_face') and source not in self.table
+        ]
+        for source in orphaned:
+            del self.metadata[source]
+        self._metadata_dirty = True
+        
+        logger.info(f"Migrated legacy training data: removed {removed} encodings, "
+                    f"{len(orphaned)} sources will be encoded again")
+        return removed
+    
+    def merge_encodings(self, pending, encodings):
+        """
+        Merge encoded images into the gallery in input order, regardless of
+        which worker finished first.
+        
+        Args:
+            pending (list): (person_name, source, metadata) per encoded image
+            encodings (list): Encoding or None per entry of pending
+        
+        Returns:
+            bool: True if the gallery changed
+        """
+        updates_made = False
+        for (person_name, source, current_metadata), face_encoding in zip(pending, encodings):
+            source = str(source)
+            if face_encoding is None:
+                # A changed image that no longer shows a face loses its old encoding
+                if self.table.remove_source(source):
+                    updates_made = True
+                    logger.info(f"Removed stale encoding for {source}: no face found")
+                # Remember faceless images so incremental runs do not retry them
+                self.metadata[source] = dict(current_metadata, no_face=True)
+                self._metadata_dirty = True
+                continue
+            
+            # Add new encoding; the table tombstones any older encoding of this source
+            self.table.add(face_encoding, person_name, source)
+            
+            # Update metadata
+            self.metadata[source] = current_metadata
+            updates_made = True
+            
+            logger.info(f"Successfully processed {source} for {person_name}")
+        
+        return updates_made
+    
+    def encode_images(self, images, workers=1, chunksize=4, progress_callback=None, total=None):
+        """
+        Encode images, optionally spread across a process pool.
+        
+        Args:
+            images (iterable): Image file paths or encoded image bytes
+            workers (int): Encoding processes; 1 runs serially, None uses every core
+            chunksize (int): Images queued per worker; the input is read at most
+                workers * chunksize images ahead of the finished encodings
+            progress_callback (callable): Called as progress_callback(done, total)
+            total (int): Number of images, if known, to size the pool and progress
+        
+        Returns:
+            list: One encoding (or None if no face was found) per input, in input order
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if total is not None:
+            workers = min(workers, total)
+        workers = max(1, workers)
+        
+        encodings = []
+        started = time.time()
+        log_every = max(1, (total or 100) // 10)
+        executor = None
+        try:
+            if workers == 1:
+                results = map(self.preprocessor.process_image, images)
+            else:
+                # Each worker loads the models once in the initializer
+                executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=_pool_context(),
+                    initializer=_init_encoding_worker,
+                    initargs=(self.worker_niceness,)
+                )
+                # Images are pulled from the input only as workers free up, so a
+                # download stream is never read (and held in memory) ahead of encoding
+                results = _map_bounded(executor, _encode_image, images, workers * max(1, chunksize))
+            
+            for done, encoding in enumerate(results, start=1):
+                encodings.append(encoding)
+                if progress_callback is not None:
+                    progress_callback(done, total)
+                if done % log_every == 0 or done == total:
+                    rate = done / max(time.time() - started, 1e-6)
+                    logger.info(f"Encoded {done}/{total or '?'} images ({rate:.1f} images/s, {workers} workers)")
+        finally:
+            if executor is not None:
+                # Drop queued work if we are unwinding early, e.g. on cancellation
+                executor.shutdown(cancel_futures=True)
+        
+        return encodings
+    
     def remove_existing_encoding(self, file_path):
         """Remove existing encoding for a modified file."""
-        if file_path in self.metadata:
-            try:
-                # Find and remove the corresponding encoding and name
-                idx = list(self.metadata.keys()).index(file_path)
-                self.known_face_encodings.pop(idx)
-                self.known_face_names.pop(idx)
-                logger.info(f"Removed existing encoding for {file_path}")
-            except Exception as e:
-                logger.error(f"Error removing existing encoding: {e}")
+        if self.table.remove_source(file_path):
+            logger.info(f"Removed existing encoding for {file_path}")
+    
+    def remove_person(self, person_name):
+        """
+        Remove every encoding of a person, e.g. when a user is deleted.
+        
+        Returns:
+            int: Number of encodings removed
+        """
+        sources = self.table.remove_name(person_name)
+        for source in sources:
+            self.metadata.pop(source, None)
+        self._metadata_dirty = True
+        logger.info(f"Removed {len(sources)} encodings for {person_name}")
+        return len(sources)
     
     def save_model(self):
         """Save the trained model and metadata to disk."""
-        # Save model
-        model_data = {
-            "encodings": self.known_face_encodings,
-            "names": self.known_face_names
-        }
+        # Tombstones never reach disk
+        self.table.compact()
+        encodings, names, sources, row_ids = self.table.live_rows()
+        
+        prototypes = None
+        if self.compaction:
+            prototypes = compact_identities(
+                encodings,
+                names,
+                method=self.compaction,
+                k=self.prototypes_per_identity
+            )
+            logger.info(
+                f"Compacted {len(encodings)} encodings into "
+                f"{len(prototypes['names'])} {self.compaction} prototypes"
+            )
         
-        with open(self.model_path, 'wb') as f:
-            pickle.dump(model_data, f)
+        # The index is published before the store: recognizers reload when
+        # the store changes, and must then find an index that matches it
+        fingerprint = gallery_fingerprint(encodings)
+        self.save_index(encodings, fingerprint)
+        
+        # Save model as a memory-mappable encoding store
+        EncodingStore.write(
+            self.model_path,
+            encodings,
+            names,
+            rows=[{'source': source, 'row_id': row_id} for source, row_id in zip(sources, row_ids)],
+            prototypes=prototypes,
+            fingerprint=fingerprint
+        )
+        self._signature = self.model_signature()
             
-        # Save metadata
-        with open(self.metadata_path, 'w') as f:
-            json.dump(self.metadata, f)
+        self._metadata_dirty = True
+        self.save_metadata()
             
-        logger.info(f"Model saved with {len(self.known_face_encodings)} encodings")
+        logger.info(f"Model saved with {len(encodings)} encodings")
+    
+    def save_index(self, encodings, fingerprint):
+        """
+        Build the configured matching index and save it; recognizers only load it.
+
+        Indexes with a size limit (see HNSWIndex.max_rows) are skipped for
+        larger galleries, which recognizers then match exactly.
+        """
+        index = create_index(self.index_type, **self.index_params)
+        if index.max_rows is not None and len(encodings) > index.max_rows:
+            logger.warning(f"Not building a {index.kind} index over {len(encodings)} encodings "
+                           f"(limit {index.max_rows}); recognizers will use exact matching")
+            return None
+        started = time.time()
+        index.build(encodings, fingerprint)
+        index.save(self.index_path)
+        logger.info(f"Built {index.kind} index over {len(index)} encodings in {time.time() - started:.1f}s")
+        return index
+    
+    def save_metadata(self):
+        """Save the per-source metadata if it changed since it was last saved."""
+        if not self._metadata_dirty:
+            return
+        # A reader in another process must never see a half-written file
+        f = tempfile.NamedTemporaryFile('w', dir=self.metadata_path.parent, prefix=self.metadata_path.name + '.',
+                                        suffix='.tmp', delete=False)
+        try:
+            with f:
+                json.dump(self.metadata, f)
+            os.chmod(f.name, 0o644)
+            os.replace(f.name, self.metadata_path)
+        except BaseException:
+            if os.path.exists(f.name):
+                os.remove(f.name)
+            raise
+        self._metadata_dirty = False
 
     
\ No newline at end of file
@@ -0,0 +1,251 @@
+import io
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from src.CMS.logging import logger
+from src.CMS.exception import UploadQueueFullException
+
+
+class CloudinaryUploader:
+    """Uploads encoded images to Cloudinary straight from memory."""
+
+    def __init__(self, uploader):
+        """
+        Args:
+            uploader: The configured ``cloudinary.uploader`` module
+        """
+        self.uploader = uploader
+
+    def upload(self, data, folder, public_id):
+        """
+        Returns:
+            dict: Upload result with at least secure_url and public_id
+        """
+        return self.uploader.upload(io.BytesIO(data), folder=folder, public_id=public_id)
+
+    def destroy(self, public_id):
+        return self.uploader.destroy(public_id)
+
+    def is_retryable(self, error):
+        """Whether an upload error may go away on retry; client errors such as bad credentials will not."""
+        from cloudinary import exceptions
+        return not isinstance(error, (exceptions.BadRequest, exceptions.AuthorizationRequired,
+                                      exceptions.NotAllowed, exceptions.NotFound, exceptions.AlreadyExists))
+
+
+# File extension by leading magic bytes
+IMAGE_EXTENSIONS = {
+    b'\xff\xd8\xff': '.jpg',
+    b'\x89PNG\r\n\x1a\n': '.png',
+}
+
+
+class LocalUploader:
+    """Stand-in for Cloudinary that stores images on local disk, for development and tests."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def upload(self, data, folder, public_id):
+        """
+        Raises:
+            ValueError: If data is neither a JPEG nor a PNG image
+        """
+        extension = next((ext for magic, ext in IMAGE_EXTENSIONS.items() if data.startswith(magic)), None)
+        if extension is None:
+            raise ValueError("Image is neither JPEG nor PNG")
+        path = self.root / folder / f'{public_id}{extension}'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return {'secure_url': path.resolve().as_uri(), 'public_id': f'{folder}/{public_id}'}
+
+    def destroy(self, public_id):
+        for extension in IMAGE_EXTENSIONS.values():
+            path = self.root / f'{public_id}{extension}'
+            if path.exists():
+                path.unlink()
+        return {'result': 'ok'}
+
+    def is_retryable(self, error):
+        # A rejected image stays rejected; disk errors may be transient
+        return not isinstance(error, ValueError)
+
+
+class UploadTask:
+    """State of one accepted capture: one or more images uploaded in the background."""
+
+    QUEUED = 'queued'
+    UPLOADING = 'uploading'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    FINISHED_STATES = (SUCCEEDED, FAILED)
+
+    def __init__(self, count):
+        self.id = uuid.uuid4().hex
+        self.state = self.QUEUED
+        self.total = count
+        self.results = [None] * count
+        self.failed = []
+        self.attempts = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._remaining = count
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.state in self.FINISHED_STATES
+
+    @property
+    def uploaded(self):
+        return [result for result in self.results if result is not None]
+
+    def to_dict(self):
+        return {
+            'uploadId': self.id,
+            'state': self.state,
+            'total': self.total,
+            'uploaded': len(self.uploaded),
+            'failedImages': list(self.failed),
+            'attempts': self.attempts,
+            'imageUrls': [result['secure_url'] for result in self.uploaded],
+            'createdAt': self.created_at,
+            'finishedAt': self.finished_at,
+            'error': self.error,
+        }
+
+
+class UploadManager:
+    """
+    Background upload pool for captured face images.
+
+    ``submit`` returns as soon as the images are queued. Each image is
+    uploaded on a worker thread with retries and exponential backoff; when
+    every image of a task has finished, ``on_complete(task, results)`` runs
+    on that worker with the successful upload results, e.g. to record them
+    in MongoDB. An exception from on_complete fails the task. Errors the
+    uploader reports as not retryable (``is_retryable``) fail the image
+    straight away.
+
+    Tasks are kept in this process only, so status queries must reach the
+    process that accepted the upload; behind several server workers a
+    query routed elsewhere finds no task.
+    """
+
+    def __init__(self, uploader, max_workers=4, retries=3, backoff=1.0, max_pending=256, history=500):
+        """
+        Args:
+            uploader: Object with upload(data, folder, public_id),
+                destroy(public_id) and is_retryable(error), e.g.
+                CloudinaryUploader or LocalUploader
+            max_workers (int): Concurrent uploads
+            retries (int): Retries per image after the first attempt
+            backoff (float): Seconds before the first retry; doubles each time
+            max_pending (int): Images waiting or uploading before submit refuses more
+            history (int): Finished tasks kept for status queries
+        """
+        self.uploader = uploader
+        self.retries = retries
+        self.backoff = backoff
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-worker')
+        self._tasks = {}
+        self._order = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Images queued or uploading."""
+        return self._pending
+
+    def submit(self, images, folder, on_complete=None):
+        """
+        Queue images for upload.
+
+        Args:
+            images (list): Encoded images (bytes)
+            folder (str): Destination folder, e.g. face_recognition/<userId>
+            on_complete (callable): Called as on_complete(task, results) once
+                every image is done; results are the successful upload results
+
+        Returns:
+            UploadTask: The queued task
+
+        Raises:
+            UploadQueueFullException: If max_pending images are already in flight
+        """
+        task = UploadTask(len(images))
+        with self._lock:
+            if self._pending + len(images) > self.max_pending:
+                raise UploadQueueFullException(f"Upload queue is full ({self._pending} images pending)")
+            self._pending += len(images)
+            self._tasks[task.id] = task
+            self._order.append(task.id)
+            self._trim_history()
+
+        # Unique per image, so captures in the same second never collide
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for index, data in enumerate(images):
+            public_id = f'face_{stamp}_{uuid.uuid4().hex[:8]}'
+            self._executor.submit(self._upload, task, index, data, folder, public_id, on_complete)
+        return task
+
+    def get(self, task_id):
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def _upload(self, task, index, data, folder, public_id, on_complete):
+        task.state = UploadTask.UPLOADING
+        for attempt in range(self.retries + 1):
+            with task._lock:
+                task.attempts += 1
+            try:
+                task.results[index] = self.uploader.upload(data, folder, public_id)
+                break
+            except Exception as e:
+                if attempt == self.retries or not self.uploader.is_retryable(e):
+                    logger.error(f"Upload {task.id} image {index} failed after {attempt + 1} attempts: {e}")
+                    with task._lock:
+                        task.failed.append(index)
+                        task.error = str(e)
+                    break
+                else:
+                    delay = self.backoff * 2 ** attempt
+                    logger.warning(f"Upload {task.id} image {index} failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+
+        with self._lock:
+            self._pending -= 1
+        with task._lock:
+            task._remaining -= 1
+            last = task._remaining == 0
+        if last:
+            self._complete(task, on_complete)
+
+    def _complete(self, task, on_complete):
+        results = task.uploaded
+        try:
+            if results and on_complete is not None:
+                on_complete(task, results)
+            task.state = UploadTask.SUCCEEDED if results else UploadTask.FAILED
+        except Exception as e:
+            task.state = UploadTask.FAILED
+            task.error = str(e)
+            logger.error(f"Upload {task.id} could not be recorded: {e}")
+        finally:
+            task.finished_at = time.time()
+            logger.info(f"Upload {task.id} {task.state}: {len(results)}/{task.total} images "
+                        f"in {task.finished_at - task.created_at:.2f}s")
+
+    def _trim_history(self):
+        finished = [task_id for task_id in self._order if self._tasks[task_id].finished]
+        for task_id in finished[:max(0, len(finished) - self.history)]:
+            self._order.remove(task_id)
+            del self._tasks[task_id]
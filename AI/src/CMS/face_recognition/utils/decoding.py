@@ -0,0 +1,114 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.CMS.logging import logger
+
+
+# JPEG decoders scale by 1/2, 1/4 or 1/8 during the IDCT, which is much
+# cheaper than decoding at full size and resizing afterwards
+REDUCED_FLAGS = (
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+)
+
+
+def image_size(data):
+    """(width, height) from the image header without decoding pixels, or None."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+class DecodedImage:
+    """
+    An encoded image decoded at a working resolution for detection.
+
+    ``image`` is the reduced BGR image and ``scale`` maps its coordinates back
+    to the original. The full-resolution image is only decoded when ``full``
+    is first used, e.g. to encode a face crop.
+    """
+
+    def __init__(self, data, image, scale=1.0, full=None):
+        """
+        Args:
+            data (bytes): Encoded image
+            image (numpy.ndarray): BGR image at working resolution
+            scale (float): Original size divided by working size
+            full (numpy.ndarray): Full-resolution image if already decoded
+        """
+        self.data = data
+        self.image = image
+        self.scale = scale
+        self._full = image if scale == 1 else full
+
+    @property
+    def full(self):
+        if self._full is None:
+            self._full = cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+        return self._full
+
+    @property
+    def full_decoded(self):
+        return self._full is not None
+
+
+def decode_image(data, pixel_budget=None):
+    """
+    Decode an image at the largest scale that fits a pixel budget.
+
+    Args:
+        data (bytes): Encoded image (JPEG/PNG)
+        pixel_budget (int): Maximum pixels for the working image; None decodes
+            at full resolution
+
+    Returns:
+        DecodedImage: The decoded image, or None if it could not be decoded
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    size = image_size(data) if pixel_budget else None
+
+    if size is None:
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        decoded = DecodedImage(data, image)
+    else:
+        width, height = size
+        factor, flag = 1, cv2.IMREAD_COLOR
+        if width * height > pixel_budget:
+            # Smallest reduction that fits; 1/8 is the limit, the rest is resized
+            for factor, flag in REDUCED_FLAGS:
+                if (width // factor) * (height // factor) <= pixel_budget:
+                    break
+
+        image = cv2.imdecode(buffer, flag)
+        if image is None:
+            return None
+        if factor == 1:
+            decoded = DecodedImage(data, image)
+        else:
+            decoded = DecodedImage(data, image, scale=float(factor))
+            logger.debug(f"Decoded {width}x{height} image at 1/{factor} scale")
+
+    if not pixel_budget:
+        return decoded
+    return fit_to_budget(decoded, pixel_budget)
+
+
+def fit_to_budget(decoded, pixel_budget):
+    """Downscale a decoded image further if it still exceeds the pixel budget."""
+    height, width = decoded.image.shape[:2]
+    if width * height <= pixel_budget:
+        return decoded
+    ratio = (pixel_budget / float(width * height)) ** 0.5
+    size = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+    image = cv2.resize(decoded.image, size, interpolation=cv2.INTER_AREA)
+    # Keep the already decoded pixels around if they were full resolution
+    full = decoded.image if decoded.scale == 1 else decoded._full
+    return DecodedImage(decoded.data, image, scale=decoded.scale * width / size[0], full=full)
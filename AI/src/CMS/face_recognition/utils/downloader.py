@@ -0,0 +1,87 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.CMS.logging import logger
+
+
+class ImageDownloader:
+    """Concurrent image downloader over a pooled keep-alive HTTP session."""
+
+    def __init__(self, max_workers=8, timeout=10, retries=3, backoff_factor=0.5, session=None):
+        """
+        Initialize the downloader.
+
+        Args:
+            max_workers (int): Concurrent downloads; also the connection pool size
+            timeout (float): Connect/read timeout per request in seconds
+            retries (int): Retries for connection errors and 429/5xx responses
+            backoff_factor (float): Exponential backoff base between retries
+            session (requests.Session): Session to use instead of a new pooled one
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        if session is None:
+            session = requests.Session()
+            retry = Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+            )
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def fetch(self, url):
+        """
+        Download one URL.
+
+        Returns:
+            bytes: Response body, or None if the download failed after retries
+        """
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code == 200:
+                return response.content
+            logger.warning(f"Download of {url} failed with status {response.status_code}")
+        except requests.RequestException as e:
+            logger.warning(f"Download of {url} failed: {e}")
+        return None
+
+    def download_many(self, items):
+        """
+        Download many URLs concurrently, yielding results in input order.
+
+        At most ``2 * max_workers`` downloads are in flight, so callers can
+        start encoding the first images while the rest are still downloading.
+
+        Args:
+            items (iterable): (tag, url) pairs; the tag is passed through untouched
+
+        Yields:
+            tuple: (tag, image bytes) for each successful download
+        """
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for tag, url in items:
+                window.append((tag, executor.submit(self.fetch, url)))
+                if len(window) >= 2 * self.max_workers:
+                    tag_done, future = window.popleft()
+                    content = future.result()
+                    if content is not None:
+                        yield tag_done, content
+
+            while window:
+                tag_done, future = window.popleft()
+                content = future.result()
+                if content is not None:
+                    yield tag_done, content
+
+    def close(self):
+        self.session.close()
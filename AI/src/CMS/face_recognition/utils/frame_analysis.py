@@ -0,0 +1,166 @@
+import cv2
+import dlib
+import numpy as np
+
+from src.CMS.face_recognition import registry
+from src.CMS.face_recognition.utils.decoding import DecodedImage
+
+
+LEFT_EYE = slice(36, 42)
+RIGHT_EYE = slice(42, 48)
+
+# Context kept around a face when cropping it from the full-resolution image
+CROP_MARGIN = 0.25
+
+
+def eye_aspect_ratio(eye):
+    """Eye Aspect Ratio (EAR) of six eye landmarks."""
+    A = np.linalg.norm(eye[1] - eye[5])
+    B = np.linalg.norm(eye[2] - eye[4])
+    C = np.linalg.norm(eye[0] - eye[3])
+    return (A + B) / (2.0 * C)
+
+
+class AnalyzedFace:
+    """One detected face: box, 68-point landmarks, EAR and a lazily computed encoding."""
+
+    def __init__(self, analysis, rect, shape):
+        self._analysis = analysis
+        self.rect = rect
+        self.shape = shape
+        self.landmarks = np.array([[p.x, p.y] for p in shape.parts()], dtype=np.float64)
+        self._encoding = None
+
+    @property
+    def location(self):
+        """Box in face_recognition's (top, right, bottom, left) order, in full-resolution coordinates."""
+        height, width = self._analysis.full_shape
+        scale = self._analysis.scale
+        return (
+            max(int(self.rect.top() * scale), 0),
+            min(int(self.rect.right() * scale), width),
+            min(int(self.rect.bottom() * scale), height),
+            max(int(self.rect.left() * scale), 0),
+        )
+
+    @property
+    def ear(self):
+        """Mean eye aspect ratio of both eyes."""
+        return (eye_aspect_ratio(self.landmarks[LEFT_EYE]) + eye_aspect_ratio(self.landmarks[RIGHT_EYE])) / 2.0
+
+    @property
+    def encoding(self):
+        """
+        128-d encoding; the ResNet only runs on demand.
+
+        The face is aligned with the 5-point predictor, as
+        face_recognition.face_encodings does for the training images, so live
+        and gallery encodings are directly comparable.
+        """
+        if self._encoding is None:
+            if self._analysis.scale == 1:
+                image, rect = self._analysis.rgb, self.rect
+            else:
+                image, rect = self._full_resolution_crop()
+            shape = registry.encoding_predictor()(image, rect)
+            descriptor = registry.face_encoder().compute_face_descriptor(
+                image, shape, self._analysis.num_jitters
+            )
+            self._encoding = np.array(descriptor)
+        return self._encoding
+
+    def _full_resolution_crop(self):
+        """
+        Crop this face from the full-resolution image, so the encoding sees
+        full detail while detection ran small.
+
+        Returns:
+            tuple: (RGB crop, face box within the crop as a dlib.rectangle)
+        """
+        full = self._analysis.source.full
+        height, width = full.shape[:2]
+        top, right, bottom, left = self.location
+        margin = int(CROP_MARGIN * max(right - left, bottom - top))
+        y0, y1 = max(top - margin, 0), min(bottom + margin, height)
+        x0, x1 = max(left - margin, 0), min(right + margin, width)
+
+        crop = cv2.cvtColor(full[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        return crop, dlib.rectangle(left - x0, top - y0, right - x0, bottom - y0)
+
+
+class FrameAnalysis:
+    """
+    Result of analysing one frame; grayscale and RGB copies are made once and shared.
+
+    When the frame was decoded at reduced resolution, detection and landmarks
+    are in working-resolution coordinates and ``scale`` maps them back.
+    """
+
+    def __init__(self, image, num_jitters=1, source=None):
+        self.image = image
+        self.num_jitters = num_jitters
+        self.source = source
+        self.scale = source.scale if source is not None else 1
+        self.gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self._rgb = None
+        self.faces = []
+
+    @property
+    def full_shape(self):
+        """(height, width) of the original image."""
+        if self.source is not None and self.source.full_decoded:
+            return self.source.full.shape[:2]
+        height, width = self.gray.shape[:2]
+        return int(height * self.scale), int(width * self.scale)
+
+    @property
+    def rgb(self):
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    @property
+    def face_locations(self):
+        return [face.location for face in self.faces]
+
+
+class FrameAnalyzer:
+    """
+    Single-pass face analysis: one HOG detection and one 68-point landmark fit
+    per face for liveness (EAR); encodings align the same box with the
+    5-point model training uses.
+    """
+
+    def __init__(self, detector, predictor, upsample=1, num_jitters=1):
+        """
+        Args:
+            detector: dlib frontal face detector
+            predictor: dlib 68-point shape predictor
+            upsample (int): Times to upsample the image before detecting
+            num_jitters (int): Re-samplings when computing each encoding
+        """
+        self.detector = detector
+        self.predictor = predictor
+        self.upsample = upsample
+        self.num_jitters = num_jitters
+
+    def analyze(self, image):
+        """
+        Detect faces and fit landmarks on a BGR image.
+
+        Args:
+            image (numpy.ndarray or DecodedImage): BGR image, or an image decoded
+                at reduced resolution (see utils.decoding.decode_image), in which
+                case faces are encoded from full-resolution crops
+
+        Returns:
+            FrameAnalysis: Detected faces in detector order
+        """
+        if isinstance(image, DecodedImage):
+            analysis = FrameAnalysis(image.image, self.num_jitters, source=image)
+        else:
+            analysis = FrameAnalysis(image, self.num_jitters)
+        for rect in self.detector(analysis.gray, self.upsample):
+            shape = self.predictor(analysis.gray, rect)
+            analysis.faces.append(AnalyzedFace(analysis, rect, shape))
+        return analysis
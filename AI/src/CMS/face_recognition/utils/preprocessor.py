@@ -1,30 +1,31 @@
 import cv2
-import face_recognition
 import numpy as np
 from src.CMS.logging import logger
-import dlib
+from src.CMS.face_recognition import registry
 from pathlib import Path
 import sys
 import os
+import io
 
 class FacePreprocessor:
     """Utility class for face image preprocessing."""
     
     def __init__(self):
         """Initialize the preprocessor."""
-        self.detector = dlib.get_frontal_face_detector()
+        # Models come from the process-wide registry, so they are loaded once and shared
+        self.detector = registry.face_detector()
         
         # Get the project root directory
         self.project_root = Path(__file__).parent.parent.parent.parent
-        self.predictor_path = self.project_root / 'data' / 'shape_predictor_68_face_landmarks.dat'
+        self.predictor_path = registry.predictor_path()
         
         # Check if shape predictor file exists
-        if not self.predictor_path.exists():
-            logger.error(f"Shape predictor file not found at {self.predictor_path}")
+        if self.predictor_path is None:
+            logger.error(f"Shape predictor file not found in any of {[str(p) for p in registry.predictor_candidates()]}")
             logger.info("Please download the shape predictor file using the following commands:")
             logger.info("1. wget http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2")
             logger.info("2. bzip2 -d shape_predictor_68_face_landmarks.dat.bz2")
-            logger.info(f"3. Move the file to: {self.predictor_path}")
+            logger.info(f"3. Move the file to: {registry.predictor_candidates()[0]}")
             logger.info("\nOr run the following Python code:")
             logger.info("import urllib.request")
             logger.info("import bz2")
@@ -41,7 +42,7 @@ class FacePreprocessor:
             
             sys.exit(1)
             
-        self.predictor = dlib.shape_predictor(str(self.predictor_path))
+        self.predictor = registry.shape_predictor()
         self.blink_threshold = 0.25
         self.blink_consec_frames = 1
         self.head_threshold = 0.2
@@ -209,8 +210,9 @@ if __name__ == "__main__":
         rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
         
         # Detect faces and get encodings
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+        api = registry.face_recognition_api()
+        face_locations = api.face_locations(rgb_small_frame)
+        face_encodings = api.face_encodings(rgb_small_frame, face_locations)
         
         # Scale face locations back to original size if needed
         if scale_factor < 1:
@@ -228,15 +230,23 @@ if __name__ == "__main__":
         Process a single image file and return face encoding.
         
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file, or the encoded image bytes
             
         Returns:
             numpy.ndarray: Face encoding if face found, None otherwise
         """
+        if isinstance(image_path, (bytes, bytearray)):
+            # Decode straight from memory instead of a temporary file
+            source = io.BytesIO(image_path)
+            image_path = f"<{len(image_path)} byte image>"
+        else:
+            source = str(image_path)
+        
         try:
             # Load and encode face
-            image = face_recognition.load_image_file(str(image_path))
-            face_encodings = face_recognition.face_encodings(image)
+            api = registry.face_recognition_api()
+            image = api.load_image_file(source)
+            face_encodings = api.face_encodings(image)
             
             if face_encodings:
                 return face_encodings[0]
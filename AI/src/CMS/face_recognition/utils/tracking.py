@@ -0,0 +1,152 @@
+import itertools
+
+import dlib
+
+from src.CMS.face_recognition.utils.frame_analysis import AnalyzedFace, FrameAnalysis
+
+
+def _iou(a, b):
+    """Intersection over union of two dlib rectangles."""
+    intersection = a.intersect(b)
+    if intersection.is_empty():
+        return 0.0
+    overlap = intersection.area()
+    return overlap / float(a.area() + b.area() - overlap)
+
+
+class Track:
+    """One tracked face; ``name`` stays None until the caller identifies it."""
+
+    _ids = itertools.count()
+
+    def __init__(self, frame, rect):
+        self.id = next(self._ids)
+        self.tracker = dlib.correlation_tracker()
+        self.tracker.start_track(frame, rect)
+        self.rect = rect
+        self.name = None
+        self.face = None
+        self.age = 0
+
+    def restart(self, frame, rect):
+        self.tracker.start_track(frame, rect)
+        self.rect = rect
+
+    def follow(self, frame):
+        """Advance the correlation tracker; returns its peak-to-sidelobe confidence."""
+        confidence = self.tracker.update(frame)
+        position = self.tracker.get_position()
+        self.rect = dlib.rectangle(
+            int(round(position.left())), int(round(position.top())),
+            int(round(position.right())), int(round(position.bottom()))
+        )
+        self.age += 1
+        return confidence
+
+    @property
+    def location(self):
+        """Box in face_recognition's (top, right, bottom, left) order."""
+        return (self.rect.top(), self.rect.right(), self.rect.bottom(), self.rect.left())
+
+
+class FaceTracker:
+    """
+    Detect-then-track for live video.
+
+    HOG detection runs every ``detect_every`` frames, or straight away when
+    a track's confidence drops; in between, boxes are followed with dlib's
+    correlation tracker, which is far cheaper. Detections are matched to
+    existing tracks by overlap, so a face keeps its track (and identity)
+    across detections and only new tracks need encoding.
+    """
+
+    def __init__(self, detector, predictor=None, detect_every=5, min_confidence=7.0,
+                 match_iou=0.3, upsample=1, num_jitters=1):
+        """
+        Args:
+            detector: dlib frontal face detector
+            predictor: dlib 68-point shape predictor; if given, landmarks are
+                fitted on every tracked box so liveness and encoding keep working
+            detect_every (int): Frames between full detections
+            min_confidence (float): Tracker confidence below which a track is
+                considered lost and detection runs again
+            match_iou (float): Overlap needed to match a detection to a track
+            upsample (int): Times to upsample the image before detecting
+            num_jitters (int): Re-samplings when computing encodings
+        """
+        self.detector = detector
+        self.predictor = predictor
+        self.detect_every = max(1, detect_every)
+        self.min_confidence = min_confidence
+        self.match_iou = match_iou
+        self.upsample = upsample
+        self.num_jitters = num_jitters
+        self.tracks = []
+        self.detected = False
+        self.frames = 0
+        self.detections = 0
+        self._since_detection = 0
+
+    def reset(self):
+        self.tracks = []
+        self._since_detection = 0
+
+    def update(self, frame):
+        """
+        Advance all tracks by one BGR frame.
+
+        Returns:
+            tuple: (FrameAnalysis with one face per track, list of Track);
+                ``self.detected`` tells whether detection ran on this frame
+        """
+        analysis = FrameAnalysis(frame, self.num_jitters)
+        gray = analysis.gray
+        self.frames += 1
+
+        detect = not self.tracks or self._since_detection + 1 >= self.detect_every
+        if not detect:
+            for track in self.tracks:
+                if track.follow(gray) < self.min_confidence:
+                    detect = True
+
+        if detect:
+            self._detect(gray)
+            self._since_detection = 0
+        else:
+            self._since_detection += 1
+        self.detected = detect
+
+        height, width = gray.shape[:2]
+        bounds = dlib.rectangle(0, 0, width - 1, height - 1)
+        for track in self.tracks:
+            track.rect = track.rect.intersect(bounds)
+            track.face = None
+            if self.predictor is not None and not track.rect.is_empty():
+                track.face = AnalyzedFace(analysis, track.rect, self.predictor(gray, track.rect))
+                analysis.faces.append(track.face)
+        return analysis, self.tracks
+
+    def _detect(self, gray):
+        self.detections += 1
+        rects = list(self.detector(gray, self.upsample))
+
+        # Greedy matching, best overlaps first
+        pairs = sorted(
+            ((_iou(track.rect, rect), t, r) for t, track in enumerate(self.tracks) for r, rect in enumerate(rects)),
+            key=lambda pair: pair[0], reverse=True
+        )
+        matched_tracks, matched_rects = set(), set()
+        tracks = []
+        for overlap, t, r in pairs:
+            if overlap < self.match_iou:
+                break
+            if t in matched_tracks or r in matched_rects:
+                continue
+            matched_tracks.add(t)
+            matched_rects.add(r)
+            self.tracks[t].restart(gray, rects[r])
+            tracks.append(self.tracks[t])
+
+        # Unmatched detections are new faces; unmatched tracks have left the frame
+        tracks.extend(Track(gray, rect) for r, rect in enumerate(rects) if r not in matched_rects)
+        self.tracks = tracks
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+from src.CMS.logging import logger
+
+
+class LazyProxy:
+    """Stands in for a service and builds it on first attribute access."""
+
+    def __init__(self, services, name):
+        object.__setattr__(self, '_services', services)
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, attr):
+        return getattr(self._services.get(self._name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._services.get(self._name), attr, value)
+
+    def __repr__(self):
+        return f"<lazy {self._name}>"
+
+
+class LazyServices:
+    """
+    Named singletons built on first use.
+
+    Factories are registered up front and run at most once, under a
+    per-service lock, with their construction time recorded. ``warm_up``
+    builds the heavy ones ahead of traffic, optionally in a background
+    thread, and ``ready`` reports when it has finished.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.timings = {}
+        self._ready = threading.Event()
+        self._warm_up_args = None
+        self._warm_up_thread = None
+        self.warm_up_error = None
+        self.warm_up_started_at = None
+        self.warm_up_seconds = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, name, factory):
+        """Register factory() as the constructor of service name."""
+        with self._lock:
+            self._factories[name] = factory
+            self._locks[name] = threading.Lock()
+
+    def lazy(self, name):
+        """A proxy that builds service name on first use."""
+        return LazyProxy(self, name)
+
+    def get(self, name):
+        """The service instance, built now if needed."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._locks[name]:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.timings[name] = time.perf_counter() - started
+                logger.info(f"Initialized {name} in {self.timings[name]:.2f}s")
+        return self._instances[name]
+
+    def peek(self, name):
+        """The service instance if it has been built, else None; never blocks."""
+        return self._instances.get(name)
+
+    def record(self, name, seconds):
+        """Record a startup step that is not a service, e.g. the app import."""
+        self.timings[name] = seconds
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def warming(self):
+        return self._warm_up_thread is not None and self._warm_up_thread.is_alive()
+
+    def warm_up(self, names, before=None, background=True):
+        """
+        Build services ahead of traffic.
+
+        Args:
+            names (list): Services to build, in order
+            before (callable): Run first, e.g. to preload shared models
+            background (bool): Warm up in a daemon thread so the process can
+                serve cheap endpoints right away
+        """
+        self._warm_up_args = (list(names), before, background)
+        self.warm_up_started_at = time.time()
+        if background:
+            self._warm_up_thread = threading.Thread(target=self._warm_up, args=(names, before),
+                                                    name='warm-up', daemon=True)
+            self._warm_up_thread.start()
+        else:
+            self._warm_up(names, before)
+
+    def _warm_up(self, names, before):
+        started = time.perf_counter()
+        try:
+            if before is not None:
+                before()
+            for name in names:
+                self.get(name)
+            self._ready.set()
+        except Exception as e:
+            self.warm_up_error = str(e)
+            logger.error(f"Warm-up failed: {e}")
+        finally:
+            self.warm_up_seconds = time.perf_counter() - started
+            logger.info(f"Warm-up finished in {self.warm_up_seconds:.2f}s")
+
+    def _after_fork(self):
+        # Locks held by the parent's warm-up thread would never be released here.
+        # Runs in every forked child, including multiprocessing workers, so it
+        # must not start any work of its own
+        self._lock = threading.Lock()
+        self._locks = {name: threading.Lock() for name in self._factories}
+
+    def after_worker_fork(self):
+        """
+        Finish an interrupted background warm-up in a forked server worker.
+
+        The warm-up thread does not survive a fork, so a worker forked while
+        it was running would otherwise build services on first request.
+        Call this from the server's worker hook (gunicorn ``post_fork``, see
+        gunicorn.conf.py), not from other forked children.
+        """
+        if self._warm_up_args is None or self.ready or self.warming:
+            return
+        names, before, background = self._warm_up_args
+        if background:
+            self.warm_up(names, before, background=True)
+
+    def report(self):
+        """Startup report: readiness, warm-up state and per-service init times."""
+        return {
+            'ready': self.ready,
+            'warming': self.warming,
+            'warmUpError': self.warm_up_error,
+            'warmUpSeconds': round(self.warm_up_seconds, 3) if self.warm_up_seconds is not None else None,
+            'initialized': sorted(self._instances),
+            'timings': {name: round(seconds, 3) for name, seconds in self.timings.items()},
+        }
@@ -1,11 +1,63 @@
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import CursorNotFound, PyMongoError
+from collections import OrderedDict
 from datetime import datetime
+import threading
+import time
+
+from src.CMS.logging import logger
+
+# Users who have at least one face image
+HAS_FACE_IMAGES = {'faceData.faceImages': {'$exists': True, '$ne': []}}
+
+# Just what training needs from each user: the image URLs and Cloudinary ids
+FACE_IMAGE_PROJECTION = {
+    '_id': 1,
+    'faceData.faceImages.url': 1,
+    'faceData.faceImages.cloudinary_public_id': 1
+}
+
+# Indexes on the shared users collection. Both are partial, so they only
+# hold the (few) users with face data and cost nothing for everyone else.
+FACE_INDEXES = [
+    # Serves HAS_FACE_IMAGES scans in _id order (training, summary counts),
+    # with updated_since checked from the index keys
+    IndexModel(
+        [('_id', ASCENDING), ('faceData.lastUpdated', ASCENDING)],
+        name='faceData_users',
+        partialFilterExpression={'faceData.faceImages': {'$exists': True}}
+    ),
+    # Serves updated_since queries over a short recent window
+    IndexModel(
+        [('faceData.lastUpdated', DESCENDING)],
+        name='faceData_lastUpdated',
+        partialFilterExpression={'faceData.lastUpdated': {'$exists': True}}
+    ),
+]
 
 class UserFace:
-    def __init__(self, mongodb_uri):
-        self.client = MongoClient(mongodb_uri)
+    def __init__(self, mongodb_uri, client=None, summary_ttl=300, user_cache_ttl=300, user_cache_size=10000):
+        """
+        Args:
+            mongodb_uri (str): MongoDB connection string
+            client: Existing client to use instead, e.g. a mongomock.MongoClient in tests
+            summary_ttl (float): Seconds a cached face summary is trusted before it
+                is recounted; local writes keep it current in between
+            user_cache_ttl (float): Seconds a user id seen in the database is
+                trusted to exist without asking again
+            user_cache_size (int): Most user ids kept in that cache
+        """
+        self.client = client if client is not None else MongoClient(mongodb_uri)
         self.db = self.client.test  # Your existing database name
         self.users_collection = self.db.users  # Your existing users collection
+        self.summary_ttl = summary_ttl
+        self._summary = None
+        self._summary_at = 0.0
+        self._summary_lock = threading.Lock()
+        self.user_cache_ttl = user_cache_ttl
+        self.user_cache_size = user_cache_size
+        self._known_users = OrderedDict()
+        self._known_users_lock = threading.Lock()
 
     def create_user(self, user_id):
         user = {
@@ -16,15 +68,26 @@ class UserFace:
         }
         return self.collection.insert_one(user)
 
-    def add_face_image(self, user_id, image_url, cloudinary_public_id):
-        image_data = {
+    def _face_image(self, image_url, cloudinary_public_id):
+        return {
             'url': image_url,
             'cloudinary_public_id': cloudinary_public_id,
             'captured_at': datetime.now()
         }
+
+    def add_face_image(self, user_id, image_url, cloudinary_public_id):
+        """
+        Append a face image to a user in one conditional update.
+
+        Returns:
+            dict: The user before the update (_id and at most its first face
+                image), or None if no user has this id
+        """
+        image_data = self._face_image(image_url, cloudinary_public_id)
         
-        # Find user and update/create faceData field
-        return self.users_collection.update_one(
+        # Find user and update/create faceData field; the pre-update document
+        # (first image only) tells whether this is the user's first face image
+        before = self.users_collection.find_one_and_update(
             {'_id': user_id},  # Assuming user_id is the MongoDB _id
             {
                 '$push': {'faceData.faceImages': image_data},
@@ -32,8 +95,75 @@ class UserFace:
                     'faceData.lastUpdated': datetime.now(),
                     'faceData.verificationStatus': 'verified'
                 }
-            }
+            },
+            projection={'_id': 1, 'faceData.faceImages': {'$slice': 1}},
+            return_document=ReturnDocument.BEFORE
         )
+        if before is None:
+            self.forget_user(user_id)
+            return None
+
+        self._remember_user(user_id)
+        first_image = not before.get('faceData', {}).get('faceImages')
+        self._adjust_summary(users=1 if first_image else 0, images=1)
+        return before
+
+    def add_face_images(self, images):
+        """
+        Append many face images, possibly for several users, in one bulk_write.
+
+        Images are grouped per user into a single $push each, and the writes
+        are unordered so one missing user does not stop the rest.
+
+        Args:
+            images (list): (user_id, image_url, cloudinary_public_id) tuples
+
+        Returns:
+            dict: matchedUsers and missingUsers (lists of user ids) and imagesAdded
+        """
+        per_user = OrderedDict()
+        for user_id, image_url, cloudinary_public_id in images:
+            per_user.setdefault(user_id, []).append(self._face_image(image_url, cloudinary_public_id))
+        if not per_user:
+            return {'matchedUsers': [], 'missingUsers': [], 'imagesAdded': 0}
+
+        # bulk_write only reports totals, so resolve which users exist first
+        existing = self.existing_users(per_user)
+        missing = [user_id for user_id in per_user if user_id not in existing]
+        operations = [
+            UpdateOne(
+                {'_id': user_id},
+                {
+                    '$push': {'faceData.faceImages': {'$each': user_images}},
+                    '$set': {
+                        'faceData.lastUpdated': datetime.now(),
+                        'faceData.verificationStatus': 'verified'
+                    }
+                }
+            )
+            for user_id, user_images in per_user.items()
+            if user_id in existing
+        ]
+        if operations:
+            result = self.users_collection.bulk_write(operations, ordered=False)
+            if result.matched_count != len(operations):
+                # A user vanished between the lookup and the write; bulk_write
+                # does not say which, so ask again for the users written to
+                logger.warning(f"Bulk face image write matched {result.matched_count} of {len(operations)} users")
+                written = {user['_id'] for user in self.users_collection.find({'_id': {'$in': list(existing)}}, {'_id': 1})}
+                for user_id in existing - written:
+                    self.forget_user(user_id)
+                missing = [user_id for user_id in per_user if user_id not in written]
+                existing = written
+            # Whether these were anyone's first images is unknown here, so recount lazily
+            self.invalidate_face_summary()
+
+        matched = [user_id for user_id in per_user if user_id in existing]
+        return {
+            'matchedUsers': matched,
+            'missingUsers': missing,
+            'imagesAdded': sum(len(per_user[user_id]) for user_id in matched)
+        }
 
     def get_user_images(self, user_id):
         user = self.users_collection.find_one({'_id': user_id})
@@ -42,13 +172,253 @@ class UserFace:
     def get_all_users(self):
         # Only get users who have face images
         return list(self.users_collection.find(
-            {'faceData.faceImages': {'$exists': True, '$ne': []}},
+            HAS_FACE_IMAGES,
             {'faceData.faceImages': 1, '_id': 1, 'name': 1}
         ))
 
+    def _face_images_query(self, updated_since=None):
+        query = dict(HAS_FACE_IMAGES)
+        if updated_since is not None:
+            # $exists keeps the query inside the faceData_lastUpdated partial filter
+            query['faceData.lastUpdated'] = {'$exists': True, '$gte': updated_since}
+        return query
+
+    def ensure_indexes(self):
+        """
+        Create the faceData indexes (FACE_INDEXES) if they do not exist yet.
+
+        Safe to call on every start: existing indexes are left alone. Failures,
+        e.g. a user without createIndex rights, are logged rather than raised,
+        as queries still work without the indexes, only slower.
+
+        Returns:
+            list: Names of the declared indexes, or an empty list on failure
+        """
+        try:
+            names = self.users_collection.create_indexes(FACE_INDEXES)
+            logger.info(f"Ensured users indexes: {names}")
+            return names
+        except PyMongoError as e:
+            logger.warning(f"Could not create faceData indexes: {e}")
+            return []
+
+    def explain_face_queries(self, updated_since=None):
+        """
+        Query plans of the face data queries, to check they stay index-backed
+        as the users collection grows.
+
+        Args:
+            updated_since (datetime): Also explain an incremental scan from this time
+
+        Returns:
+            dict: Per query, the winning plan's stages and index, keys and
+                documents examined, documents returned and time taken; plus
+                the faceData indexes present on the collection
+        """
+        queries = {'trainingScan': self._face_images_query()}
+        if updated_since is not None:
+            queries['incrementalScan'] = self._face_images_query(updated_since)
+
+        plans = {}
+        for name, query in queries.items():
+            explained = self.users_collection.find(query, FACE_IMAGE_PROJECTION) \
+                .sort('_id', ASCENDING).explain()
+            plans[name] = self._summarize_plan(explained)
+
+        declared = {index.document['name'] for index in FACE_INDEXES}
+        plans['indexes'] = sorted(declared & set(self.users_collection.index_information()))
+        return plans
+
+    @staticmethod
+    def _summarize_plan(explained):
+        winning = explained.get('queryPlanner', {}).get('winningPlan', {})
+        # Slot-based engine plans nest the classic plan under queryPlan
+        winning = winning.get('queryPlan', winning)
+
+        stages, indexes = [], []
+        pending = [winning]
+        while pending:
+            stage = pending.pop()
+            stages.append(stage.get('stage'))
+            if 'indexName' in stage:
+                indexes.append(stage['indexName'])
+            if 'inputStage' in stage:
+                pending.append(stage['inputStage'])
+            pending.extend(stage.get('inputStages', []))
+
+        stats = explained.get('executionStats', {})
+        return {
+            'stages': stages,
+            'indexes': indexes,
+            'indexBacked': 'COLLSCAN' not in stages,
+            'keysExamined': stats.get('totalKeysExamined'),
+            'docsExamined': stats.get('totalDocsExamined'),
+            'returned': stats.get('nReturned'),
+            'executionTimeMillis': stats.get('executionTimeMillis')
+        }
+
+    def iter_face_images(self, batch_size=200, updated_since=None):
+        """
+        Stream users with face images, one document at a time.
+
+        The server returns batch_size documents per round trip and each
+        document carries only _id and the url / cloudinary_public_id of its
+        images, so memory stays flat however many users there are. Documents
+        come in _id order; if the server reaps the cursor while the caller is
+        busy (slow downloads between batches), iteration resumes after the
+        last _id seen.
+
+        Args:
+            batch_size (int): Documents fetched per round trip
+            updated_since (datetime): Only users whose face data changed at or
+                after this time
+
+        Yields:
+            dict: {'_id': ..., 'faceData': {'faceImages': [{'url', 'cloudinary_public_id'}, ...]}}
+        """
+        query = self._face_images_query(updated_since)
+        last_id = None
+        while True:
+            page_query = query if last_id is None else {**query, '_id': {'$gt': last_id}}
+            cursor = self.users_collection.find(page_query, FACE_IMAGE_PROJECTION) \
+                .sort('_id', ASCENDING).batch_size(batch_size)
+            try:
+                with cursor:
+                    for user in cursor:
+                        last_id = user['_id']
+                        yield user
+                return
+            except CursorNotFound:
+                logger.warning(f"Face image cursor expired after _id {last_id}, resuming")
+
+    def get_face_summary(self, max_age=None):
+        """
+        User and image counts for users with face images.
+
+        Served from a cache kept current by add_face_image and training runs;
+        the database is only counted (server-side) when the cache is older
+        than the TTL or has been invalidated.
+
+        Args:
+            max_age (float): Overrides summary_ttl for this call
+
+        Returns:
+            dict: totalUsers, totalImages and computedAt (epoch seconds)
+        """
+        max_age = self.summary_ttl if max_age is None else max_age
+        with self._summary_lock:
+            if self._summary is not None and time.time() - self._summary_at <= max_age:
+                return dict(self._summary)
+
+        result = next(self.users_collection.aggregate([
+            {'$match': HAS_FACE_IMAGES},
+            {'$group': {
+                '_id': None,
+                'users': {'$sum': 1},
+                'images': {'$sum': {'$size': '$faceData.faceImages'}}
+            }}
+        ]), None) or {}
+        return self.set_face_summary(result.get('users', 0), result.get('images', 0))
+
+    def set_face_summary(self, total_users, total_images):
+        """Replace the cached counts, e.g. with totals seen during a full training scan."""
+        with self._summary_lock:
+            self._summary_at = time.time()
+            self._summary = {
+                'totalUsers': total_users,
+                'totalImages': total_images,
+                'computedAt': self._summary_at
+            }
+            return dict(self._summary)
+
+    def invalidate_face_summary(self):
+        """Drop the cached counts so the next get_face_summary recounts."""
+        with self._summary_lock:
+            self._summary = None
+
+    def _adjust_summary(self, users=0, images=0):
+        with self._summary_lock:
+            if self._summary is not None:
+                self._summary['totalUsers'] += users
+                self._summary['totalImages'] += images
+
+    def watch_face_changes(self):
+        """
+        Invalidate the cached summary whenever another process changes face
+        data, using a MongoDB change stream (replica sets only).
+
+        Returns:
+            threading.Thread: The watcher thread, or None if change streams
+                are not available
+        """
+        # Updated field names are dotted paths, which $match cannot address,
+        # so any write to users invalidates; the recount is one aggregation
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        try:
+            stream = self.users_collection.watch(pipeline)
+        except Exception as e:
+            logger.info(f"Change streams unavailable, face summary relies on its TTL: {e}")
+            return None
+
+        def watch():
+            try:
+                with stream:
+                    for _ in stream:
+                        self.invalidate_face_summary()
+            except Exception as e:
+                logger.error(f"Face data change stream stopped: {e}")
+                self.invalidate_face_summary()
+
+        thread = threading.Thread(target=watch, name='face-data-watch', daemon=True)
+        thread.start()
+        return thread
+
     def verify_user_exists(self, user_id):
-        user = self.users_collection.find_one({'_id': user_id})
-        return user is not None
+        """
+        Whether a user exists, answered from the known-user cache when possible.
+
+        A miss costs one find_one that returns only the _id.
+        """
+        return user_id in self.existing_users([user_id])
+
+    def existing_users(self, user_ids):
+        """
+        The subset of user_ids that exist, asking the database (one query,
+        _id only) just for ids not in the known-user cache.
+
+        Args:
+            user_ids (iterable): User ids to check
+
+        Returns:
+            set: Ids that exist
+        """
+        user_ids = list(user_ids)
+        now = time.monotonic()
+        with self._known_users_lock:
+            known = {user_id for user_id in user_ids if self._known_users.get(user_id, 0) > now}
+        unknown = [user_id for user_id in user_ids if user_id not in known]
+        if len(unknown) == 1:
+            found = self.users_collection.find_one({'_id': unknown[0]}, {'_id': 1})
+            unknown_found = {found['_id']} if found else set()
+        elif unknown:
+            unknown_found = {user['_id'] for user in self.users_collection.find({'_id': {'$in': unknown}}, {'_id': 1})}
+        else:
+            unknown_found = set()
+        for user_id in unknown_found:
+            self._remember_user(user_id)
+        return known | unknown_found
+
+    def _remember_user(self, user_id):
+        with self._known_users_lock:
+            self._known_users[user_id] = time.monotonic() + self.user_cache_ttl
+            self._known_users.move_to_end(user_id)
+            while len(self._known_users) > self.user_cache_size:
+                self._known_users.popitem(last=False)
+
+    def forget_user(self, user_id):
+        """Drop a user id from the known-user cache, e.g. after the user is deleted."""
+        with self._known_users_lock:
+            self._known_users.pop(user_id, None)
 
     def get_user(self, user_id):
         """
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.CMS.face_recognition.utils.downloader import ImageDownloader
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """
+    /image/<n>?delay=<s>  200 with body b'image-<n>', after an optional delay
+    /missing              404
+    /flaky/<key>          503 on the first request for key, 200 afterwards
+    /down                 always 503
+    """
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        self.server.hits[path] += 1
+        if path.startswith('/image/'):
+            params = dict(part.split('=') for part in query.split('&') if part)
+            time.sleep(float(params.get('delay', 0)))
+            self._send(200, f"image-{path.rsplit('/', 1)[1]}".encode())
+        elif path.startswith('/flaky/') and self.server.hits[path] > 1:
+            self._send(200, b'recovered')
+        elif path.startswith('/flaky/') or path == '/down':
+            self._send(503, b'unavailable')
+        else:
+            self._send(404, b'not found')
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    server.hits = Counter()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def downloader():
+    downloader = ImageDownloader(max_workers=4, timeout=5, retries=2, backoff_factor=0)
+    yield downloader
+    downloader.close()
+
+
+def test_results_keep_input_order(server, downloader):
+    # Earlier images answer slower, so completion order is the reverse of input order
+    items = [(n, f'{server.url}/image/{n}?delay={0.05 * (10 - n)}') for n in range(10)]
+
+    results = list(downloader.download_many(items))
+
+    assert results == [(n, f'image-{n}'.encode()) for n in range(10)]
+
+
+def test_failed_downloads_are_skipped(server, downloader):
+    items = [
+        ('a', f'{server.url}/image/a'),
+        ('missing', f'{server.url}/missing'),
+        ('down', f'{server.url}/down'),
+        ('b', f'{server.url}/image/b'),
+    ]
+
+    results = dict(downloader.download_many(items))
+
+    assert results == {'a': b'image-a', 'b': b'image-b'}
+    # A 404 is final; a 503 is retried until the retries run out
+    assert server.hits['/missing'] == 1
+    assert server.hits['/down'] == 3
+
+
+def test_retries_after_a_503(server, downloader):
+    assert downloader.fetch(f'{server.url}/flaky/1') == b'recovered'
+    assert server.hits['/flaky/1'] == 2
+
+
+def test_input_is_read_lazily(server, downloader):
+    consumed = []
+
+    def items():
+        for n in range(100):
+            consumed.append(n)
+            yield n, f'{server.url}/image/{n}'
+
+    results = downloader.download_many(items())
+    assert next(results) == (0, b'image-0')
+    # Only the in-flight window has been read ahead
+    assert len(consumed) <= 2 * downloader.max_workers + 1
+    assert len(list(results)) == 99
@@ -0,0 +1,139 @@
+import numpy as np
+
+from src.CMS.face_recognition.models.encoding_table import EncodingTable
+
+
+def vector(value, dim=4):
+    return np.full(dim, value, dtype=np.float32)
+
+
+def small_table(**kwargs):
+    return EncodingTable(dim=4, **kwargs)
+
+
+def test_rows_get_stable_ids():
+    table = small_table()
+    ids = [table.add(vector(i), f'p{i % 2}', f's{i}') for i in range(4)]
+
+    assert ids == [0, 1, 2, 3]
+    assert len(table) == 4
+    assert 's2' in table
+    assert table.row_id_of('s2') == 2
+    assert table.source_of(2) == 's2'
+
+
+def test_replacing_a_source_tombstones_the_old_row():
+    table = small_table(max_tombstone_ratio=1.0)
+    table.add(vector(1), 'alice', 'a.jpg')
+    table.add(vector(2), 'bob', 'b.jpg')
+
+    new_id = table.add(vector(3), 'alice', 'a.jpg')
+
+    assert new_id == 2
+    assert len(table) == 2
+    assert table.tombstone_ratio == 1 / 3
+    assert table.row_id_of('a.jpg') == 2
+    assert table.source_of(0) is None
+    encodings, names, sources, row_ids = table.live_rows()
+    assert sources == ['b.jpg', 'a.jpg']
+    assert row_ids == [1, 2]
+    assert np.array_equal(encodings[1], vector(3))
+
+
+def test_remove_source():
+    table = small_table(max_tombstone_ratio=1.0)
+    table.add(vector(1), 'alice', 'a.jpg')
+
+    assert table.remove_source('a.jpg')
+    assert not table.remove_source('a.jpg')
+    assert 'a.jpg' not in table
+    assert len(table) == 0
+
+
+def test_remove_name_returns_its_sources():
+    table = small_table(max_tombstone_ratio=1.0)
+    table.add(vector(1), 'alice', 'a1.jpg')
+    table.add(vector(2), 'bob', 'b.jpg')
+    table.add(vector(3), 'alice', 'a2.jpg')
+    table.add(vector(4), 'alice', None)
+
+    assert sorted(table.remove_name('alice')) == ['a1.jpg', 'a2.jpg']
+    assert table.live_rows()[1] == ['bob']
+    assert table.remove_name('alice') == []
+
+
+def test_compact_keeps_row_ids():
+    table = small_table(max_tombstone_ratio=1.0)
+    for i in range(6):
+        table.add(vector(i), 'p', f's{i}')
+    table.remove_source('s1')
+    table.remove_source('s4')
+    before = table.live_rows()
+
+    table.compact()
+
+    after = table.live_rows()
+    assert table.tombstone_ratio == 0
+    assert after[3] == before[3] == [0, 2, 3, 5]
+    assert after[2] == before[2]
+    assert np.array_equal(after[0], before[0])
+    assert table.row_id_of('s5') == 5
+    # New rows continue after the highest id ever handed out
+    assert table.add(vector(9), 'p', 's9') == 6
+
+
+def test_compaction_runs_past_the_tombstone_ratio():
+    table = small_table(max_tombstone_ratio=0.25)
+    for i in range(8):
+        table.add(vector(i), 'p', f's{i}')
+
+    table.remove_source('s0')
+    table.remove_source('s1')
+    assert table.tombstone_ratio == 0.25
+
+    table.remove_source('s2')
+    assert table.tombstone_ratio == 0
+    assert len(table) == 5
+    assert table.live_rows()[3] == [3, 4, 5, 6, 7]
+
+
+def test_from_rows_keeps_saved_ids():
+    table = EncodingTable.from_rows(
+        [vector(1), vector(2)], ['alice', 'bob'], ['a.jpg', 'b.jpg'], [7, 3], dim=4
+    )
+
+    assert table.row_id_of('a.jpg') == 7
+    assert table.row_id_of('b.jpg') == 3
+    assert table.add(vector(3), 'carol', 'c.jpg') == 8
+
+
+def test_from_rows_with_duplicate_sources_keeps_the_last():
+    table = EncodingTable.from_rows(
+        [vector(1), vector(2), vector(3)],
+        ['alice', 'alice', 'bob'],
+        ['a.jpg', 'a.jpg', 'b.jpg'],
+        dim=4
+    )
+
+    assert len(table) == 2
+    assert table.row_id_of('a.jpg') == 1
+    encodings, names, sources, _ = table.live_rows()
+    assert sources == ['a.jpg', 'b.jpg']
+    assert np.array_equal(encodings[0], vector(2))
+
+
+def test_from_rows_without_sources_keeps_every_row():
+    # Legacy pickles recorded no sources, so rows cannot be told apart by source
+    table = EncodingTable.from_rows([vector(1), vector(1)], ['alice', 'alice'], [None, None], dim=4)
+
+    assert len(table) == 2
+    assert table.remove_unsourced() == 2
+    assert len(table) == 0
+
+
+def test_from_rows_assigns_ids_when_some_are_missing():
+    table = EncodingTable.from_rows(
+        [vector(1), vector(2)], ['alice', 'bob'], ['a.jpg', 'b.jpg'], [5, None], dim=4
+    )
+
+    assert table.live_rows()[3] == [0, 1]
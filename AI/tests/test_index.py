@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+import pytest
+
+from src.CMS.face_recognition.models.index import HNSWIndex, create_index, load_index
+
+
+def clustered_gallery(rows, identities, queries=200, seed=0):
+    """Face-like data: tight clusters of encodings per identity, probes near the cluster centres."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(identities, 128)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = rng.integers(0, identities, rows)
+    gallery = centers[labels] + rng.normal(scale=0.03, size=(rows, 128))
+    probes = centers[rng.integers(0, identities, queries)] + rng.normal(scale=0.03, size=(queries, 128))
+    return gallery.astype(np.float32), probes.astype(np.float32)
+
+
+def recall_and_latency(index, exact, probes):
+    """Recall@1 against the exact index, and the median seconds per query of each."""
+    found, truth, times, exact_times = [], [], [], []
+    for probe in probes:
+        started = time.perf_counter()
+        found.append(index.search(probe, k=1)[0][0])
+        times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        truth.append(exact.search(probe, k=1)[0][0])
+        exact_times.append(time.perf_counter() - started)
+    recall = float(np.mean(np.array(found) == np.array(truth)))
+    return recall, float(np.median(times)), float(np.median(exact_times))
+
+
+def test_flat_index_is_exact():
+    gallery, probes = clustered_gallery(500, 50, queries=20)
+    index = create_index('flat').build(gallery)
+
+    for probe in probes:
+        ids, distances = index.search(probe, k=3)
+        exact = np.linalg.norm(gallery - probe, axis=1)
+        assert list(ids) == list(np.argsort(exact)[:3])
+        assert np.allclose(distances, np.sort(exact)[:3], atol=1e-4)
+
+
+def test_ivf_recall_and_latency_against_flat():
+    gallery, probes = clustered_gallery(20000, 2000)
+    exact = create_index('flat').build(gallery)
+    index = create_index('ivf', nprobe=8).build(gallery)
+
+    recall, latency, exact_latency = recall_and_latency(index, exact, probes)
+
+    assert recall >= 0.95
+    # Scanning nprobe of ~sqrt(N) partitions beats one product over every row
+    assert latency < exact_latency
+
+
+def test_hnsw_recall_and_latency_against_flat():
+    gallery, probes = clustered_gallery(1000, 100)
+    exact = create_index('flat').build(gallery)
+    index = create_index('hnsw').build(gallery)
+
+    recall, latency, _ = recall_and_latency(index, exact, probes)
+
+    assert recall >= 0.95
+    # Pure-Python graph search does not beat a NumPy scan at sizes it can
+    # build (see HNSWIndex); this only guards against it getting much worse
+    assert latency < 0.005
+
+
+def test_hnsw_refuses_large_galleries():
+    gallery = np.zeros((HNSWIndex.max_rows + 1, 128), dtype=np.float32)
+    with pytest.raises(ValueError):
+        create_index('hnsw').build(gallery)
+
+
+@pytest.mark.parametrize('kind', ['flat', 'ivf', 'hnsw'])
+def test_saved_index_loads_only_for_its_gallery(tmp_path, kind):
+    gallery, probes = clustered_gallery(300, 30, queries=10)
+    index = create_index(kind).build(gallery)
+    index.save(tmp_path / 'index.npz')
+
+    loaded = load_index(tmp_path / 'index.npz', gallery)
+    assert loaded.kind == kind
+    for probe in probes:
+        assert list(loaded.search(probe, k=1)[0]) == list(index.search(probe, k=1)[0])
+
+    changed = gallery.copy()
+    changed[0] += 1.0
+    assert load_index(tmp_path / 'index.npz', changed) is None
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from src.CMS.face_recognition.jobs import ProcessLock, TrainingJob, TrainingJobManager
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_process_lock_is_exclusive(tmp_path):
+    first, second = ProcessLock(tmp_path / 'train.lock'), ProcessLock(tmp_path / 'train.lock')
+
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_queued_requests_share_a_job():
+    release = threading.Event()
+    manager = TrainingJobManager(lambda job: release.wait(5))
+
+    running, _ = manager.submit()
+    wait_until(lambda: running.state == TrainingJob.RUNNING)
+    queued, created = manager.submit()
+    again, created_again = manager.submit()
+    release.set()
+
+    assert created and not created_again
+    assert again is queued
+    wait_until(lambda: queued.finished)
+    assert queued.state == TrainingJob.SUCCEEDED
+
+
+def test_runs_take_turns_across_managers(tmp_path):
+    # Two managers on one lock file stand in for two server worker processes
+    started, release = threading.Event(), threading.Event()
+    lock_path = tmp_path / 'train.lock'
+
+    def run_first(job):
+        started.set()
+        release.wait(5)
+        return 'first'
+
+    first = TrainingJobManager(run_first, lock_path=lock_path, lock_poll=0.01)
+    second = TrainingJobManager(lambda job: 'second', lock_path=lock_path, lock_poll=0.01)
+
+    running, _ = first.submit()
+    assert started.wait(5)
+    waiting, _ = second.submit()
+    wait_until(lambda: waiting.stage == 'waiting')
+    assert waiting.state == TrainingJob.RUNNING
+
+    release.set()
+    wait_until(lambda: waiting.finished)
+    assert (running.result, waiting.result) == ('first', 'second')
+
+
+def test_waiting_job_can_be_cancelled(tmp_path):
+    holder = ProcessLock(tmp_path / 'train.lock')
+    assert holder.acquire()
+    manager = TrainingJobManager(lambda job: 'ran', lock_path=tmp_path / 'train.lock', lock_poll=0.01)
+
+    job, _ = manager.submit()
+    wait_until(lambda: job.stage == 'waiting')
+    manager.cancel(job.id)
+    wait_until(lambda: job.finished)
+    holder.release()
+
+    assert job.state == TrainingJob.CANCELLED
+    assert job.result is None
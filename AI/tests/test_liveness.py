@@ -0,0 +1,145 @@
+import pytest
+
+from src.CMS.face_recognition import liveness
+from src.CMS.face_recognition.liveness import (
+    BlinkState, InMemoryLivenessStore, KeyValueLivenessStore, LivenessStore
+)
+
+
+class FakeClock:
+    """Stands in for the time module in liveness, so tests control the clock."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeKeyValueClient:
+    """Dict-backed client with redis-py style get/set(ex=)/delete and expiry."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}
+        self.expiry = {}
+
+    def get(self, key):
+        if key in self.expiry and self.clock.time() >= self.expiry[key]:
+            self.delete(key)
+        value = self.data.get(key)
+        return value.encode('utf-8') if value is not None else None
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        if ex is not None:
+            self.expiry[key] = self.clock.time() + ex
+
+    def delete(self, key):
+        self.data.pop(key, None)
+        self.expiry.pop(key, None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(liveness, 'time', clock)
+    return clock
+
+
+def blinked(count):
+    return BlinkState(blink_counter=count, blink_started=True, last_ear=0.2)
+
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        LivenessStore()
+
+
+def test_sessions_are_kept_apart(clock):
+    store = InMemoryLivenessStore()
+    store.put('a', blinked(2))
+    store.put('b', blinked(1))
+
+    assert store.get('a').blink_counter == 2
+    assert store.get('b').blink_counter == 1
+    assert store.get('c').blink_counter == 0
+
+    store.delete('a')
+    assert store.get('a').blink_counter == 0
+    assert store.get('b').blink_counter == 1
+
+
+def test_get_returns_a_copy(clock):
+    store = InMemoryLivenessStore()
+    store.put('a', blinked(1))
+
+    state = store.get('a')
+    state.blink_counter = 5
+    assert store.get('a').blink_counter == 1
+
+
+def test_sessions_expire_after_the_ttl(clock):
+    store = InMemoryLivenessStore(ttl=30)
+    store.put('idle', blinked(1))
+    clock.advance(20)
+    store.put('active', blinked(2))
+
+    clock.advance(15)
+    assert store.get('idle').blink_counter == 0
+    assert store.get('active').blink_counter == 2
+    assert len(store) == 1
+
+    # Each update restarts the session's TTL
+    store.put('active', blinked(3))
+    clock.advance(25)
+    assert store.get('active').blink_counter == 3
+
+
+def test_least_recently_updated_session_is_evicted_at_capacity(clock):
+    store = InMemoryLivenessStore(max_sessions=2)
+    store.put('a', blinked(1))
+    clock.advance(1)
+    store.put('b', blinked(2))
+    clock.advance(1)
+    store.put('a', blinked(3))
+    clock.advance(1)
+    store.put('c', blinked(4))
+
+    assert len(store) == 2
+    assert store.get('b').blink_counter == 0
+    assert store.get('a').blink_counter == 3
+    assert store.get('c').blink_counter == 4
+
+
+def test_key_value_store_round_trips_state(clock):
+    client = FakeKeyValueClient(clock)
+    store = KeyValueLivenessStore(client, ttl=30, prefix='test:')
+
+    store.put('a', blinked(2))
+    store.put('b', blinked(1))
+
+    assert set(client.data) == {'test:a', 'test:b'}
+    state = store.get('a')
+    assert (state.blink_counter, state.blink_started, state.last_ear) == (2, True, 0.2)
+    assert store.get('b').blink_counter == 1
+
+    store.delete('a')
+    assert store.get('a').blink_counter == 0
+
+
+def test_key_value_store_expires_with_the_client(clock):
+    client = FakeKeyValueClient(clock)
+    store = KeyValueLivenessStore(client, ttl=30)
+    store.put('a', blinked(1))
+
+    clock.advance(20)
+    store.put('a', blinked(2))
+    clock.advance(20)
+    assert store.get('a').blink_counter == 2
+
+    clock.advance(11)
+    assert store.get('a').blink_counter == 0
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+# The trainer and recognizer load dlib models through face_recognition
+pytest.importorskip('cv2')
+pytest.importorskip('face_recognition')
+
+from src.CMS.face_recognition.models.encoding_table import EncodingTable
+from src.CMS.face_recognition.recognize import FaceRecognizer
+from src.CMS.face_recognition.train import FaceModelTrainer
+
+
+def use_models_dir(component, models_dir):
+    component.model_path = models_dir / 'face_encodings.bin'
+    component.legacy_model_path = models_dir / 'face_recognition_model.pkl'
+    component.index_path = models_dir / 'face_index.npz'
+    if hasattr(component, 'metadata_path'):
+        component.metadata_path = models_dir / 'model_metadata.json'
+    return component
+
+
+def add_people(trainer, people, per_person=4, seed=0):
+    rng = np.random.default_rng(seed)
+    for person in people:
+        center = rng.normal(size=128)
+        for i in range(per_person):
+            source = f'{person}/{i}.jpg'
+            trainer.table.add(center + rng.normal(scale=0.05, size=128), person, source)
+            trainer.metadata[source] = {'size': 1}
+
+
+def test_reload_after_save_uses_the_configured_index(tmp_path):
+    trainer = use_models_dir(FaceModelTrainer(index_type='ivf'), tmp_path)
+    trainer.table, trainer.metadata = EncodingTable(), {}
+    add_people(trainer, ['alice', 'bob'])
+    trainer.save_model()
+
+    recognizer = use_models_dir(FaceRecognizer(index_type='ivf', reload_interval=0), tmp_path)
+    assert recognizer.maybe_reload()
+    assert recognizer.index.kind == 'ivf'
+    assert len(recognizer.index) == 8
+
+    # Another worker retrains; this one picks the new model up in the background
+    add_people(trainer, ['carol'], seed=1)
+    trainer.save_model()
+    assert recognizer.maybe_reload()
+    with recognizer._reload_lock:
+        pass
+
+    assert recognizer.snapshot.version == 2
+    assert recognizer.index.kind == 'ivf'
+    assert len(recognizer.index) == 12
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+# pipeline opens cameras and video files through OpenCV
+pytest.importorskip('cv2')
+
+from src.CMS.face_recognition.pipeline import FramePipeline, SyntheticSource
+
+
+def frame_number(frame):
+    """SyntheticSource moves its square 5 px per frame; recover the frame number from it."""
+    return int(frame[frame.shape[0] // 2, :, 0].argmax()) // 5
+
+
+class RecordingSource(SyntheticSource):
+    """Synthetic frames that remember whether the pipeline released them."""
+
+    released = False
+
+    def release(self):
+        self.released = True
+
+
+def run(source, process, render=None, **kwargs):
+    rendered = []
+
+    def record(frame, result):
+        rendered.append(result)
+        return render(frame, result) if render else True
+
+    report = FramePipeline(source, process, record, **kwargs).run()
+    return rendered, report
+
+
+def test_frames_are_rendered_in_order():
+    source = RecordingSource(width=640, height=480, fps=200.0, frames=60)
+
+    rendered, report = run(source, frame_number)
+
+    assert rendered == sorted(rendered)
+    assert len(set(rendered)) == len(rendered)
+    assert report['frames_grabbed'] == 60
+    assert report['frames_rendered'] == len(rendered)
+    assert source.released
+
+
+def test_slow_inference_drops_frames_and_keeps_the_latest():
+    source = SyntheticSource(width=640, height=480, fps=None, frames=80)
+
+    def slow(frame):
+        time.sleep(0.02)
+        return frame_number(frame)
+
+    rendered, report = run(source, slow)
+
+    # The grabber never waits for inference, so most frames are replaced unseen
+    assert report['frames_dropped'] > 0
+    assert len(rendered) < 80
+    assert rendered == sorted(rendered)
+    # The newest frame is still processed once the source ends
+    assert rendered[-1] == 79
+
+
+def test_render_stops_the_pipeline_cleanly():
+    source = RecordingSource(width=640, height=480, fps=None, frames=None)
+    seen = []
+
+    def render(frame, result):
+        seen.append(result)
+        return len(seen) < 5
+
+    rendered, report = run(source, frame_number, render=render, workers=2)
+
+    assert len(rendered) == 5
+    assert source.released
+    assert not [thread for thread in threading.enumerate()
+                if thread.name.startswith(('frame-grabber', 'inference-worker'))]
+    assert set(report['stages']) >= {'grab', 'inference', 'render', 'latency'}
+
+
+def test_failed_frames_are_skipped():
+    source = SyntheticSource(width=640, height=480, fps=200.0, frames=30)
+
+    def flaky(frame):
+        number = frame_number(frame)
+        if number % 2:
+            raise ValueError('bad frame')
+        return number
+
+    rendered, _ = run(source, flaky)
+
+    assert rendered
+    assert all(number % 2 == 0 for number in rendered)
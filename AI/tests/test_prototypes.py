@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from src.CMS.face_recognition.models.gallery import FaceGallery
+from src.CMS.face_recognition.models.index import create_index
+from src.CMS.face_recognition.models.prototypes import compact_identities
+from src.CMS.face_recognition.models.snapshot import ModelSnapshot
+
+
+def clustered_gallery(identities=40, per_identity=8, spread=0.02, seed=0):
+    """Face-like gallery: identities ~1.4 apart, encodings ~0.25 from their identity's centre."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(identities, 128))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    encodings, names = [], []
+    for i, center in enumerate(centers):
+        encodings.append(center + rng.normal(scale=spread, size=(per_identity, 128)))
+        names.extend([f'person{i}'] * per_identity)
+    return np.vstack(encodings).astype(np.float32), names, centers, rng
+
+
+def test_centroid_radii_cover_every_encoding():
+    encodings, names, _, _ = clustered_gallery()
+    prototypes = compact_identities(encodings, names, method='centroid')
+
+    assert prototypes['names'] == list(dict.fromkeys(names))
+    labels = np.array(names)
+    for proto, name in zip(prototypes['encodings'], prototypes['names']):
+        members = encodings[labels == name]
+        assert np.allclose(proto, members.mean(axis=0), atol=1e-6)
+        distances = np.linalg.norm(members - proto, axis=1)
+        assert prototypes['radii'][name] == pytest.approx(distances.max(), rel=1e-5)
+
+
+def test_medoid_prototypes_are_encodings_and_radii_use_the_nearest_one():
+    encodings, names, _, _ = clustered_gallery(identities=10)
+    prototypes = compact_identities(encodings, names, method='medoid', k=3)
+
+    labels = np.array(names)
+    proto_labels = np.array(prototypes['names'])
+    for name in dict.fromkeys(names):
+        members = encodings[labels == name]
+        protos = prototypes['encodings'][proto_labels == name]
+        assert len(protos) == 3
+        # Medoids are actual encodings of the identity
+        assert all(np.isclose(members, proto, atol=1e-6).all(axis=1).any() for proto in protos)
+        nearest = np.linalg.norm(members[:, None] - protos[None], axis=2).min(axis=1)
+        assert prototypes['radii'][name] == pytest.approx(nearest.max(), rel=1e-5)
+
+
+def test_medoids_are_capped_by_identity_size():
+    encodings, names, _, _ = clustered_gallery(identities=2, per_identity=2)
+    prototypes = compact_identities(encodings, names, method='medoid', k=5)
+
+    assert len(prototypes['names']) == 4
+    assert prototypes['radii'] == {'person0': pytest.approx(0.0, abs=1e-3), 'person1': pytest.approx(0.0, abs=1e-3)}
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        compact_identities(np.zeros((1, 128)), ['a'], method='mean')
+
+
+@pytest.mark.parametrize('method', ['centroid', 'medoid'])
+def test_two_stage_matching_agrees_with_exact_search(method):
+    # FaceRecognizer loads its dlib models through OpenCV and face_recognition
+    pytest.importorskip('cv2')
+    pytest.importorskip('face_recognition')
+    from src.CMS.face_recognition.recognize import FaceRecognizer
+
+    encodings, names, centers, rng = clustered_gallery()
+    prototypes = compact_identities(encodings, names, method=method, k=3)
+    gallery = FaceGallery(encodings, names)
+    snapshot = ModelSnapshot(
+        gallery,
+        create_index('flat').build(gallery.encodings),
+        prototypes=FaceGallery(prototypes['encodings'], prototypes['names']),
+        prototype_radii=prototypes['radii']
+    )
+
+    # Only the matching state is needed, not the camera and dlib models
+    recognizer = FaceRecognizer.__new__(FaceRecognizer)
+    recognizer.tolerance = 0.6
+    recognizer.candidate_identities = 3
+
+    known = centers[rng.integers(0, len(centers), 100)] + rng.normal(scale=0.02, size=(100, 128))
+    for probe in known.astype(np.float32):
+        _, exact_name, exact_distance = gallery.nearest(probe)
+        name, distance = recognizer.match_face_two_stage(probe, snapshot)
+        assert exact_distance <= recognizer.tolerance
+        assert (name, distance) == (exact_name, pytest.approx(exact_distance, abs=1e-4))
+
+    # Faces of nobody in the gallery are rejected by the prototype radii bound
+    strangers = rng.normal(size=(20, 128))
+    strangers /= np.linalg.norm(strangers, axis=1, keepdims=True)
+    for probe in strangers.astype(np.float32):
+        name, distance = recognizer.match_face_two_stage(probe, snapshot)
+        assert name is None or distance > recognizer.tolerance
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from src.CMS.face_recognition.models.gallery import FaceGallery
+from src.CMS.face_recognition.models.index import gallery_fingerprint
+from src.CMS.face_recognition.models.prototypes import compact_identities
+from src.CMS.face_recognition.models.store import FORMAT_VERSION, HEADER, MAGIC, EncodingStore
+
+
+def sample_gallery(rows=12, seed=0):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(size=(rows, 128)).astype(np.float32)
+    names = [f'person{i % 3}' for i in range(rows)]
+    return encodings, names
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip(tmp_path, mmap):
+    encodings, names = sample_gallery()
+    rows = [{'source': f'img/{i}.jpg', 'row_id': i} for i in range(len(names))]
+    path = tmp_path / 'faces.bin'
+
+    fingerprint = EncodingStore.write(path, encodings, names, rows=rows)
+    store = EncodingStore.open(path, mmap=mmap)
+
+    assert isinstance(store.encodings, np.memmap) == mmap
+    assert len(store) == len(encodings)
+    assert np.array_equal(store.encodings, encodings)
+    assert np.allclose(store.sq_norms, (encodings ** 2).sum(axis=1), rtol=1e-5)
+    assert store.names == names
+    assert store.identities == ['person0', 'person1', 'person2']
+    assert store.rows == rows
+    assert store.prototypes is None
+    assert store.fingerprint == fingerprint == gallery_fingerprint(encodings)
+
+
+def test_sections_are_aligned(tmp_path):
+    encodings, names = sample_gallery(rows=5)
+    path = tmp_path / 'faces.bin'
+    EncodingStore.write(path, encodings, names)
+
+    store = EncodingStore.open(path)
+    assert all(section['offset'] % 64 == 0 for section in store._sections.values())
+
+
+def test_empty_gallery(tmp_path):
+    path = tmp_path / 'faces.bin'
+    EncodingStore.write(path, np.empty((0, 128), dtype=np.float32), [])
+
+    store = EncodingStore.open(path)
+    assert len(store) == 0
+    assert store.encodings.shape == (0, 128)
+    assert store.names == []
+    assert store.rows == []
+    assert len(FaceGallery.from_store(store)) == 0
+
+
+@pytest.mark.parametrize('method', ['centroid', 'medoid'])
+def test_prototypes_section(tmp_path, method):
+    encodings, names = sample_gallery()
+    prototypes = compact_identities(encodings, names, method=method, k=2)
+    path = tmp_path / 'faces.bin'
+    EncodingStore.write(path, encodings, names, prototypes=prototypes)
+
+    saved = EncodingStore.open(path).prototypes
+    assert saved['method'] == method
+    assert saved['names'] == prototypes['names']
+    assert np.array_equal(saved['encodings'], prototypes['encodings'])
+    assert saved['radii'] == pytest.approx(prototypes['radii'])
+
+
+def test_gallery_from_store_groups_rows_by_identity(tmp_path):
+    encodings, names = sample_gallery()
+    path = tmp_path / 'faces.bin'
+    EncodingStore.write(path, encodings, names)
+
+    gallery = FaceGallery.from_store(EncodingStore.open(path))
+    assert gallery.names == names
+    assert gallery.fingerprint == gallery_fingerprint(encodings)
+    for name, rows in gallery.rows_by_name.items():
+        assert [names[row] for row in rows] == [name] * len(rows)
+    assert sum(len(rows) for rows in gallery.rows_by_name.values()) == len(names)
+
+
+def test_rewrite_replaces_the_file(tmp_path):
+    path = tmp_path / 'faces.bin'
+    first, names = sample_gallery(seed=0)
+    second, _ = sample_gallery(seed=1)
+    EncodingStore.write(path, first, names)
+    old = EncodingStore.open(path)
+
+    EncodingStore.write(path, second, names)
+
+    # An existing mapping keeps the old data; new opens see the new file
+    assert np.array_equal(old.encodings, first)
+    assert np.array_equal(EncodingStore.open(path).encodings, second)
+    assert [p.name for p in tmp_path.iterdir()] == ['faces.bin']
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'faces.bin'
+    path.write_bytes(b'not a store' + b'\x00' * HEADER.size)
+
+    with pytest.raises(ValueError, match='not a face encoding store'):
+        EncodingStore.open(path)
+
+
+def test_rejects_newer_format_versions(tmp_path):
+    encodings, names = sample_gallery()
+    path = tmp_path / 'faces.bin'
+    EncodingStore.write(path, encodings, names)
+
+    data = bytearray(path.read_bytes())
+    _, _, reserved, offset, length = HEADER.unpack_from(data)
+    HEADER.pack_into(data, 0, MAGIC, FORMAT_VERSION + 1, reserved, offset, length)
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match=f'v{FORMAT_VERSION + 1}'):
+        EncodingStore.open(path)
+
+
+def test_stores_without_a_fingerprint(tmp_path):
+    # Stores written before the fingerprint was recorded have no info table
+    encodings, names = sample_gallery()
+    path = tmp_path / 'faces.bin'
+    EncodingStore.write(path, encodings, names)
+    store = EncodingStore.open(path)
+    del store._sections['info']
+    store._tables.clear()
+
+    assert store.fingerprint is None
+    assert store.names == names
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# The trainer loads dlib models through face_recognition
+pytest.importorskip('cv2')
+pytest.importorskip('face_recognition')
+
+from src.CMS.face_recognition.models.encoding_table import EncodingTable
+from src.CMS.face_recognition.train import FaceModelTrainer
+
+
+def fake_encoding(image_path):
+    """Files holding 'face <n>' encode to a vector seeded by n; anything else has no face."""
+    content = open(image_path).read().split()
+    if content[0] != 'face':
+        return None
+    return np.random.default_rng(int(content[1])).normal(size=128)
+
+
+@pytest.fixture
+def trainer(tmp_path):
+    trainer = FaceModelTrainer()
+    trainer.model_path = tmp_path / 'face_encodings.bin'
+    trainer.legacy_model_path = tmp_path / 'face_recognition_model.pkl'
+    trainer.metadata_path = tmp_path / 'model_metadata.json'
+    trainer.index_path = tmp_path / 'face_index.npz'
+    trainer.table, trainer.metadata = EncodingTable(), {}
+    trainer._preprocessor = SimpleNamespace(process_image=fake_encoding)
+    return trainer
+
+
+def write_image(data_dir, person, name, content):
+    person_dir = data_dir / person
+    person_dir.mkdir(parents=True, exist_ok=True)
+    image_path = person_dir / name
+    image_path.write_text(content)
+    return str(image_path)
+
+
+def test_modified_image_without_a_face_loses_its_encoding(trainer, tmp_path):
+    data_dir = tmp_path / 'faces'
+    kept = write_image(data_dir, 'alice', '1.jpg', 'face 1')
+    changed = write_image(data_dir, 'alice', '2.jpg', 'face 2')
+    trainer.train_model(data_dir)
+    assert list(trainer.known_face_names) == ['alice', 'alice']
+
+    write_image(data_dir, 'alice', '2.jpg', 'blurry photo')
+    trainer.train_model(data_dir)
+
+    assert changed not in trainer.table
+    assert kept in trainer.table
+    assert trainer.metadata[changed]['no_face']
+    assert list(trainer.known_face_names) == ['alice']
+
+
+def test_deleted_images_are_pruned(trainer, tmp_path):
+    data_dir = tmp_path / 'faces'
+    write_image(data_dir, 'alice', '1.jpg', 'face 1')
+    deleted = write_image(data_dir, 'bob', '1.jpg', 'face 2')
+    faceless = write_image(data_dir, 'bob', '2.jpg', 'no face')
+    # Sources outside the data directory, e.g. trained from downloads, stay
+    trainer.table.add(np.zeros(128), 'carol', 'user_images/carol')
+    trainer.metadata['user_images/carol'] = {'size': 1}
+    trainer.train_model(data_dir)
+
+    (data_dir / 'bob' / '1.jpg').unlink()
+    (data_dir / 'bob' / '2.jpg').unlink()
+    trainer.train_model(data_dir)
+
+    assert deleted not in trainer.metadata and faceless not in trainer.metadata
+    assert deleted not in trainer.table
+    assert sorted(trainer.known_face_names) == ['alice', 'carol']
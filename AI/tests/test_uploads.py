@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from src.CMS.face_recognition.uploads import LocalUploader, UploadManager, UploadTask
+
+JPEG = b'\xff\xd8\xff\xe0' + b'jpeg' * 16
+PNG = b'\x89PNG\r\n\x1a\n' + b'png' * 16
+
+
+def wait(task, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not task.finished:
+        assert time.monotonic() < deadline, f"upload still {task.state}"
+        time.sleep(0.01)
+    return task
+
+
+class FlakyUploader(LocalUploader):
+    """Fails the first upload with a disk error, then behaves."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.failures = 1
+
+    def upload(self, data, folder, public_id):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk busy")
+        return super().upload(data, folder, public_id)
+
+
+@pytest.fixture
+def completed():
+    return []
+
+
+def test_uploads_keep_their_format(tmp_path, completed):
+    manager = UploadManager(LocalUploader(tmp_path), backoff=0)
+
+    task = wait(manager.submit([JPEG, PNG], 'face_recognition/user',
+                               on_complete=lambda task, results: completed.append(results)))
+
+    assert task.state == UploadTask.SUCCEEDED
+    assert manager.get(task.id) is task
+    assert manager.pending == 0
+    files = sorted(path.suffix for path in (tmp_path / 'face_recognition' / 'user').iterdir())
+    assert files == ['.jpg', '.png']
+    assert [result['public_id'].split('/')[0] for result in completed[0]] == ['face_recognition'] * 2
+
+
+def test_transient_errors_are_retried(tmp_path):
+    uploader = FlakyUploader(tmp_path)
+    manager = UploadManager(uploader, backoff=0)
+
+    task = wait(manager.submit([JPEG], 'faces'))
+
+    assert task.state == UploadTask.SUCCEEDED
+    assert task.attempts == 2
+
+
+def test_rejected_images_are_not_retried(tmp_path, completed):
+    manager = UploadManager(LocalUploader(tmp_path), retries=3, backoff=0)
+
+    task = wait(manager.submit([b'not an image'], 'faces',
+                               on_complete=lambda task, results: completed.append(results)))
+
+    assert task.state == UploadTask.FAILED
+    assert task.attempts == 1
+    assert task.failed == [0]
+    assert completed == []
+
+
+def test_failed_completion_fails_the_task(tmp_path):
+    uploader = LocalUploader(tmp_path)
+    manager = UploadManager(uploader, backoff=0)
+
+    def on_complete(task, results):
+        for result in results:
+            uploader.destroy(result['public_id'])
+        raise ValueError('User not found')
+
+    task = wait(manager.submit([PNG], 'faces', on_complete=on_complete))
+
+    assert task.state == UploadTask.FAILED
+    assert task.error == 'User not found'
+    assert not any((tmp_path / 'faces').iterdir())
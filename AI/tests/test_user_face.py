@@ -0,0 +1,129 @@
+import mongomock
+import pytest
+from bson import ObjectId
+
+from src.models.user_face import UserFace
+
+
+@pytest.fixture
+def db():
+    db = UserFace(None, client=mongomock.MongoClient(), summary_ttl=60)
+    users = db.users_collection
+    find_one_and_update = users.find_one_and_update
+
+    def sliced_find_one_and_update(filter, update, projection=None, **kwargs):
+        # mongomock drops $slice projections on dotted paths such as
+        # 'faceData.faceImages', which add_face_image relies on; apply it here
+        document = find_one_and_update(filter, update, **kwargs)
+        if document is not None and projection and 'faceData.faceImages' in projection:
+            count = projection['faceData.faceImages']['$slice']
+            images = document.get('faceData', {}).get('faceImages', [])
+            document = {'_id': document['_id'], 'faceData': {'faceImages': images[:count]}}
+        return document
+
+    users.find_one_and_update = sliced_find_one_and_update
+    return db
+
+
+def add_user(db, images=0):
+    user_id = ObjectId()
+    user = {'_id': user_id, 'name': 'student'}
+    if images:
+        user['faceData'] = {'faceImages': [
+            {'url': f'https://img/{user_id}/{i}.jpg', 'cloudinary_public_id': f'{user_id}_{i}'}
+            for i in range(images)
+        ]}
+    db.users_collection.insert_one(user)
+    return user_id
+
+
+def counts(summary):
+    return summary['totalUsers'], summary['totalImages']
+
+
+def test_face_summary_counts_users_with_images(db):
+    add_user(db, images=2)
+    add_user(db, images=1)
+    add_user(db)
+
+    assert counts(db.get_face_summary()) == (2, 3)
+
+
+def test_face_summary_is_cached_until_the_ttl(db):
+    add_user(db, images=1)
+    assert counts(db.get_face_summary()) == (1, 1)
+
+    # Written behind the cache's back, e.g. by another process
+    add_user(db, images=2)
+    assert counts(db.get_face_summary()) == (1, 1)
+
+    db._summary_at -= db.summary_ttl + 1
+    assert counts(db.get_face_summary()) == (2, 3)
+
+
+def test_add_face_image_adjusts_cached_summary(db):
+    user_id = add_user(db)
+    assert counts(db.get_face_summary()) == (0, 0)
+
+    # The first image adds a user as well as an image
+    assert db.add_face_image(user_id, 'https://img/a.jpg', 'a') is not None
+    assert counts(db.get_face_summary()) == (1, 1)
+
+    assert db.add_face_image(user_id, 'https://img/b.jpg', 'b') is not None
+    assert counts(db.get_face_summary()) == (1, 2)
+
+    # The adjusted cache agrees with a recount
+    assert counts(db.get_face_summary(max_age=0)) == (1, 2)
+
+
+def test_add_face_image_for_missing_user(db):
+    assert counts(db.get_face_summary()) == (0, 0)
+
+    assert db.add_face_image(ObjectId(), 'https://img/a.jpg', 'a') is None
+    assert counts(db.get_face_summary()) == (0, 0)
+
+
+def test_invalidate_face_summary_forces_a_recount(db):
+    assert counts(db.get_face_summary()) == (0, 0)
+    add_user(db, images=3)
+
+    db.invalidate_face_summary()
+    assert counts(db.get_face_summary()) == (1, 3)
+
+
+def test_add_face_images_groups_per_user(db):
+    first, second = add_user(db), add_user(db, images=1)
+    missing = ObjectId()
+    db.get_face_summary()
+
+    result = db.add_face_images([
+        (first, 'https://img/1.jpg', '1'),
+        (second, 'https://img/2.jpg', '2'),
+        (first, 'https://img/3.jpg', '3'),
+        (missing, 'https://img/4.jpg', '4'),
+    ])
+
+    assert result['matchedUsers'] == [first, second]
+    assert result['missingUsers'] == [missing]
+    assert result['imagesAdded'] == 3
+    assert len(db.get_user_images(first)) == 2
+    # Bulk writes invalidate rather than adjust the cache
+    assert counts(db.get_face_summary()) == (2, 3 + 1)
+
+
+def test_add_face_images_reports_users_deleted_before_the_write(db):
+    kept, deleted = add_user(db), add_user(db)
+    # Cached as existing, then deleted by another process
+    assert db.existing_users([kept, deleted]) == {kept, deleted}
+    db.users_collection.delete_one({'_id': deleted})
+
+    result = db.add_face_images([
+        (kept, 'https://img/1.jpg', '1'),
+        (deleted, 'https://img/2.jpg', '2'),
+        (deleted, 'https://img/3.jpg', '3'),
+    ])
+
+    assert result['matchedUsers'] == [kept]
+    assert result['missingUsers'] == [deleted]
+    assert result['imagesAdded'] == 1
+    assert not db.verify_user_exists(deleted)